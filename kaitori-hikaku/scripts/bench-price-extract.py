@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Benchmark the single-pass price extractor against the old per-pattern loops.
+
+Pages come from the on-disk response cache (data/cache/http_cache.sqlite, filled
+by any fetcher run) or from a directory of saved .html files.  Each page is run
+through the legacy implementation and the pricefetch.extract engine; the
+results must agree and the timings are compared.
+
+Usage:
+  python scripts/bench-price-extract.py                    # pages from the cache
+  python scripts/bench-price-extract.py --pages saved/     # *.html (name says the source)
+  python scripts/bench-price-extract.py --repeat 20
+"""
+
+import re
+import sqlite3
+import sys
+import time
+import zlib
+from pathlib import Path
+
+from pricefetch.cache import DEFAULT_CACHE_PATH
+from pricefetch.extract import AMAZON_PRICE, LIST_PRICE, USED_MARKERS, YEN_AMOUNT
+
+# Fix Windows console encoding
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+
+
+# ============================================================
+# Legacy implementations (as shipped before pricefetch.extract)
+# ============================================================
+
+def legacy_list_price(text: str) -> int | None:
+    patterns = [
+        r'(?:定価|希望小売価格|メーカー希望小売価格|参考価格|税込価格)[：:\s]*[¥￥]?\s*([\d,]+)\s*円',
+        r'(?:定価|希望小売価格|メーカー希望小売価格|参考価格)[：:\s]*[¥￥]\s*([\d,]+)',
+        r'[¥￥]\s*([\d,]+)\s*[\(（]税込[\)）]',
+        r'([\d,]+)\s*円\s*[\(（]税込[\)）]',
+        r'価格[：:\s]*[¥￥]?\s*([\d,]+)\s*円',
+    ]
+    for pattern in patterns:
+        for match in re.findall(pattern, text):
+            digits = match.replace(",", "")
+            if digits and 1000 < int(digits) < 10000000:
+                return int(digits)
+    return None
+
+
+def legacy_amazon(html: str) -> list[int]:
+    patterns = [
+        r'a-price-whole["\s>]*([\d,]+)',
+        r'a-offscreen["\s>]*[¥￥]([\d,]+)',
+        r'a-color-price["\s>]*[¥￥]\s*([\d,]+)',
+    ]
+    candidates = []
+    for pattern in patterns:
+        for match in re.finditer(pattern, html):
+            digits = match.group(1).replace(",", "")
+            if not digits:
+                continue
+            price = int(digits)
+            if 1000 < price < 10000000:
+                context = html[max(0, match.start() - 200):min(len(html), match.end() + 200)]
+                if not any(indicator in context for indicator in USED_MARKERS):
+                    candidates.append(price)
+    return sorted(candidates)
+
+
+def legacy_yahoo(html: str) -> list[int]:
+    prices = []
+    for p in re.findall(r'([\d,]+)\s*円', html):
+        digits = p.replace(",", "")
+        if digits and 1000 < int(digits) < 10000000:
+            prices.append(int(digits))
+    return sorted(prices)
+
+
+def engine_list_price(text: str) -> int | None:
+    return LIST_PRICE.first(text)
+
+
+def engine_amazon(html: str) -> list[int]:
+    return sorted(c.price for c in AMAZON_PRICE.scan(html) if not c.near_marker)
+
+
+def engine_yahoo(html: str) -> list[int]:
+    return sorted(c.price for c in YEN_AMOUNT.scan(html))
+
+
+KINDS = {
+    "google": (legacy_list_price, engine_list_price),
+    "kakaku": (legacy_list_price, engine_list_price),
+    "amazon": (legacy_amazon, engine_amazon),
+    "yahoo": (legacy_yahoo, engine_yahoo),
+}
+
+
+def classify(name: str) -> str | None:
+    for kind in KINDS:
+        if kind in name:
+            return kind
+    return None
+
+
+def load_pages(pages_dir: Path | None) -> list[tuple[str, str]]:
+    """(kind, html) pairs from a directory or the response cache."""
+    pages = []
+    if pages_dir:
+        for path in sorted(pages_dir.glob("*.html")):
+            kind = classify(path.name)
+            if kind:
+                pages.append((kind, path.read_text(encoding="utf-8", errors="ignore")))
+        return pages
+    if not DEFAULT_CACHE_PATH.exists():
+        return pages
+    db = sqlite3.connect(str(DEFAULT_CACHE_PATH))
+    for url, body in db.execute("SELECT url, body FROM responses"):
+        kind = classify(url)
+        if kind:
+            pages.append((kind, zlib.decompress(body).decode("utf-8", errors="ignore")))
+    db.close()
+    return pages
+
+
+def time_calls(fn, pages: list[str], repeat: int) -> tuple[float, list]:
+    results = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [fn(html) for html in pages]
+    return (time.perf_counter() - start) / repeat, results
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark price extraction")
+    parser.add_argument("--pages", type=Path, help="Directory of saved *.html pages")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    if not pages:
+        print("ページがありません（先に取得スクリプトを実行してキャッシュを作成してください）")
+        return
+
+    print("========================================")
+    print("  価格抽出ベンチマーク")
+    print("========================================\n")
+    print(f"  {'source':<8}{'pages':>6}{'MB':>8}{'legacy ms':>12}{'engine ms':>12}{'speedup':>9}{'diff':>6}")
+
+    for kind, (legacy, engine) in KINDS.items():
+        htmls = [html for k, html in pages if k == kind]
+        if not htmls:
+            continue
+        size = sum(len(h.encode("utf-8")) for h in htmls) / 1e6
+        legacy_time, legacy_results = time_calls(legacy, htmls, args.repeat)
+        engine_time, engine_results = time_calls(engine, htmls, args.repeat)
+        mismatches = sum(1 for a, b in zip(legacy_results, engine_results) if a != b)
+        speedup = legacy_time / engine_time if engine_time else float("inf")
+        print(f"  {kind:<8}{len(htmls):>6}{size:>8.2f}{legacy_time * 1000:>12.1f}"
+              f"{engine_time * 1000:>12.1f}{speedup:>8.1f}x{mismatches:>6}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
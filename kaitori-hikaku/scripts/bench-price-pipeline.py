@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Benchmark a retail price fetcher end to end against a local replay server.
+
+Starts pricefetch.replay.ReplayServer on 127.0.0.1, then runs
+fetch-retail-prices-v2.py or fetch-retail-prices-bulk.py in a child process
+with PRICEFETCH_UPSTREAM pointing at it.  The child works in a temporary
+directory (its own products.json, found prices, store and logs), so real data
+is never touched.  Reported: JANs/s, per-source search latency percentiles
+from the fetcher's metrics report, CPU seconds and peak RSS of the child, and
+what the server answered.  Host rate limits and the bulk fetcher's fixed
+delays are lifted (the point is the pipeline, not politeness) unless --rate /
+--keep-delays say otherwise.
+
+Usage:
+  python scripts/bench-price-pipeline.py                            # v2, 200 JANs, 50ms latency
+  python scripts/bench-price-pipeline.py --fetcher bulk --products 50
+  python scripts/bench-price-pipeline.py -- --concurrency 32        # Arguments for the fetcher
+  python scripts/bench-price-pipeline.py --error-rate 0.05 --throttle-rate 0.05 --host-rps 20
+  python scripts/bench-price-pipeline.py --captured                 # Serve pages from the response cache
+  python scripts/bench-price-pipeline.py --json logs/bench.json --baseline logs/bench-main.json
+"""
+
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from pricefetch.cache import DEFAULT_CACHE_PATH
+from pricefetch.estimate import estimate_retail_from_buyback
+from pricefetch.httpclient import UPSTREAM_ENV
+from pricefetch.replay import ReplayConfig, ReplayServer, load_captured_pages
+
+try:
+    import resource  # not on Windows
+except ImportError:
+    resource = None
+
+# Fix Windows console encoding
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+
+SCRIPTS_DIR = Path(__file__).parent
+PRODUCTS_JSON = SCRIPTS_DIR.parent / "data" / "json" / "products.json"
+FETCHERS = {
+    "v2": SCRIPTS_DIR / "fetch-retail-prices-v2.py",
+    "bulk": SCRIPTS_DIR / "fetch-retail-prices-bulk.py",
+}
+
+
+def bench_products(count: int) -> list[dict]:
+    """`count` products with a JAN and buyback price, retail price cleared."""
+    products = []
+    if PRODUCTS_JSON.exists():
+        with open(PRODUCTS_JSON, "r", encoding="utf-8") as f:
+            products = [p for p in json.load(f) if p.get("jan_code") and p.get("buyback_price")]
+    if len(products) < count:
+        # Synthetic catalogue for trees without data
+        products += [
+            {"id": 900000 + i, "jan_code": f"49{i:011d}", "name": f"ベンチマーク商品 {i}",
+             "category": ("スマートフォン", "カメラ", "ゲーム機", "PC")[i % 4], "buyback_price": 5000 + 997 * i}
+            for i in range(count - len(products))
+        ]
+    return [{**p, "retail_price": None} for p in products[:count]]
+
+
+def run_fetcher(fetcher: str, fetcher_args: list[str], workdir: str, upstream: str,
+                rate: float, keep_delays: bool, results):
+    """Child process: run one fetcher's main() inside `workdir` and report usage."""
+    os.environ[UPSTREAM_ENV] = upstream  # before the module builds its HTTPClient
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    spec = importlib.util.spec_from_file_location(f"bench_{fetcher}", FETCHERS[fetcher])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module  # --workers pickles functions by module name
+    spec.loader.exec_module(module)
+
+    work = Path(workdir)
+    module.PRODUCTS_JSON = work / "products.json"
+    module.OUTPUT_FILE = work / "retail_prices_found.json"
+    module.LOG_DIR = work / "logs"
+    module.STORE_PATH = work / "price_store.sqlite"
+    if fetcher == "v2":
+        module.STATS_PATH = work / "source_stats.json"
+        module.HISTORY_JSON = work / "history.json"
+        module.DEFAULT_HISTORY_DIR = work / "history_store"
+        if rate > 0:
+            module.HOST_RATE_LIMITS = {host: (rate, 1) for host in module.HOST_RATE_LIMITS}
+        else:
+            module.HOST_RATE_LIMITS = {host: (1e6, 1000) for host in module.HOST_RATE_LIMITS}
+    else:
+        module.CACHE_PATH = work / "http_cache.sqlite"
+        if not keep_delays:
+            module.DELAY_BETWEEN_REQUESTS = 0
+            module.DELAY_BETWEEN_SOURCES = 0
+
+    sys.argv = [str(FETCHERS[fetcher]), *fetcher_args]
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    with open(work / "fetcher.log", "w", encoding="utf-8") as log:
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = log
+        try:
+            module.main()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+    elapsed = time.perf_counter() - started
+
+    usage = {"cpu": time.process_time() - cpu_started, "peak_rss_mb": None}
+    if resource is not None:
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)  # --workers processes
+        usage["cpu"] = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss: bytes on macOS, KB elsewhere
+        usage["peak_rss_mb"] = round(max(own.ru_maxrss, children.ru_maxrss) / scale, 1)
+
+    reports = sorted((work / "logs").glob("*.json"))
+    report = json.loads(reports[-1].read_text(encoding="utf-8")) if reports else {}
+    results.put({"elapsed": elapsed, **usage, "report": report})
+
+
+def latency_rows(report: dict) -> list[dict]:
+    return [row for row in report.get("stages", []) if row["stage"] in ("search", "ttfb")]
+
+
+def compare(result: dict, baseline: dict):
+    print(f"\n  ベースライン比較:")
+    for key, label, better in (("jans_per_second", "JANs/s", 1), ("cpu", "CPU秒", -1),
+                               ("peak_rss_mb", "ピークRSS(MB)", -1)):
+        old, new = baseline.get(key), result.get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        mark = "↑" if change * better > 0.02 else ("↓" if change * better < -0.02 else "=")
+        print(f"    {label:<14}{old:>10.2f} → {new:>10.2f}  ({change:+.1%}) {mark}")
+    old_rows = {(r["stage"], r["source"]): r for r in baseline.get("latency", [])}
+    for row in result["latency"]:
+        old = old_rows.get((row["stage"], row["source"]))
+        if old and old.get("p95"):
+            print(f"    {row['stage']}/{row['source']} p95 {old['p95'] * 1000:>8.1f} → {row['p95'] * 1000:>8.1f}ms"
+                  f"  ({(row['p95'] - old['p95']) / old['p95']:+.1%})")
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Offline retail price pipeline benchmark")
+    parser.add_argument("--fetcher", choices=sorted(FETCHERS), default="v2")
+    parser.add_argument("--products", type=int, default=200, help="JANs to fetch")
+    parser.add_argument("--latency", type=float, default=50, help="Mean server latency (ms)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Latency varies by ±jitter × mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of 503 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of 429 responses")
+    parser.add_argument("--captcha-rate", type=float, default=0.0, help="Share of robot-check pages")
+    parser.add_argument("--host-rps", type=float, default=0.0, help="Per-host rate above which the server sends 429")
+    parser.add_argument("--miss-rate", type=float, default=0.1, help="Share of JANs a source has no results for")
+    parser.add_argument("--page-kb", type=int, default=200, help="Synthetic page size")
+    parser.add_argument("--no-gzip", action="store_true", help="Serve uncompressed pages")
+    parser.add_argument("--captured", action="store_true", help="Serve pages from the response cache")
+    parser.add_argument("--pages", type=Path, help="Serve saved *.html pages (name says the source)")
+    parser.add_argument("--rate", type=float, default=0, help="v2 per-host rate limit (default: unlimited)")
+    parser.add_argument("--keep-delays", action="store_true", help="Keep the bulk fetcher's fixed delays")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="Write the result to this file")
+    parser.add_argument("--baseline", type=Path, help="Compare with an earlier --json result")
+    parser.add_argument("fetcher_args", nargs="*", help="Arguments after -- go to the fetcher")
+    args = parser.parse_args()
+
+    products = bench_products(args.products)
+    prices = {}
+    for product in products:
+        price = estimate_retail_from_buyback(product["buyback_price"], product.get("category", ""))
+        if price:
+            prices[product["jan_code"]] = price
+    captured = None
+    if args.captured or args.pages:
+        captured = load_captured_pages(None if args.pages else DEFAULT_CACHE_PATH, args.pages)
+        if not captured:
+            print("保存ページがありません（合成ページを使用します）")
+    config = ReplayConfig(latency_ms=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          throttle_rate=args.throttle_rate, captcha_rate=args.captcha_rate,
+                          host_rps=args.host_rps, miss_rate=args.miss_rate, page_kb=args.page_kb,
+                          gzip=not args.no_gzip, seed=args.seed)
+    fetcher_args = list(args.fetcher_args)
+    if args.fetcher == "v2" and "--cache-ttl" not in fetcher_args:
+        fetcher_args.append("--no-cache")  # every request should reach the server
+
+    print("========================================")
+    print("  定価取得パイプライン ベンチマーク")
+    print("========================================\n")
+    print(f"  取得スクリプト: {args.fetcher} {' '.join(fetcher_args)}")
+    print(f"  商品数: {len(products)}  遅延: {args.latency:g}ms ±{args.jitter:.0%}  "
+          f"503: {args.error_rate:.0%}  429: {args.throttle_rate:.0%}  captcha: {args.captcha_rate:.0%}")
+
+    with tempfile.TemporaryDirectory(prefix="pricefetch-bench-") as workdir:
+        with open(Path(workdir) / "products.json", "w", encoding="utf-8") as f:
+            json.dump(products, f, ensure_ascii=False)
+        with ReplayServer(prices, config, captured) as server:
+            results = multiprocessing.Queue()
+            child = multiprocessing.Process(target=run_fetcher, args=(
+                args.fetcher, fetcher_args, workdir, server.url, args.rate, args.keep_delays, results))
+            child.start()
+            child.join()
+            served = server.stats
+        if child.exitcode != 0:
+            log = (Path(workdir) / "fetcher.log").read_text(encoding="utf-8", errors="replace")
+            print(f"\n  取得スクリプトが異常終了しました (exit {child.exitcode})")
+            print("\n".join(log.splitlines()[-20:]))
+            sys.exit(1)
+        outcome = results.get()
+
+    report = outcome["report"]
+    result = {
+        "fetcher": args.fetcher,
+        "fetcher_args": fetcher_args,
+        "config": config.as_dict(),
+        "products": len(products),
+        "elapsed": round(outcome["elapsed"], 3),
+        "jans_per_second": round(len(products) / outcome["elapsed"], 3),
+        "cpu": round(outcome["cpu"], 3),
+        "peak_rss_mb": outcome["peak_rss_mb"],
+        "latency": latency_rows(report),
+        "server": {source: {str(status): n for status, n in counts.items()} for source, counts in served.items()},
+        "new_found": report.get("new_found"),
+    }
+
+    print(f"\n  所要時間: {result['elapsed']:.2f}秒  スループット: {result['jans_per_second']:.2f} JANs/s")
+    rss = f"{result['peak_rss_mb']:.1f}MB" if result["peak_rss_mb"] is not None else "(不明)"
+    print(f"  CPU: {result['cpu']:.2f}秒  ピークRSS: {rss}  取得件数: {result['new_found']}")
+    print(f"\n  {'stage/source':<30}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for row in result["latency"]:
+        print(f"  {row['stage'] + '/' + row['source']:<30}{row['count']:>7}{row['p50'] * 1000:>9.1f}"
+              f"{row['p95'] * 1000:>9.1f}{row['p99'] * 1000:>9.1f}{row['max'] * 1000:>9.1f}")
+    print(f"\n  サーバー応答:")
+    for source, counts in sorted(result["server"].items()):
+        print(f"    {source:<8} " + "  ".join(f"{status}: {n}" for status, n in sorted(counts.items())))
+
+    if args.baseline and args.baseline.exists():
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n  出力: {args.json}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Fit buyback/retail ratios for the estimate fallback from collected data.
+
+Reads products.json, history.json and retail_prices_found.json, updates
+data/ratio_calibration.json incrementally (only products whose inputs
+changed are recomputed) and prints the fitted table next to the hand-written
+one.  The fetchers pick the table up automatically on their next run.
+
+Usage:
+  python scripts/calibrate-ratios.py          # Incremental update
+  python scripts/calibrate-ratios.py --full   # Refit every product from scratch
+  python scripts/calibrate-ratios.py --brands # Also list per-brand ratios
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+from pricefetch.calibrate import DEFAULT_CALIBRATION_PATH, Calibration
+from pricefetch.estimate import category_ratio
+
+# Fix Windows console encoding
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+
+DATA_DIR = Path(__file__).parent.parent / "data" / "json"
+PRODUCTS_JSON = DATA_DIR / "products.json"
+HISTORY_JSON = DATA_DIR / "history.json"
+RETAIL_PRICES_JSON = DATA_DIR / "retail_prices_found.json"
+
+
+def load_json(path: Path, default):
+    if not path.exists():
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Calibrate buyback/retail ratios")
+    parser.add_argument("--full", action="store_true", help="Ignore cached per-product ratios")
+    parser.add_argument("--brands", action="store_true", help="List per-brand ratios")
+    args = parser.parse_args()
+
+    products = load_json(PRODUCTS_JSON, [])
+    history = load_json(HISTORY_JSON, {})
+    found_prices = load_json(RETAIL_PRICES_JSON, {})
+
+    calibration = Calibration(DEFAULT_CALIBRATION_PATH).load()
+    previous = calibration.version
+    started = time.perf_counter()
+    counts = calibration.update(products, history, found_prices, full=args.full)
+    elapsed = time.perf_counter() - started
+    calibration.save()
+
+    print("========================================")
+    print("  買取比率の較正")
+    print("========================================\n")
+    print(f"  再計算: 商品 {counts['changed']}件 / カテゴリ {counts['categories']}件 / ブランド {counts['brands']}件"
+          f" ({elapsed * 1000:.0f}ms)")
+    print(f"  バージョン: {previous or '(なし)'} → {calibration.version}\n")
+
+    print(f"  {'カテゴリ':<16}{'商品数':>6}{'実測':>8}{'採用':>8}{'固定':>8}")
+    for category, group in sorted(calibration.categories.items(), key=lambda item: -item[1]["n"]):
+        print(f"  {category:<16}{group['n']:>6}{group['fitted']:>8.3f}{group['ratio']:>8.3f}"
+              f"{category_ratio(category):>8.2f}")
+
+    if args.brands:
+        print(f"\n  {'カテゴリ / ブランド':<30}{'商品数':>6}{'実測':>8}{'採用':>8}")
+        for key, group in sorted(calibration.brands.items(), key=lambda item: -item[1]["n"]):
+            category, brand = key.split("\t", 1)
+            print(f"  {category + ' / ' + brand:<30}{group['n']:>6}{group['fitted']:>8.3f}{group['ratio']:>8.3f}")
+
+    print(f"\n  出力: {calibration.path}\n")
+
+
+if __name__ == "__main__":
+    main()
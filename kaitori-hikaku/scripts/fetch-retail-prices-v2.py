@@ -6,23 +6,54 @@ Improved version with:
   - Amazon scraping with validation
   - Price validation to reject bad data
   - Estimation from buyback ratios (fallback)
+  - Asyncio engine: many JANs in flight, one rate limiter per host
+  - Streaming parse: stops downloading once enough prices are found
+  - Adaptive source order per category from hit rates of earlier runs
+  - Consensus mode: all sources queried, outliers rejected, confidence saved
+  - Refresh mode: re-fetches the saved prices most likely to be stale
+  - Durable work queue: killed runs resume, failed JANs retry with backoff
+  - Resilience: classified errors, Retry-After backoff, per-host circuit breaker
+  - Source plugins (pricefetch.sources) shared with the bulk fetcher
+  - Batch mode: several JANs per OR-query, results split back per JAN
 
 Usage:
   python scripts/fetch-retail-prices-v2.py             # Full run
   python scripts/fetch-retail-prices-v2.py --test 10    # Test with 10 products
-  python scripts/fetch-retail-prices-v2.py --start 200  # Start from product #200
+  python scripts/fetch-retail-prices-v2.py --reset-queue  # Start the work queue over
+  python scripts/fetch-retail-prices-v2.py --concurrency 16  # More products in flight
+  python scripts/fetch-retail-prices-v2.py --offline --test 50  # Replay cached pages only
+  python scripts/fetch-retail-prices-v2.py --workers 4  # Shard by JAN across 4 processes
+  python scripts/fetch-retail-prices-v2.py --fixed-order  # Always Yahoo → Amazon → Google
+  python scripts/fetch-retail-prices-v2.py --sources yahoo,kakaku,google  # Other source plugins
+  python scripts/fetch-retail-prices-v2.py --batch 10  # Up to 10 JANs per Yahoo/Google OR-query
+  python scripts/fetch-retail-prices-v2.py --consensus  # Cross-check every source per JAN
+  python scripts/fetch-retail-prices-v2.py --refresh 1500  # Re-fetch stale prices, ~1500 requests
 """
 
+import asyncio
 import json
-import re
-import time
 import os
 import sys
-import ssl
-import urllib.parse
-import urllib.request
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from pricefetch.adaptive import DEFAULT_STATS_PATH, SourceScheduler
+from pricefetch.cache import DEFAULT_CACHE_PATH, ResponseCache
+from pricefetch.calibrate import load_calibration
+from pricefetch.consensus import consensus
+from pricefetch.estimate import estimate_retail_from_buyback, use_calibration, validate_price
+from pricefetch.history import DEFAULT_HISTORY_DIR, HistoryStore
+from pricefetch.httpclient import HTTPClient
+from pricefetch.journal import PriceJournal, shard_journal_path
+from pricefetch.metrics import Metrics
+from pricefetch.ratelimit import build_limiters
+from pricefetch.refresh import RefreshCandidate, category_volatility, plan_refresh, timestamp
+from pricefetch.resilience import CIRCUIT_OPEN, DEFERRING, ERROR_KINDS, NOT_CACHED, CircuitBreaker, FetchError
+from pricefetch.sources import REGISTRY, SourceRunner, get_sources, host_rate_limits, median_price, request_costs
+from pricefetch.store import DEFAULT_STORE_PATH, ProductStore
+from pricefetch.workqueue import WorkQueue
+
 # Fix Windows console encoding
 if sys.platform == "win32":
     sys.stdout.reconfigure(encoding='utf-8')
@@ -31,9 +62,26 @@ if sys.platform == "win32":
 # Configuration
 PRODUCTS_JSON = Path(__file__).parent.parent / "data" / "json" / "products.json"
 OUTPUT_FILE = Path(__file__).parent.parent / "data" / "json" / "retail_prices_found.json"
+HISTORY_JSON = Path(__file__).parent.parent / "data" / "json" / "history.json"
+STORE_PATH = DEFAULT_STORE_PATH  # SQLite index of products.json + found prices
+STATS_PATH = DEFAULT_STATS_PATH  # per-(source, category) hit rates for adaptive ordering
 LOG_DIR = Path(__file__).parent.parent / "logs"
-DELAY_BETWEEN_REQUESTS = 1.5  # seconds (rakuten limit: 1 req/sec)
 MAX_PRODUCTS = 2000
+CONCURRENCY = 8  # products in flight at once (per worker)
+WORKERS = 1  # processes; >1 shards the product list by JAN hash
+CACHE_TTL_HOURS = 24  # cached search pages younger than this skip the network
+BATCH_SIZE = 1  # JANs per OR-query for sources that accept several (1 = one JAN per request)
+SOURCE_ORDER = ("yahoo", "amazon", "google")  # default --sources, in fallback order
+
+# Per-host token buckets: (requests per second, burst), as each source plugin declares
+HOST_RATE_LIMITS = host_rate_limits(REGISTRY.values())
+
+# Shared keep-alive connection pool (certificate checks off for Windows compatibility)
+METRICS = Metrics()  # per-stage timings, written to LOG_DIR at the end of a run
+HTTP = HTTPClient(timeout=15, verify=False, metrics=METRICS)
+BREAKER = CircuitBreaker()  # per-host circuits; a tripped host's work moves to the other sources
+RUNNER = SourceRunner(HTTP, METRICS, BREAKER)  # retries, circuits and limiters for every source
+SOURCES = get_sources(SOURCE_ORDER)  # name -> PriceSource plugin; main() applies --sources
 
 # Load environment variables from .env
 def load_env():
@@ -55,236 +103,344 @@ def load_env():
             return True
     return False
 
-# User-Agent rotation
-USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0",
-]
-_agent_idx = 0
-
-def get_headers():
-    global _agent_idx
-    _agent_idx = (_agent_idx + 1) % len(USER_AGENTS)
-    return {
-        "User-Agent": USER_AGENTS[_agent_idx],
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Accept-Language": "ja,en;q=0.9",
-    }
-
 
 # ============================================================
-# Price Validation
+# Async fetch engine
 # ============================================================
 
-def validate_price(retail_price: int, buyback_price: int, category: str = "") -> bool:
-    """Validate that a retail price makes sense relative to buyback price."""
-    if not retail_price or retail_price <= 0:
-        return False
-    if not buyback_price or buyback_price <= 0:
-        return retail_price > 1000  # At least reasonable
-
-    # Buyback should never exceed retail price
-    if buyback_price > retail_price:
-        return False
+def log_source_error(log: list[str], label: str, error: FetchError):
+    if error.kind == CIRCUIT_OPEN:
+        log.append(f"  - {label}: 一時停止中（サーキットオープン）")
+    else:
+        log.append(f"  ! {label}: {error.kind} ({error.message})")
 
-    return_rate = buyback_price / retail_price
 
-    # Return rate > 95% = suspicious (buyback almost equals retail)
-    if return_rate > 0.95:
-        return False
+def deferring_error(errors: list[FetchError]) -> str | None:
+    """Kind of the first error that means a source was not really asked."""
+    return next((error.kind for error in errors if error.kind in DEFERRING), None)
 
-    # Return rate < 10% = suspicious (retail way too high)
-    if return_rate < 0.10:
-        return False
-
-    return True
-
-
-# ============================================================
-# Source 1: Yahoo! Shopping Search (Primary - No API key needed)
-# ============================================================
 
-def search_yahoo(jan_code: str, buyback_price: int) -> int | None:
-    """Search Yahoo! Shopping for retail price by JAN code."""
-    try:
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-
-        url = f"https://shopping.yahoo.co.jp/search?p={jan_code}"
-        req = urllib.request.Request(url, headers=get_headers())
-        with urllib.request.urlopen(req, timeout=15, context=ctx) as response:
-            html = response.read().decode("utf-8", errors="ignore")
-
-        # Extract prices from Yahoo Shopping results
-        prices = re.findall(r'([\d,]+)\s*円', html)
-        valid = []
-        for p in prices:
-            price = int(p.replace(",", ""))
-            if 1000 < price < 10000000:
-                valid.append(price)
-
-        if not valid:
-            return None
-
-        # Filter by validation
-        validated = [p for p in valid if validate_price(p, buyback_price)]
-        if not validated:
-            return None
-
-        # Return median price (most representative)
-        validated.sort()
-        return validated[len(validated) // 2]
-
-    except Exception as e:
-        print(f"    Yahoo error: {e}", file=sys.stderr)
+def estimate_fallback(product: dict, log: list[str]) -> int | None:
+    bp = product.get("buyback_price", 0) or 0
+    if bp <= 0:
         return None
+    price = estimate_retail_from_buyback(bp, product.get("category", ""), product.get("brand", ""))
+    if price:
+        log.append(f"  ~ 推定: {price:,}円 (買取比率から逆算)")
+    return price
+
+
+async def fetch_product(product: dict, limiters: dict, use_estimate: bool,
+                        scheduler: SourceScheduler | None = None) -> tuple[int | None, str, list[str], dict]:
+    """Try the network sources, then the estimate, for one product.
+
+    Without a scheduler the sources are tried in --sources order.  With one, the
+    sources are ordered (or skipped) per category by expected prices/second
+    and every attempt is recorded back into it.  Each source waits on its own
+    host limiter, so many products can be in flight at once while every host
+    still sees at most its configured rate.  Returns (price, source, log
+    lines, extra entry fields) so output stays grouped per product.
+    """
+    bp = product.get("buyback_price", 0) or 0
+    category = product.get("category", "")
+    log = []
+
+    price = None
+    source = ""
+
+    errors = []
+
+    order = scheduler.plan(category) if scheduler is not None else list(SOURCES)
+    for name in order:
+        plugin = SOURCES[name]
+        prices, requests, seconds, error = await RUNNER.lookup(plugin, product, limiters)
+        if error is not None:
+            # A blocked or failing host says nothing about the source's hit rate
+            errors.append(error)
+            log_source_error(log, plugin.label, error)
+            continue
+        price = median_price(prices)
+        if price and not validate_price(price, bp, category):
+            price = None
+        if scheduler is not None:
+            # Limiter waits are excluded; the scheduler adds them from the host rate
+            scheduler.record(name, category, bool(price), seconds, requests)
+        if price:
+            source = name
+            log.append(f"  ✓ {plugin.label}: {price:,}円")
+            break
+
+    if not price:
+        deferred = deferring_error(errors)
+        if deferred:
+            # Some source could not be asked: retry the JAN later instead of estimating
+            return None, "", log, {"error": deferred}
+
+    # Estimation (fallback)
+    if not price and use_estimate:
+        price = estimate_fallback(product, log)
+        if price:
+            source = "estimated"
+
+    return price, source, log, {}
+
+
+async def fetch_product_consensus(product: dict, limiters: dict, use_estimate: bool,
+                                  scheduler: SourceScheduler | None = None) -> tuple[int | None, str, list[str], dict]:
+    """Query every source at once and keep the price they agree on.
+
+    All sources the scheduler does not skip run concurrently (each still
+    behind its own host limiter), so a product costs one request per source
+    but no more wall time than the slowest one.  The candidates go through
+    consensus(); the entry records its confidence and the agreeing sources.
+    """
+    bp = product.get("buyback_price", 0) or 0
+    category = product.get("category", "")
+    log = []
+
+    order = scheduler.plan(category) if scheduler is not None else list(SOURCES)
+    results = await asyncio.gather(*(RUNNER.lookup(SOURCES[name], product, limiters) for name in order))
+
+    candidates = {}
+    errors = []
+    for name, (prices, requests, seconds, error) in zip(order, results):
+        if error is not None:
+            errors.append(error)
+            log_source_error(log, SOURCES[name].label, error)
+            continue
+        prices = [p for p in prices if validate_price(p, bp, category)]
+        if scheduler is not None:
+            scheduler.record(name, category, bool(prices), seconds, requests)
+        if prices:
+            candidates[name] = prices
+
+    result = consensus(candidates)
+    if result and validate_price(result.price, bp, category):
+        log.append(f"  ✓ 合意: {result.price:,}円 ({'+'.join(result.sources)}, "
+                   f"信頼度 {result.confidence:.2f}, 候補 {result.candidates}件 / 除外 {result.rejected}件)")
+        return result.price, result.source, log, {"confidence": result.confidence, "sources": result.sources}
+
+    deferred = deferring_error(errors)
+    if deferred:
+        return None, "", log, {"error": deferred}
+    price = estimate_fallback(product, log) if use_estimate else None
+    return price, "estimated" if price else "", log, {}
+
+
+async def fetch_all(products: list, journal: PriceJournal, store: ProductStore | None, stats: dict, args,
+                    rate_limits: dict | None = None, label: str = "",
+                    scheduler: SourceScheduler | None = None, refreshing: dict | None = None,
+                    workqueue: WorkQueue | None = None) -> int:
+    """Fetch prices for `products` concurrently; returns the number of new prices.
+
+    Worker processes pass store=None (the parent upserts merged results) and a
+    label that prefixes their progress lines.  With `refreshing` ({jan: saved
+    entry}, --refresh) a miss keeps the saved price and stamps checked_at, and
+    found prices are never replaced by an estimate.  With a work queue every
+    product is marked done or failed as soon as its result is known.
+    """
+    limiters = build_limiters(rate_limits or HOST_RATE_LIMITS)
+    total = len(products)
+    new_found = 0
+    pending = {}  # results not yet upserted into the store
+    fetch = fetch_product_consensus if args.consensus else fetch_product
+
+    async def run_one(product):
+        use_estimate = not args.no_estimate
+        if refreshing is not None:
+            use_estimate = use_estimate and refreshing[product["jan_code"]].get("source") == "estimated"
+        return await fetch(product, limiters, use_estimate, scheduler)
+
+    done = 0
+    # A batch can only fill with products that are in flight at the same time
+    concurrency = max(args.concurrency, args.batch)
+    async for product, (price, source, log, extra) in RUNNER.run(products, run_one, concurrency):
+        done += 1
+        jan = product.get("jan_code", "")
+        name = product.get("name", "")
+        bp = product.get("buyback_price", 0) or 0
+        previous = refreshing.get(jan) if refreshing is not None else None
 
+        lines = [
+            f"{label}[{done}/{total}] {name[:55]}",
+            f"  JAN: {jan}, 買取: {bp:,}円, カテゴリ: {product.get('category', '')}",
+            *log,
+        ]
 
-# ============================================================
-# Source 2: Amazon Search (with validation)
-# ============================================================
+        # Save result (appended to the journal immediately)
+        finished = False  # a fetched or kept price: the work queue is done with the JAN
+        if price and source:
+            finished = source != "estimated"
+            entry = {
+                "retail_price": price,
+                "source": source,
+                "product_name": name[:80],
+                "fetched_at": timestamp(),
+                **extra,
+            }
+            with METRICS.timer("save"):
+                journal.record(jan, entry)
+            pending[jan] = entry
+            new_found += 1
+            stats[source] = stats.get(source, 0) + 1
+            if "confidence" in extra:
+                stats["agreed"] = stats.get("agreed", 0) + 1
+                stats["confidence"] = stats.get("confidence", 0.0) + extra["confidence"]
+            if previous is not None and previous.get("retail_price") != price:
+                stats["changed"] = stats.get("changed", 0) + 1
+                lines.append(f"  ↻ 更新: {previous.get('retail_price', 0):,}円 → {price:,}円")
+        elif previous is not None and "error" not in extra:
+            # Nothing better found: keep the saved price, but do not pick it again tomorrow
+            entry = {**previous, "checked_at": timestamp()}
+            with METRICS.timer("save"):
+                journal.record(jan, entry)
+            pending[jan] = entry
+            finished = True
+            stats["kept"] = stats.get("kept", 0) + 1
+            lines.append(f"  = 前回の価格を維持: {previous.get('retail_price', 0):,}円")
+        elif "error" in extra:
+            stats["deferred"] = stats.get("deferred", 0) + 1
+            lines.append(f"  … 保留: {extra['error']}（後で再試行）")
+        else:
+            stats["failed"] += 1
+            lines.append(f"  ✗ 取得失敗")
+        if workqueue is not None:
+            # An estimate is retried later; a page missing from the offline cache was never asked
+            if extra.get("error") == NOT_CACHED:
+                workqueue.release(jan)
+            elif finished:
+                workqueue.done(jan)
+            else:
+                workqueue.fail(jan, extra.get("error", "estimated" if price else "no price"))
+        # One write per product keeps worker output from interleaving
+        print("\n".join(lines), flush=True)
 
-def search_amazon(jan_code: str, buyback_price: int) -> int | None:
-    """Search Amazon.co.jp for price with validation."""
-    try:
-        # Create SSL context that doesn't verify (for Windows compatibility)
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-
-        url = f"https://www.amazon.co.jp/s?k={jan_code}"
-        req = urllib.request.Request(url, headers=get_headers())
-        with urllib.request.urlopen(req, timeout=15, context=ctx) as response:
-            html = response.read().decode("utf-8", errors="ignore")
-
-        # Check for used/parts indicators - skip if found prominently
-        used_indicators = ["中古", "部品", "パーツ", "ジャンク", "訳あり", "難あり"]
-
-        # Amazon price patterns (prefer whole price display)
-        patterns = [
-            r'a-price-whole["\s>]*([\d,]+)',
-            r'a-offscreen["\s>]*[¥￥]([\d,]+)',
-            r'a-color-price["\s>]*[¥￥]\s*([\d,]+)',
-        ]
+        # Progress + store upsert (every 20 products)
+        if done % 20 == 0:
+            if store is not None:
+                with METRICS.timer("save"):
+                    store.upsert_retail_prices(pending)
+                pending.clear()
+            print(f"\n  💾 {label}記録済み ({len(journal)}件)\n", flush=True)
 
-        candidates = []
-        for pattern in patterns:
-            for match in re.finditer(pattern, html):
-                price = int(match.group(1).replace(",", ""))
-                if 1000 < price < 10000000:
-                    # Check surrounding context for used/parts indicators
-                    start = max(0, match.start() - 200)
-                    end = min(len(html), match.end() + 200)
-                    context = html[start:end]
-
-                    is_used = any(indicator in context for indicator in used_indicators)
-                    if not is_used:
-                        candidates.append(price)
-
-        if not candidates:
-            return None
-
-        # Filter candidates: must be reasonable relative to buyback price
-        valid_prices = []
-        for price in candidates:
-            if validate_price(price, buyback_price):
-                valid_prices.append(price)
-
-        if not valid_prices:
-            return None
-
-        # Return median price to avoid outliers
-        valid_prices.sort()
-        return valid_prices[len(valid_prices) // 2]
-
-    except Exception as e:
-        print(f"    Amazon error: {e}", file=sys.stderr)
-        return None
+    if store is not None:
+        with METRICS.timer("save"):
+            store.upsert_retail_prices(pending)
+    return new_found
 
 
 # ============================================================
-# Source 3: Google Search (with SSL fix)
+# Sharded multiprocess mode (--workers N)
 # ============================================================
 
-def search_google(jan_code: str, product_name: str, buyback_price: int) -> int | None:
-    """Search Google for retail price with SSL fix."""
+def shard_of(jan_code: str, workers: int) -> int:
+    """Stable shard index for a JAN (hash() is salted per process)."""
+    return zlib.crc32(jan_code.encode("utf-8")) % workers
+
+
+def run_shard(shard: int, workers: int, products: list, args, refreshing: dict | None = None) -> dict:
+    """Worker process entry point: fetch one shard into its own journal.
+
+    Each worker gets 1/workers of every host's rate so the combined request
+    rate stays at HOST_RATE_LIMITS.  Returns the worker's counts, source
+    statistics and metrics samples; the parent merges and saves them.
+    """
+    # Never reuse the parent's sockets, SQLite handle or samples after fork
+    global HTTP, METRICS, BREAKER, RUNNER, SOURCES
+    use_calibration(load_calibration())  # spawned workers start without it
+    METRICS = Metrics()
+    BREAKER = CircuitBreaker()
+    HTTP = HTTPClient(timeout=15, verify=False, metrics=METRICS)
+    RUNNER = SourceRunner(HTTP, METRICS, BREAKER, batch=args.batch)
+    SOURCES = get_sources(args.sources)
+    if not args.no_cache:
+        HTTP.cache = ResponseCache(DEFAULT_CACHE_PATH, ttl=args.cache_ttl * 3600, offline=args.offline)
+
+    rate_limits = {host: (rps / workers, burst) for host, (rps, burst) in HOST_RATE_LIMITS.items()}
+    journal = PriceJournal(OUTPUT_FILE, journal_path=shard_journal_path(OUTPUT_FILE, shard))
+    scheduler = None
+    if not args.fixed_order:
+        scheduler = SourceScheduler(list(SOURCES), rate_limits, STATS_PATH,
+                                    costs=request_costs(SOURCES.values())).load()
+    # Refresh runs bypass the queue; otherwise each worker marks its own JANs
+    workqueue = WorkQueue(STORE_PATH) if refreshing is None else None
+    stats = {**dict.fromkeys(SOURCES, 0), "estimated": 0, "failed": 0}
     try:
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
+        new_found = asyncio.run(fetch_all(products, journal, None, stats, args, rate_limits=rate_limits,
+                                          label=f"w{shard} ", scheduler=scheduler, refreshing=refreshing,
+                                          workqueue=workqueue))
+    finally:
+        journal.close()
+        if workqueue is not None:
+            workqueue.close()
+    HTTP.close()
+    return {
+        "new_found": new_found,
+        "stats": stats,
+        "sources": (scheduler.run, scheduler.skipped) if scheduler is not None else ({}, 0),
+        "metrics": METRICS.snapshot(),
+    }
 
-        query = urllib.parse.quote(f"{jan_code} 定価 メーカー希望小売価格")
-        url = f"https://www.google.com/search?q={query}&hl=ja"
 
-        req = urllib.request.Request(url, headers=get_headers())
-        with urllib.request.urlopen(req, timeout=20, context=ctx) as response:
-            html = response.read().decode("utf-8", errors="ignore")
+def fetch_sharded(products: list, journal: PriceJournal, store: ProductStore, stats: dict, args,
+                  scheduler: SourceScheduler | None = None, refreshing: dict | None = None) -> int:
+    """Split `products` by JAN hash, fetch the shards in a process pool and merge.
 
-        price = extract_price_from_text(html)
-        if price and validate_price(price, buyback_price):
-            return price
+    Shards are disjoint by JAN, so the per-worker journals never disagree and
+    merging them is a replay.  Returns the number of new prices.
+    """
+    shards = [[] for _ in range(args.workers)]
+    for product in products:
+        shards[shard_of(product["jan_code"], args.workers)].append(product)
 
-        # Fallback: search with product name
-        short_name = product_name[:40]
-        query2 = urllib.parse.quote(f"{short_name} 定価")
-        url2 = f"https://www.google.com/search?q={query2}&hl=ja"
+    new_found = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [
+            pool.submit(run_shard, i, args.workers, shard, args,
+                        None if refreshing is None else {p["jan_code"]: refreshing[p["jan_code"]] for p in shard})
+            for i, shard in enumerate(shards) if shard
+        ]
+        for future in futures:
+            result = future.result()
+            new_found += result["new_found"]
+            for key, value in result["stats"].items():
+                stats[key] = stats.get(key, 0) + value
+            if scheduler is not None:
+                scheduler.merge(*result["sources"])
+            METRICS.merge(result["metrics"])
 
-        req2 = urllib.request.Request(url2, headers=get_headers())
-        with urllib.request.urlopen(req2, timeout=20, context=ctx) as response:
-            html2 = response.read().decode("utf-8", errors="ignore")
+    with METRICS.timer("save"):
+        store.upsert_retail_prices(journal.merge_shards())
+    return new_found
 
-        price2 = extract_price_from_text(html2)
-        if price2 and validate_price(price2, buyback_price):
-            return price2
 
-        return None
-    except Exception as e:
-        print(f"    Google error: {e}", file=sys.stderr)
-        return None
+# ============================================================
+# Refresh mode (--refresh BUDGET)
+# ============================================================
 
+def plan_refresh_queue(store: ProductStore, found_prices: dict, budget: float,
+                       estimator: SourceScheduler) -> list[RefreshCandidate]:
+    """Saved prices worth re-fetching within `budget` expected requests.
 
-def extract_price_from_text(text: str) -> int | None:
-    """Extract a price value from Japanese text."""
-    patterns = [
-        r'(?:定価|希望小売価格|メーカー希望小売価格|参考価格|税込価格)[：:\s]*[¥￥]?\s*([\d,]+)\s*円',
-        r'(?:定価|希望小売価格|メーカー希望小売価格|参考価格)[：:\s]*[¥￥]\s*([\d,]+)',
-        r'[¥￥]\s*([\d,]+)\s*[\(（]税込[\)）]',
-        r'([\d,]+)\s*円\s*[\(（]税込[\)）]',
-        r'価格[：:\s]*[¥￥]?\s*([\d,]+)\s*円',
-    ]
+    Category volatility comes from the buyback history store, brought up to
+    date with history.json first (only new observations are appended).
+    """
+    history = HistoryStore(DEFAULT_HISTORY_DIR).load()
+    if HISTORY_JSON.exists():
+        with open(HISTORY_JSON, "r", encoding="utf-8") as f:
+            history.import_history_json(json.load(f))
+    products = store.products_with_jan()
+    volatility = category_volatility(history, {p["id"]: p.get("category", "") for p in products if "id" in p})
 
-    for pattern in patterns:
-        matches = re.findall(pattern, text)
-        for match in matches:
-            price = int(match.replace(",", ""))
-            if 1000 < price < 10000000:
-                return price
-    return None
+    costs = {}
 
+    def cost(product: dict) -> float:
+        category = product.get("category", "")
+        if category not in costs:
+            costs[category] = estimator.expected_requests(category)
+        return costs[category]
 
-# ============================================================
-# Source 4: Estimation from buyback price (last resort)
-# ============================================================
-
-def estimate_retail_from_buyback(buyback_price: int, category: str) -> int | None:
-    """Estimate retail price from buyback price using typical ratios."""
-    ratios = {
-        "PS5": 0.65, "Nintendo Switch": 0.60, "Xbox": 0.55,
-        "PC": 0.45, "PC周辺機器": 0.40,
-        "オーディオ": 0.45, "レコーダー/テレビ": 0.50,
-        "美容家電": 0.50, "調理家電": 0.50, "掃除機": 0.45,
-        "時計": 0.50, "シェーバー": 0.50,
-        "季節・空調家電": 0.45, "ゴルフ": 0.50,
-        "アウトドア": 0.45, "電動歯ブラシ": 0.50,
-        "その他家電": 0.45, "その他": 0.45,
-    }
-    if buyback_price <= 0:
-        return None
-    ratio = ratios.get(category, 0.45)
-    estimated = int(buyback_price / ratio)
-    return round(estimated / 100) * 100
+    return plan_refresh(products, found_prices, volatility, budget, cost=cost)
 
 
 # ============================================================
@@ -292,12 +448,32 @@ def estimate_retail_from_buyback(buyback_price: int, category: str) -> int | Non
 # ============================================================
 
 def main():
+    global SOURCES
     import argparse
     parser = argparse.ArgumentParser(description="Fetch retail prices v2")
     parser.add_argument("--test", type=int, default=0, help="Test with N products")
-    parser.add_argument("--start", type=int, default=0, help="Start from product #N")
     parser.add_argument("--no-estimate", action="store_true", help="Skip estimation fallback")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Products in flight at once (per worker)")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE,
+                        help="JANs per request for sources that accept OR-queries (Yahoo, Google)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Worker processes (shards by JAN hash)")
+    parser.add_argument("--cache-ttl", type=float, default=CACHE_TTL_HOURS, help="Serve cached pages younger than N hours")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the on-disk response cache")
+    parser.add_argument("--offline", action="store_true", help="Use cached pages only (no network)")
+    parser.add_argument("--prometheus", action="store_true", help="Also write logs/fetch-retail-prices-v2.prom")
+    parser.add_argument("--fixed-order", action="store_true", help="Always try the sources in --sources order (no adaptive ordering)")
+    parser.add_argument("--sources", type=lambda text: text.split(","), default=list(SOURCE_ORDER),
+                        help=f"Comma-separated price sources, default order first ({', '.join(REGISTRY)})")
+    parser.add_argument("--consensus", action="store_true", help="Query every source and keep the price they agree on")
+    parser.add_argument("--refresh", type=float, default=0, metavar="BUDGET",
+                        help="Re-fetch the stalest saved prices within BUDGET requests (instead of new products)")
+    parser.add_argument("--reset-queue", action="store_true", help="Forget queue progress and retry schedules")
     args = parser.parse_args()
+    try:
+        SOURCES = get_sources(args.sources)
+    except KeyError as e:
+        parser.error(e.args[0])
+    RUNNER.batch = args.batch
 
     print("========================================")
     print("  買取比較くん - 定価取得 v2")
@@ -305,125 +481,122 @@ def main():
 
     # Load env
     load_env()
-    print("  ✓ Yahoo!ショッピング検索: 有効（APIキー不要）")
-    print("  ✓ Amazon検索: 有効（バリデーション付き）")
-    print("  ✓ 推定値: 有効（買取価格から逆算）")
+    print(f"  ✓ 取得元: {' → '.join(source.label for source in SOURCES.values())}")
+    calibration = load_calibration()
+    use_calibration(calibration)
+    if calibration is not None:
+        print(f"  ✓ 推定値: 有効（較正済み比率 v{calibration.version}）")
+    else:
+        print("  ✓ 推定値: 有効（買取価格から逆算）")
 
     print()
 
-    # Load products
-    with open(PRODUCTS_JSON, "r", encoding="utf-8") as f:
-        products = json.load(f)
+    # Load products (indexed store; products.json is only parsed when it changed)
+    store = ProductStore(STORE_PATH)
+    if store.sync_products(PRODUCTS_JSON):
+        print(f"  products.json を取り込みました")
 
-    # Filter products without retail price
-    null_products = [p for p in products if p.get("retail_price") is None]
-    null_products.sort(key=lambda x: x.get("buyback_price", 0) or 0, reverse=True)
-
-    print(f"  対象商品数: {len(null_products)}")
-
-    # Apply start offset
-    if args.start > 0:
-        null_products = null_products[args.start:]
-        print(f"  開始位置: #{args.start}")
+    # Products without retail price, highest buyback price first
+    total_null = store.count_null_retail()
+    print(f"  対象商品数: {total_null}")
 
     # Apply test limit
     max_count = args.test if args.test > 0 else MAX_PRODUCTS
-    print(f"  処理件数: {min(len(null_products), max_count)}")
+    print(f"  同時実行数: {args.concurrency}")
+    if args.workers > 1:
+        print(f"  ワーカー数: {args.workers}（JANハッシュで分割）")
+    if args.batch > 1:
+        batching = [s.label for s in SOURCES.values() if RUNNER.batch_size(s) > 1]
+        print(f"  まとめて検索: 最大{args.batch}件/リクエスト ({', '.join(batching) or '対応ソースなし'})")
+    if args.consensus:
+        print(f"  合意モード: 全ソースを照会して価格を決定")
     print()
 
-    # Load previously found prices
-    found_prices = {}
-    if OUTPUT_FILE.exists():
-        with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-            found_prices = json.load(f)
+    # Load previously found prices (snapshot + journal of an interrupted run)
+    journal = PriceJournal(OUTPUT_FILE)
+    found_prices = journal.load()
+    if found_prices:
         print(f"  既存データ: {len(found_prices)}件")
+    if journal.replayed:
+        print(f"  前回中断分を復元: {journal.replayed}件")
+        journal.compact()
 
     # Ensure log directory exists
     LOG_DIR.mkdir(exist_ok=True)
 
+    # On-disk response cache (workers open their own)
+    if not args.no_cache and args.workers <= 1:
+        HTTP.cache = ResponseCache(DEFAULT_CACHE_PATH, ttl=args.cache_ttl * 3600, offline=args.offline)
+        mode = "オフライン（キャッシュのみ）" if args.offline else f"TTL {args.cache_ttl:g}時間"
+        print(f"  キャッシュ: {mode}")
+
     # Stats
-    stats = {"yahoo": 0, "amazon": 0, "google": 0, "estimated": 0, "failed": 0, "skipped": 0}
-    new_found = 0
+    stats = {**dict.fromkeys(SOURCES, 0), "estimated": 0, "failed": 0, "skipped": 0}
+
+    # Adaptive source ordering from earlier runs' hit rates
+    scheduler = None
+    if not args.fixed_order:
+        scheduler = SourceScheduler(list(SOURCES), HOST_RATE_LIMITS, STATS_PATH,
+                                    costs=request_costs(SOURCES.values())).load()
+
+    refreshing = None
+    workqueue = None
+    if args.refresh > 0:
+        # Stalest saved prices first, within tonight's request budget
+        estimator = scheduler or SourceScheduler(list(SOURCES), HOST_RATE_LIMITS, STATS_PATH,
+                                                 costs=request_costs(SOURCES.values())).load()
+        plan = plan_refresh_queue(store, found_prices, args.refresh, estimator)
+        if args.test > 0:
+            plan = plan[:args.test]
+        queue = [candidate.product for candidate in plan]
+        refreshing = {candidate.jan: candidate.entry for candidate in plan}
+        if plan:
+            print(f"  再取得: {len(plan)}件 (想定 {sum(c.cost for c in plan):.0f}リクエスト / 予算 {args.refresh:g}, "
+                  f"平均 {sum(c.age_days for c in plan) / len(plan):.0f}日経過)")
+    else:
+        # Durable work queue: a killed run resumes where it stopped, failed JANs back off
+        workqueue = WorkQueue(STORE_PATH)
+        if args.reset_queue:
+            workqueue.reset()
+        recovered = workqueue.recover()
+        if recovered:
+            print(f"  前回中断分を再開: {recovered}件")
+
+        # Skip products without JAN or already found
+        by_jan = {}
+        for product in store.null_retail_products():
+            jan = product.get("jan_code", "")
+            if not jan or jan in found_prices:
+                stats["skipped"] += 1
+                continue
+            by_jan.setdefault(jan, product)
+        added = workqueue.enqueue(list(by_jan))
+        queue = [by_jan[jan] for jan in workqueue.claim(limit=max_count)]
+        counts = workqueue.counts()
+        print(f"  キュー: 新規・再投入 {added}件 / 未処理 {counts['pending'] + counts['in_flight']}件 / "
+              f"完了 {counts['done']}件 / 再試行待ち {workqueue.waiting_retry()}件")
+    print(f"  処理件数: {len(queue)}")
 
     print("\n--- 処理開始 ---\n")
 
-    for i, product in enumerate(null_products[:max_count]):
-        jan = product.get("jan_code", "")
-        if not jan:
-            stats["skipped"] += 1
-            continue
-
-        # Skip already found
-        if jan in found_prices:
-            stats["skipped"] += 1
-            continue
-
-        name = product.get("name", "")
-        bp = product.get("buyback_price", 0) or 0
-        category = product.get("category", "")
-
-        print(f"[{i+1}/{min(len(null_products), max_count)}] {name[:55]}")
-        print(f"  JAN: {jan}, 買取: {bp:,}円, カテゴリ: {category}")
-
-        price = None
-        source = ""
-
-        # 1. Yahoo! Shopping (primary)
-        price = search_yahoo(jan, bp)
-        if price and validate_price(price, bp, category):
-            source = "yahoo"
-            print(f"  ✓ Yahoo: {price:,}円")
-        else:
-            price = None
-        time.sleep(DELAY_BETWEEN_REQUESTS)
-
-        # 2. Amazon (with validation)
-        if not price:
-            price = search_amazon(jan, bp)
-            if price and validate_price(price, bp, category):
-                source = "amazon"
-                print(f"  ✓ Amazon: {price:,}円")
-            else:
-                price = None
-            time.sleep(DELAY_BETWEEN_REQUESTS)
-
-        # 3. Google (with SSL fix)
-        if not price:
-            price = search_google(jan, name, bp)
-            if price:
-                source = "google"
-                print(f"  ✓ Google: {price:,}円")
-            time.sleep(DELAY_BETWEEN_REQUESTS)
-
-        # 4. Estimation (fallback)
-        if not price and not args.no_estimate and bp > 0:
-            price = estimate_retail_from_buyback(bp, category)
-            if price:
-                source = "estimated"
-                print(f"  ~ 推定: {price:,}円 (買取比率から逆算)")
-
-        # Save result
-        if price and source:
-            found_prices[jan] = {
-                "retail_price": price,
-                "source": source,
-                "product_name": name[:80],
-            }
-            new_found += 1
-            stats[source] = stats.get(source, 0) + 1
+    try:
+        if args.workers > 1:
+            new_found = fetch_sharded(queue, journal, store, stats, args, scheduler, refreshing)
         else:
-            stats["failed"] += 1
-            print(f"  ✗ 取得失敗")
-
-        # Periodic save (every 20 products)
-        if (i + 1) % 20 == 0:
-            with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-                json.dump(found_prices, f, ensure_ascii=False, indent=2)
-            print(f"\n  💾 保存完了 ({len(found_prices)}件)\n")
-
-    # Final save
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(found_prices, f, ensure_ascii=False, indent=2)
+            new_found = asyncio.run(fetch_all(queue, journal, store, stats, args, scheduler=scheduler,
+                                              refreshing=refreshing, workqueue=workqueue))
+    finally:
+        if workqueue is not None:
+            workqueue.close()
+        if scheduler is not None:
+            scheduler.save()
+        # Fold the journal back into retail_prices_found.json
+        with METRICS.timer("save"):
+            journal.compact()
+        store.close()
+    HTTP.close()
+    report_paths = METRICS.write_report(LOG_DIR, "fetch-retail-prices-v2", prometheus=args.prometheus,
+                                        workers=args.workers, new_found=new_found, results=stats)
 
     # Summary
     print("\n========================================")
@@ -434,11 +607,37 @@ def main():
     print(f"  スキップ: {stats['skipped']}件")
     print(f"  失敗: {stats['failed']}件")
     print(f"\n  ソース別:")
-    print(f"    Yahoo:  {stats['yahoo']}件")
-    print(f"    Amazon: {stats['amazon']}件")
-    print(f"    Google: {stats['google']}件")
+    for name, source in SOURCES.items():
+        print(f"    {source.label + ':':<8}{stats[name]}件")
     print(f"    推定:   {stats['estimated']}件")
+    if refreshing is not None:
+        print(f"\n  再取得: 価格変更 {stats.get('changed', 0)}件 / 維持 {stats.get('kept', 0)}件")
+    if stats.get("agreed"):
+        print(f"\n  合意: {stats['agreed']}件, 平均信頼度 {stats['confidence'] / stats['agreed']:.2f}")
+    if scheduler is not None:
+        print(f"\n  ソース別成功率（今回）:")
+        for name, attempts, successes, seconds in scheduler.summary():
+            print(f"    {name}: {successes}/{attempts}件 ({successes / attempts:.0%}), 平均 {seconds:.1f}秒")
+        if scheduler.skipped:
+            print(f"    低成功率のため省略: {scheduler.skipped}回")
+    if not args.no_cache:
+        hits, revalidated, misses = (METRICS.total(name) for name in
+                                     ("cache_hits", "cache_revalidated", "cache_misses"))
+        print(f"\n  キャッシュ: ヒット {hits:.0f}件 / 再検証 {revalidated:.0f}件 / 取得 {misses:.0f}件")
+    print(f"  ダウンロード: {METRICS.total('bytes_downloaded') / 1e6:.1f}MB")
+    batches = METRICS.total("batch_requests")
+    if batches:
+        print(f"  まとめて検索: {batches:.0f}リクエストで{METRICS.total('batched_lookups'):.0f}件 "
+              f"(平均 {METRICS.total('batched_lookups') / batches:.1f}件/リクエスト, "
+              f"個別に再検索 {METRICS.total('batch_fallbacks'):.0f}件)")
+    errors = {kind: METRICS.total(f"error_{kind}") for kind in ERROR_KINDS}
+    if any(errors.values()) or stats.get("deferred"):
+        print(f"\n  エラー: " + " / ".join(f"{kind} {count:.0f}件" for kind, count in errors.items() if count))
+        print(f"  保留（後で再試行）: {stats.get('deferred', 0)}件, "
+              f"停止中に省略したリクエスト: {METRICS.total('circuit_skipped'):.0f}件")
     print(f"\n  出力: {OUTPUT_FILE}")
+    for path in report_paths:
+        print(f"  計測レポート: {path}")
     print("========================================\n")
     print("次のステップ:")
     print("  npm run merge-prices")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Query buyback price history from the columnar history store.
+
+`import` appends the observations of data/json/history.json that are not in
+the store yet (run it after each export-json); the other commands read only
+the store.
+
+Usage:
+  python scripts/price-history.py import
+  python scripts/price-history.py latest 1804             # Latest price per shop
+  python scripts/price-history.py range 1804 --days 7     # Observations of the last 7 days
+  python scripts/price-history.py rolling 1804 --window 7 # Rolling min/max/median
+  python scripts/price-history.py best-shops              # Best shop per category
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+from pricefetch.history import DAY, DEFAULT_HISTORY_DIR, HistoryStore, format_time
+
+# Fix Windows console encoding
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+
+PRODUCTS_JSON = Path(__file__).parent.parent / "data" / "json" / "products.json"
+HISTORY_JSON = Path(__file__).parent.parent / "data" / "json" / "history.json"
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Buyback price history")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("import", help="Append new observations from history.json")
+    p.add_argument("--json", type=Path, default=HISTORY_JSON)
+    p = sub.add_parser("latest", help="Latest price per shop")
+    p.add_argument("product_id", type=int)
+    p = sub.add_parser("range", help="Observations in a time range")
+    p.add_argument("product_id", type=int)
+    p.add_argument("--days", type=float, default=7, help="Up to N days before the newest observation")
+    p.add_argument("--shop", help="Only this shop")
+    p = sub.add_parser("rolling", help="Rolling min/max/median")
+    p.add_argument("product_id", type=int)
+    p.add_argument("--window", type=float, default=7, help="Window in days")
+    p.add_argument("--shop", help="Only this shop")
+    sub.add_parser("best-shops", help="Shop with the best latest price, counted per category")
+    args = parser.parse_args()
+
+    store = HistoryStore(DEFAULT_HISTORY_DIR).load()
+
+    if args.command == "import":
+        with open(args.json, "r", encoding="utf-8") as f:
+            history = json.load(f)
+        started = time.perf_counter()
+        added = store.import_history_json(history)
+        print(f"  追加: {added}件 (合計 {len(store)}件, {(time.perf_counter() - started) * 1000:.0f}ms)")
+
+    elif args.command == "latest":
+        for shop, (price, ts) in sorted(store.latest(args.product_id).items(), key=lambda item: -item[1][0]):
+            print(f"  {shop:<16} {price:>10,}円  {format_time(ts)}")
+
+    elif args.command == "range":
+        points = store.range(args.product_id, shop=args.shop)
+        if points:
+            newest = points[-1][0]
+            for ts, shop, price in store.range(args.product_id, newest - int(args.days * DAY), newest + 1, args.shop):
+                print(f"  {format_time(ts)}  {shop:<16} {price:>10,}円")
+
+    elif args.command == "rolling":
+        for ts, low, high, median in store.rolling(args.product_id, int(args.window * DAY), args.shop):
+            print(f"  {format_time(ts)}  最小 {low:>10,}  最大 {high:>10,}  中央値 {median:>12,.0f}")
+
+    elif args.command == "best-shops":
+        with open(PRODUCTS_JSON, "r", encoding="utf-8") as f:
+            categories = {p["id"]: p.get("category", "") for p in json.load(f)}
+        wins: dict[str, dict[str, int]] = {}
+        for pid in store.products():
+            best = store.best_latest(pid)
+            if best:
+                counts = wins.setdefault(categories.get(pid, ""), {})
+                counts[best[0]] = counts.get(best[0], 0) + 1
+        for category, counts in sorted(wins.items(), key=lambda item: -sum(item[1].values())):
+            shop, count = max(counts.items(), key=lambda item: item[1])
+            print(f"  {category or '(なし)':<16} {shop:<16} {count}/{sum(counts.values())}商品")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Manage the SQLite product/price store used by the Python price fetchers.
+
+Usage:
+  python scripts/price-store.py import            # (Re)import products.json + retail_prices_found.json
+  python scripts/price-store.py stats             # Counts by category / source
+  python scripts/price-store.py export-products data/json/products.export.json
+  python scripts/price-store.py export-prices data/json/retail_prices_found.json
+"""
+
+import json
+import sys
+from pathlib import Path
+
+from pricefetch.store import DEFAULT_STORE_PATH, ProductStore
+
+# Fix Windows console encoding
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+
+PRODUCTS_JSON = Path(__file__).parent.parent / "data" / "json" / "products.json"
+RETAIL_PRICES_JSON = Path(__file__).parent.parent / "data" / "json" / "retail_prices_found.json"
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Product/price store maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("import", help="Import products.json and retail_prices_found.json")
+    sub.add_parser("stats", help="Show store statistics")
+    p = sub.add_parser("export-products", help="Write products in products.json format")
+    p.add_argument("output", type=Path)
+    p = sub.add_parser("export-prices", help="Write found prices in retail_prices_found.json format")
+    p.add_argument("output", type=Path)
+    args = parser.parse_args()
+
+    store = ProductStore(DEFAULT_STORE_PATH)
+
+    if args.command == "import":
+        parsed = store.sync_products(PRODUCTS_JSON)
+        print(f"  products.json: {'取り込み完了' if parsed else '変更なし'}")
+        if RETAIL_PRICES_JSON.exists():
+            with open(RETAIL_PRICES_JSON, "r", encoding="utf-8") as f:
+                store.upsert_retail_prices(json.load(f))
+            print(f"  retail_prices_found.json: 取り込み完了")
+
+    elif args.command == "stats":
+        store.sync_products(PRODUCTS_JSON)
+        total = store.db.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        print(f"  商品数: {total}")
+        print(f"  定価なし: {store.count_null_retail()}")
+        print(f"\n  カテゴリ別（定価なし）:")
+        rows = store.db.execute(
+            "SELECT category, COUNT(*) FROM products WHERE retail_price IS NULL "
+            "GROUP BY category ORDER BY COUNT(*) DESC")
+        for category, count in rows:
+            print(f"    {category or '(なし)'}: {count}")
+        print(f"\n  取得済み定価（ソース別）:")
+        for source, count in sorted(store.source_counts().items()):
+            print(f"    {source}: {count}")
+
+    elif args.command == "export-products":
+        store.export_products_json(args.output)
+        print(f"  出力: {args.output}")
+
+    elif args.command == "export-prices":
+        store.export_retail_prices_json(args.output)
+        print(f"  出力: {args.output}")
+
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
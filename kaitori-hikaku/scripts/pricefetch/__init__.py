@@ -0,0 +1,7 @@
+"""
+Shared building blocks for the kaitori-hikaku retail price fetchers.
+
+The fetch scripts live next to this package (scripts/fetch-retail-prices-*.py),
+so running them as `python scripts/<name>.py` puts this directory on sys.path
+and `import pricefetch` works without installing anything.
+"""
@@ -0,0 +1,173 @@
+"""
+Adaptive source ordering for the retail price fetchers.
+
+The fetchers used to try every source in a fixed order for every product,
+even in categories where one source almost never returns a price.
+SourceScheduler records, per (source, category), how often a source found a
+price and how long an attempt took.  The statistics persist between runs in
+data/source_stats.json.
+
+For each product the sources are ordered by expected prices per second:
+
+    p(source, category) / (mean latency + requests per attempt / host rate)
+
+Ordering by p/cost minimises the expected time to the first price.  The
+success rate is smoothed towards the source's rate over all categories, so a
+category with few attempts borrows from the others.  A source whose rate is
+below MIN_SUCCESS after MIN_ATTEMPTS tries is skipped, except for a small
+EXPLORE fraction of products, which keeps the statistics from freezing if a
+source starts working again.
+"""
+
+import json
+import random
+import time
+from pathlib import Path
+
+from .journal import write_json_atomic
+
+DEFAULT_STATS_PATH = Path(__file__).parent.parent.parent / "data" / "source_stats.json"
+
+PRIOR_WEIGHT = 5       # pseudo-attempts pulling a category towards the source's overall rate
+MIN_ATTEMPTS = 30      # attempts before a source may be skipped for a category
+MIN_SUCCESS = 0.03     # skip below this smoothed success rate
+EXPLORE = 0.05         # fraction of products that still try skipped sources
+MAX_ATTEMPTS = 2000    # older counts are scaled down past this so the rates can drift
+DEFAULT_LATENCY = 2.0  # seconds, before a source has been timed
+
+_FIELDS = ("attempts", "successes", "seconds", "requests")
+
+
+def _empty() -> dict:
+    return dict.fromkeys(_FIELDS, 0)
+
+
+def _add(into: dict, counts: dict):
+    for field in _FIELDS:
+        into[field] = into.get(field, 0) + counts.get(field, 0)
+
+
+class SourceScheduler:
+    """Per-(source, category) success and latency statistics."""
+
+    def __init__(self, sources: list[str], rate_limits: dict, path: Path = DEFAULT_STATS_PATH,
+                 explore: float = EXPLORE, costs: dict | None = None):
+        """
+        sources: source names in the fallback order used without statistics.
+        rate_limits: {source: (requests per second, burst)}, as HOST_RATE_LIMITS.
+        costs: {source: requests per attempt} assumed until a source has been
+            counted (PriceSource.cost); 1 when missing.
+        """
+        self.sources = list(sources)
+        self.rate_limits = rate_limits
+        self.costs = costs or {}
+        self.path = Path(path)
+        self.explore = explore
+        self.stats: dict[str, dict[str, dict]] = {}  # source -> category -> counts (all runs)
+        self.run: dict[str, dict[str, dict]] = {}    # counts recorded by this process only
+        self.skipped = 0
+
+    def load(self):
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.stats = json.load(f).get("stats", {})
+        return self
+
+    def save(self):
+        """Write the statistics, scaling down categories past MAX_ATTEMPTS."""
+        for categories in self.stats.values():
+            for counts in categories.values():
+                if counts["attempts"] > MAX_ATTEMPTS:
+                    scale = MAX_ATTEMPTS / counts["attempts"]
+                    for field in _FIELDS:
+                        counts[field] *= scale
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.path, {"updated_at": time.time(), "stats": self.stats})
+
+    def record(self, source: str, category: str, found: bool, seconds: float, requests: int = 1):
+        counts = {"attempts": 1, "successes": int(found), "seconds": seconds, "requests": requests}
+        _add(self.stats.setdefault(source, {}).setdefault(category, _empty()), counts)
+        _add(self.run.setdefault(source, {}).setdefault(category, _empty()), counts)
+
+    def merge(self, run: dict, skipped: int = 0):
+        """Add counts recorded by another process (a --workers shard)."""
+        self.skipped += skipped
+        for source, categories in run.items():
+            for category, counts in categories.items():
+                _add(self.stats.setdefault(source, {}).setdefault(category, _empty()), counts)
+                _add(self.run.setdefault(source, {}).setdefault(category, _empty()), counts)
+
+    def success_rate(self, source: str, category: str) -> tuple[float, float]:
+        """(smoothed success rate, attempts) for a source in a category."""
+        categories = self.stats.get(source, {})
+        overall = _empty()
+        for counts in categories.values():
+            _add(overall, counts)
+        prior = (overall["successes"] + 1) / (overall["attempts"] + 2)
+        counts = categories.get(category, _empty())
+        rate = (counts["successes"] + PRIOR_WEIGHT * prior) / (counts["attempts"] + PRIOR_WEIGHT)
+        return rate, counts["attempts"]
+
+    def cost(self, source: str, category: str) -> float:
+        """Expected seconds one attempt occupies, including the host rate limit."""
+        categories = self.stats.get(source, {})
+        counts = categories.get(category) or _empty()
+        if counts["attempts"] < 1:
+            counts = _empty()
+            for c in categories.values():
+                _add(counts, c)
+        if counts["attempts"] < 1:
+            return DEFAULT_LATENCY + self.costs.get(source, 1.0) / self.rate_limits[source][0]
+        latency = counts["seconds"] / counts["attempts"]
+        requests = counts["requests"] / counts["attempts"]
+        return latency + requests / self.rate_limits[source][0]
+
+    def plan(self, category: str) -> list[str]:
+        """Sources to try for one product, best expected prices/second first."""
+        exploring = random.random() < self.explore
+        ranked = []
+        for position, source in enumerate(self.sources):
+            rate, attempts = self.success_rate(source, category)
+            if not exploring and attempts >= MIN_ATTEMPTS and rate < MIN_SUCCESS:
+                self.skipped += 1
+                continue
+            ranked.append((-rate / self.cost(source, category), position, source))
+        ranked.sort()
+        return [source for _, _, source in ranked]
+
+    def expected_requests(self, category: str) -> float:
+        """Requests one product is expected to cost in a category.
+
+        Sources are tried in plan order (without exploration) until one finds
+        a price, so each source's requests are weighted by the chance that
+        every source before it missed.
+        """
+        ranked = []
+        for position, source in enumerate(self.sources):
+            rate, attempts = self.success_rate(source, category)
+            if attempts >= MIN_ATTEMPTS and rate < MIN_SUCCESS:
+                continue
+            ranked.append((-rate / self.cost(source, category), position, source, rate))
+        ranked.sort()
+        expected = 0.0
+        reach = 1.0
+        for _, _, source, rate in ranked:
+            counts = _empty()
+            for c in self.stats.get(source, {}).values():
+                _add(counts, c)
+            requests = counts["requests"] / counts["attempts"] if counts["attempts"] else self.costs.get(source, 1.0)
+            expected += reach * requests
+            reach *= 1 - rate
+        return expected
+
+    def summary(self) -> list[tuple[str, int, int, float]]:
+        """(source, attempts, successes, mean seconds) for this run."""
+        rows = []
+        for source in self.sources:
+            total = _empty()
+            for counts in self.run.get(source, {}).values():
+                _add(total, counts)
+            if total["attempts"]:
+                rows.append((source, total["attempts"], total["successes"],
+                             total["seconds"] / total["attempts"]))
+        return rows
@@ -0,0 +1,167 @@
+"""
+Vectorised validation and estimation over the whole product catalog.
+
+estimate.validate_price / estimate_retail_from_buyback look at one product at
+a time.  CatalogArrays loads buyback prices, category ratios and candidate
+retail prices for every product into NumPy arrays, so re-checking all of
+retail_prices_found.json after a threshold change is a handful of array
+operations instead of a fetcher run:
+
+    catalog = CatalogArrays.load(products, found_prices)
+    result = check_catalog(catalog, min_rate=0.12)
+    result.flags[result.flags != 0]
+
+NumPy is optional for the rest of pricefetch; it is only imported here.
+"""
+
+from dataclasses import dataclass
+
+from .estimate import (
+    DEFAULT_RATIO, MAX_RETURN_RATE, MIN_RETURN_RATE, MIN_UNANCHORED_PRICE, category_ratio,
+)
+
+try:
+    import numpy as np
+except ImportError:  # optional
+    np = None
+
+# Bit flags in CheckResult.flags
+NO_PRICE = 1          # no candidate retail price
+BUYBACK_EXCEEDS = 2   # buyback price above the retail price
+RATE_HIGH = 4         # return rate above max_rate
+RATE_LOW = 8          # return rate below min_rate
+TOO_CHEAP = 16        # no buyback price and retail at most MIN_UNANCHORED_PRICE
+FAR_FROM_ESTIMATE = 32  # retail outside [1/spread, spread] x the ratio estimate
+
+FLAG_NAMES = {
+    NO_PRICE: "no_price",
+    BUYBACK_EXCEEDS: "buyback_exceeds",
+    RATE_HIGH: "rate_high",
+    RATE_LOW: "rate_low",
+    TOO_CHEAP: "too_cheap",
+    FAR_FROM_ESTIMATE: "far_from_estimate",
+}
+# Flags that make validate_price() reject a price
+INVALID = BUYBACK_EXCEEDS | RATE_HIGH | RATE_LOW | TOO_CHEAP
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("numpy is required for batch validation (pip install numpy)")
+
+
+@dataclass
+class CatalogArrays:
+    """Column arrays for every product that has a JAN code."""
+    jan: list            # str per row
+    category: list       # str per row
+    buyback: "np.ndarray"   # int64, 0 when unknown
+    ratio: "np.ndarray"     # float64 buyback/retail ratio for the category
+    retail: "np.ndarray"    # float64 candidate retail price, NaN when missing
+    source: list         # where the candidate came from ("" when missing)
+
+    @classmethod
+    def load(cls, products: list[dict], found_prices: dict | None = None,
+             ratios: dict | None = None) -> "CatalogArrays":
+        """Build arrays from products.json rows and retail_prices_found.json.
+
+        The candidate retail price is the found price when there is one,
+        otherwise the product's own retail_price.  `ratios` overrides the
+        category ratio table.
+        """
+        require_numpy()
+        found_prices = found_prices or {}
+        jan, category, buyback, retail, source = [], [], [], [], []
+        for product in products:
+            code = product.get("jan_code")
+            if not code:
+                continue
+            jan.append(code)
+            category.append(product.get("category", "") or "")
+            buyback.append(product.get("buyback_price", 0) or 0)
+            entry = found_prices.get(code)
+            if entry and entry.get("retail_price"):
+                retail.append(entry["retail_price"])
+                source.append(entry.get("source", ""))
+            elif product.get("retail_price"):
+                retail.append(product["retail_price"])
+                source.append("products.json")
+            else:
+                retail.append(np.nan)
+                source.append("")
+
+        # One ratio lookup per distinct category, then a gather
+        names = sorted(set(category))
+        lookup = {name: i for i, name in enumerate(names)}
+        table = np.array([(ratios or {}).get(name) or category_ratio(name) for name in names] or [DEFAULT_RATIO])
+        codes = np.fromiter((lookup[c] for c in category), dtype=np.int64, count=len(category))
+        return cls(
+            jan=jan,
+            category=category,
+            buyback=np.asarray(buyback, dtype=np.int64),
+            ratio=table[codes] if len(codes) else np.empty(0),
+            retail=np.asarray(retail, dtype=np.float64),
+            source=source,
+        )
+
+    def __len__(self) -> int:
+        return len(self.jan)
+
+
+@dataclass
+class CheckResult:
+    valid: "np.ndarray"       # bool, same rule as estimate.validate_price
+    return_rate: "np.ndarray"  # float64, NaN without retail or buyback
+    estimate: "np.ndarray"    # float64 ratio estimate, NaN without buyback
+    flags: "np.ndarray"       # int64 bitmask of the constants above
+
+    def count(self, flag: int) -> int:
+        return int(np.count_nonzero(self.flags & flag))
+
+    def rows(self, mask) -> "np.ndarray":
+        return np.flatnonzero(mask)
+
+
+def estimate_retail(buyback: "np.ndarray", ratio: "np.ndarray") -> "np.ndarray":
+    """Vectorised estimate_retail_from_buyback (NaN where buyback <= 0)."""
+    require_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        estimated = np.trunc(buyback / ratio)
+    # np.round rounds halves to even, like Python's round()
+    estimated = np.round(estimated / 100) * 100
+    return np.where(buyback > 0, estimated, np.nan)
+
+
+def check_catalog(catalog: CatalogArrays, min_rate: float = MIN_RETURN_RATE,
+                  max_rate: float = MAX_RETURN_RATE, spread: float = 2.0) -> CheckResult:
+    """Validate every candidate price and flag suspicious rows in one pass."""
+    require_numpy()
+    retail = catalog.retail
+    buyback = catalog.buyback
+    has_retail = ~np.isnan(retail) & (retail > 0)
+    has_buyback = buyback > 0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(has_retail & has_buyback, buyback / retail, np.nan)
+    estimate = estimate_retail(buyback, catalog.ratio)
+
+    anchored = has_retail & has_buyback
+    exceeds = anchored & (buyback > retail)
+    high = anchored & ~exceeds & (rate > max_rate)
+    low = anchored & (rate < min_rate)
+    cheap = has_retail & ~has_buyback & (retail <= MIN_UNANCHORED_PRICE)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        off = anchored & ((retail > estimate * spread) | (retail < estimate / spread))
+
+    flags = (np.where(~has_retail, NO_PRICE, 0)
+             | np.where(exceeds, BUYBACK_EXCEEDS, 0)
+             | np.where(high, RATE_HIGH, 0)
+             | np.where(low, RATE_LOW, 0)
+             | np.where(cheap, TOO_CHEAP, 0)
+             | np.where(off, FAR_FROM_ESTIMATE, 0)).astype(np.int64)
+    valid = has_retail & ((flags & INVALID) == 0)
+    return CheckResult(valid=valid, return_rate=rate, estimate=estimate, flags=flags)
+
+
+def flag_names(flags: int) -> list[str]:
+    return [name for bit, name in FLAG_NAMES.items() if flags & bit]
@@ -0,0 +1,152 @@
+"""
+On-disk HTTP response cache for the price fetchers.
+
+Responses are stored in a single SQLite file keyed by the SHA-256 of the URL,
+with zlib-compressed bodies.  Entries younger than the TTL are served without
+touching the network; older entries are revalidated with If-None-Match /
+If-Modified-Since when the host sent an ETag or Last-Modified.  The total body
+size is capped and the least recently used entries are evicted first.
+
+In offline mode every cached entry is served regardless of age and misses raise
+CacheMiss, so parser changes can be replayed against saved pages.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent.parent / "data" / "cache" / "http_cache.sqlite"
+DEFAULT_TTL = 24 * 3600  # seconds
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key           TEXT PRIMARY KEY,
+    url           TEXT NOT NULL,
+    status        INTEGER NOT NULL,
+    headers       TEXT NOT NULL,
+    body          BLOB NOT NULL,
+    size          INTEGER NOT NULL,
+    etag          TEXT,
+    last_modified TEXT,
+    fetched_at    REAL NOT NULL,
+    accessed_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at);
+"""
+
+
+class CacheMiss(Exception):
+    """Raised in offline mode when a URL has never been cached."""
+
+
+def cache_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+class CachedEntry:
+    def __init__(self, url, status, headers, body, etag, last_modified, fetched_at):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def validators(self) -> dict:
+        """Conditional request headers for revalidating this entry."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """Thread-safe SQLite response store with TTL and LRU size cap."""
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 max_bytes: int = DEFAULT_MAX_BYTES, offline: bool = False):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def is_fresh(self, entry: CachedEntry) -> bool:
+        return self.offline or entry.age() < self.ttl
+
+    def lookup(self, url: str) -> CachedEntry | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, headers, body, etag, last_modified, fetched_at "
+                "FROM responses WHERE key = ?", (cache_key(url),)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?",
+                             (time.time(), cache_key(url)))
+            self._db.commit()
+        status, headers, body, etag, last_modified, fetched_at = row
+        return CachedEntry(url, status, json.loads(headers), zlib.decompress(body),
+                           etag, last_modified, fetched_at)
+
+    def store(self, url: str, status: int, headers: dict, body: bytes):
+        """Save a 200 response (headers lower-cased, body already decoded)."""
+        packed = zlib.compress(body, 6)
+        now = time.time()
+        key = cache_key(url)
+        kept = {k: v for k, v in headers.items()
+                if k not in ("content-encoding", "content-length", "transfer-encoding", "set-cookie")}
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, status, json.dumps(kept, ensure_ascii=False), packed, len(packed),
+                 headers.get("etag"), headers.get("last-modified"), now, now))
+            self._total += len(packed) - (old[0] if old else 0)
+            self._evict()
+            self._db.commit()
+
+    def refresh(self, url: str, headers: dict):
+        """Mark an entry fresh again after a 304 Not Modified."""
+        with self._lock:
+            now = time.time()
+            self._db.execute(
+                "UPDATE responses SET fetched_at = ?, accessed_at = ?, "
+                "etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) "
+                "WHERE key = ?",
+                (now, now, headers.get("etag"), headers.get("last-modified"), cache_key(url)))
+            self._db.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until under max_bytes (lock held)."""
+        if self._total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if self._total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._total -= size
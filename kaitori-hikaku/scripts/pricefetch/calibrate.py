@@ -0,0 +1,228 @@
+"""
+Data-driven buyback/retail ratio calibration for the estimate fallback.
+
+estimate.CATEGORY_RATIOS is a hand-written guess, yet the estimate is the
+source of hundreds of saved prices.  Calibration fits the ratio from data we
+already have:
+
+  history.json              per-shop buyback observations per product
+  retail_prices_found.json  retail prices found by yahoo / amazon / google
+  products.json             category, brand, buyback and retail price
+
+Each product with a trusted retail price contributes one ratio: the median
+over scrape days of that day's best buyback price / retail price (one vote
+per product, however often it was scraped).  Per category and per
+(category, brand), the ratios are summarised with a MAD-trimmed median.
+Groups with few products are shrunk towards their parent (brand → category →
+the hand-written table).
+
+The fitted table is cached in data/ratio_calibration.json with a version
+stamp, together with each product's ratio and an input fingerprint.
+Recomputing only re-derives products whose inputs changed and refits only
+the groups those products belong to.
+"""
+
+import hashlib
+import json
+import statistics
+import time
+from pathlib import Path
+
+from .estimate import category_ratio
+from .journal import write_json_atomic
+
+DEFAULT_CALIBRATION_PATH = Path(__file__).parent.parent.parent / "data" / "ratio_calibration.json"
+
+FORMAT = 1
+TRUSTED_SOURCES = {"yahoo", "amazon", "google", "kakaku"}  # never "estimated": that would be circular
+MIN_RATIO, MAX_RATIO = 0.05, 0.98   # plausible single-product ratios
+CLAMP = (0.15, 0.95)                # fitted ratios stay inside this band
+TRIM_MADS = 3.0                     # drop ratios further than this many scaled MADs from the median
+PRIOR_WEIGHT = 8                    # pseudo-products pulling a small group towards its parent
+MIN_BRAND_PRODUCTS = 5              # brands with fewer products just use the category
+
+
+def robust_center(values: list[float]) -> tuple[float, int, float]:
+    """(MAD-trimmed median, values kept, MAD) of a non-empty list."""
+    median = statistics.median(values)
+    mad = statistics.median(abs(v - median) for v in values)
+    if mad > 0:
+        limit = TRIM_MADS * 1.4826 * mad
+        kept = [v for v in values if abs(v - median) <= limit]
+        median = statistics.median(kept)
+    else:
+        kept = values
+    return median, len(kept), mad
+
+
+def _shrink(fitted: float, n: int, parent: float) -> float:
+    ratio = (n * fitted + PRIOR_WEIGHT * parent) / (n + PRIOR_WEIGHT)
+    return round(min(max(ratio, CLAMP[0]), CLAMP[1]), 4)
+
+
+def trusted_retail(product: dict, found_prices: dict) -> int | None:
+    """Retail price that did not come from the estimator itself."""
+    entry = found_prices.get(product.get("jan_code") or "")
+    if entry is not None:
+        return entry.get("retail_price") if entry.get("source") in TRUSTED_SOURCES else None
+    return product.get("retail_price")
+
+
+def product_ratio(product: dict, retail: int, observations: list[dict]) -> float | None:
+    """Median over scrape days of (best buyback that day) / retail."""
+    if not retail or retail <= 0:
+        return None
+    best_by_day: dict[str, int] = {}
+    for obs in observations:
+        price = obs.get("price") or 0
+        day = (obs.get("scraped_at") or "")[:10]
+        if price > best_by_day.get(day, 0):
+            best_by_day[day] = price
+    buybacks = list(best_by_day.values()) or [product.get("buyback_price") or 0]
+    ratios = [b / retail for b in buybacks if b > 0 and MIN_RATIO <= b / retail <= MAX_RATIO]
+    return statistics.median(ratios) if ratios else None
+
+
+def fingerprint(product: dict, retail: int | None, observations: list[dict]) -> str:
+    latest = max((obs.get("scraped_at") or "" for obs in observations), default="")
+    raw = f"{retail}|{product.get('buyback_price')}|{product.get('category')}|{product.get('brand')}|{len(observations)}|{latest}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class Calibration:
+    """Fitted ratio table plus the per-product inputs it was built from."""
+
+    def __init__(self, path: Path = DEFAULT_CALIBRATION_PATH):
+        self.path = Path(path)
+        self.version = ""
+        self.built_at = 0.0
+        self.products: dict[str, dict] = {}    # product id -> {key, ratio, category, brand}
+        self.categories: dict[str, dict] = {}  # category -> {ratio, n, mad, fitted}
+        self.brands: dict[str, dict] = {}      # "category\tbrand" -> {ratio, n, mad, fitted}
+
+    # -- persistence ----------------------------------------------------
+
+    def load(self) -> "Calibration":
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") == FORMAT:
+                self.version = data.get("version", "")
+                self.built_at = data.get("built_at", 0.0)
+                self.products = data.get("products", {})
+                self.categories = data.get("categories", {})
+                self.brands = data.get("brands", {})
+        return self
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.path, {
+            "format": FORMAT,
+            "version": self.version,
+            "built_at": self.built_at,
+            "categories": self.categories,
+            "brands": self.brands,
+            "products": self.products,
+        })
+
+    # -- fitting --------------------------------------------------------
+
+    def update(self, products: list[dict], history: dict, found_prices: dict, full: bool = False) -> dict:
+        """Refit from the current data; returns counts of what was recomputed.
+
+        Only products whose fingerprint changed are re-derived, and only the
+        groups that contain a changed (or removed) product are refit, unless
+        `full` is set.
+        """
+        if full:
+            self.products = {}
+            self.categories = {}
+            self.brands = {}
+
+        dirty_categories: set[str] = set()
+        dirty_brands: set[str] = set()
+        seen = set()
+        changed = 0
+        for product in products:
+            pid = str(product.get("id"))
+            seen.add(pid)
+            observations = history.get(pid, [])
+            retail = trusted_retail(product, found_prices)
+            key = fingerprint(product, retail, observations)
+            cached = self.products.get(pid)
+            if cached is not None and cached["key"] == key:
+                continue
+            changed += 1
+            category = product.get("category", "") or ""
+            brand = product.get("brand", "") or ""
+            if cached is not None:
+                dirty_categories.add(cached["category"])
+                dirty_brands.add(f"{cached['category']}\t{cached['brand']}")
+            self.products[pid] = {"key": key, "ratio": product_ratio(product, retail, observations),
+                                  "category": category, "brand": brand}
+            dirty_categories.add(category)
+            dirty_brands.add(f"{category}\t{brand}")
+
+        for pid in [pid for pid in self.products if pid not in seen]:
+            removed = self.products.pop(pid)
+            dirty_categories.add(removed["category"])
+            dirty_brands.add(f"{removed['category']}\t{removed['brand']}")
+
+        if not (dirty_categories or dirty_brands) and self.version:
+            return {"changed": 0, "categories": 0, "brands": 0}
+
+        # Group the cached per-product ratios once
+        by_category: dict[str, list[float]] = {}
+        by_brand: dict[str, list[float]] = {}
+        for entry in self.products.values():
+            if entry["ratio"] is None:
+                continue
+            by_category.setdefault(entry["category"], []).append(entry["ratio"])
+            by_brand.setdefault(f"{entry['category']}\t{entry['brand']}", []).append(entry["ratio"])
+
+        for category in dirty_categories:
+            self._fit(self.categories, category, by_category.get(category), category_ratio(category))
+        # A refit category moves the parent of every brand in it
+        dirty_brands |= {key for key in by_brand if key.split("\t", 1)[0] in dirty_categories}
+        for key in dirty_brands:
+            values = by_brand.get(key)
+            if values is not None and len(values) < MIN_BRAND_PRODUCTS:
+                values = None
+            self._fit(self.brands, key, values, self.category_ratio(key.split("\t", 1)[0]))
+
+        self.built_at = time.time()
+        table = json.dumps([self.categories, self.brands], sort_keys=True, ensure_ascii=False)
+        self.version = f"{FORMAT}-{hashlib.sha1(table.encode('utf-8')).hexdigest()[:12]}"
+        return {"changed": changed, "categories": len(dirty_categories), "brands": len(dirty_brands)}
+
+    @staticmethod
+    def _fit(groups: dict, key: str, values: list[float] | None, parent: float):
+        if not values:
+            groups.pop(key, None)
+            return
+        fitted, n, mad = robust_center(values)
+        groups[key] = {"ratio": _shrink(fitted, n, parent), "n": n,
+                       "fitted": round(fitted, 4), "mad": round(mad, 4)}
+
+    # -- lookup ---------------------------------------------------------
+
+    def category_ratio(self, category: str) -> float:
+        group = self.categories.get(category)
+        return group["ratio"] if group else category_ratio(category)
+
+    def ratio(self, category: str, brand: str = "") -> float:
+        """Best ratio for a product: brand group, else category, else the static table."""
+        group = self.brands.get(f"{category}\t{brand}") if brand else None
+        if group:
+            return group["ratio"]
+        return self.category_ratio(category)
+
+    def ratio_table(self) -> dict[str, float]:
+        """{category: ratio}, e.g. for batch.CatalogArrays.load(ratios=...)."""
+        return {category: group["ratio"] for category, group in self.categories.items()}
+
+
+def load_calibration(path: Path = DEFAULT_CALIBRATION_PATH) -> Calibration | None:
+    """The cached fitted table, or None if calibrate-ratios.py has not run yet."""
+    calibration = Calibration(path).load()
+    return calibration if calibration.version else None
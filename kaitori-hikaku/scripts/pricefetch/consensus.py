@@ -0,0 +1,102 @@
+"""
+Cross-source price consensus.
+
+The fetchers used to keep whichever source answered first.  A Yahoo results
+page, though, also lists shipping fees, points and unrelated items, and one
+bad page decided the price.  consensus() instead takes every candidate from
+every source for a JAN and picks a price they agree on:
+
+  1. Each source gets a total weight equal to its reliability, split evenly
+     over its candidates, so fifteen prices from one page cannot outvote one
+     price from a better source.
+  2. Work in log space (a 10% gap means the same at 3,000円 and 300,000円).
+     Take the weighted median and the weighted MAD, and drop candidates more
+     than REJECT_MADS scaled MADs away (at least MIN_SPREAD).
+  3. The price is the weighted median of what is left, so it is always a
+     price that some source actually reported.
+
+The confidence is the share of the total weight within AGREE_TOLERANCE of
+the chosen price.  It is scaled down when only one source backs it.
+"""
+
+import math
+from dataclasses import dataclass, field
+
+# Prior reliability per source (0-1): how often its candidates are the real list price
+SOURCE_RELIABILITY = {
+    "amazon": 1.0,
+    "kakaku": 0.9,
+    "google": 0.8,   # 定価 snippets: right when present, sometimes old
+    "yahoo": 0.6,    # every 円 amount on the results page
+}
+DEFAULT_RELIABILITY = 0.5
+
+REJECT_MADS = 3.0
+MIN_SPREAD = 0.05        # log-space floor for the rejection band (~5%)
+AGREE_TOLERANCE = 0.05   # candidates within ±5% of the price count as agreeing
+SINGLE_SOURCE_FACTOR = 0.6
+
+
+@dataclass
+class Consensus:
+    price: int
+    confidence: float            # 0-1
+    source: str                  # heaviest source among the agreeing candidates
+    sources: list[str] = field(default_factory=list)  # every source that agrees
+    candidates: int = 0
+    rejected: int = 0
+
+
+def weighted_median(values: list[float], weights: list[float]) -> float:
+    pairs = sorted(zip(values, weights))
+    half = sum(weights) / 2
+    running = 0.0
+    for value, weight in pairs:
+        running += weight
+        if running >= half:
+            return value
+    return pairs[-1][0]
+
+
+def consensus(candidates: dict[str, list[int]], reliability: dict | None = None) -> Consensus | None:
+    """Pick a price from {source: [candidate prices]}; None without candidates."""
+    reliability = reliability or SOURCE_RELIABILITY
+    prices, logs, weights, owners = [], [], [], []
+    for source, source_prices in candidates.items():
+        source_prices = [p for p in source_prices if p and p > 0]
+        if not source_prices:
+            continue
+        weight = reliability.get(source, DEFAULT_RELIABILITY) / len(source_prices)
+        for price in source_prices:
+            prices.append(price)
+            logs.append(math.log(price))
+            weights.append(weight)
+            owners.append(source)
+    if not prices:
+        return None
+
+    center = weighted_median(logs, weights)
+    mad = weighted_median([abs(v - center) for v in logs], weights)
+    limit = max(REJECT_MADS * 1.4826 * mad, MIN_SPREAD)
+    kept = [i for i, v in enumerate(logs) if abs(v - center) <= limit]
+
+    chosen = weighted_median([logs[i] for i in kept], [weights[i] for i in kept])
+    price = prices[next(i for i in kept if logs[i] == chosen)]
+
+    tolerance = math.log(1 + AGREE_TOLERANCE)
+    agree_weight: dict[str, float] = {}
+    for i, v in enumerate(logs):
+        if abs(v - chosen) <= tolerance:
+            agree_weight[owners[i]] = agree_weight.get(owners[i], 0.0) + weights[i]
+    confidence = sum(agree_weight.values()) / sum(weights)
+    if len(agree_weight) < 2:
+        confidence *= SINGLE_SOURCE_FACTOR
+
+    return Consensus(
+        price=price,
+        confidence=round(confidence, 3),
+        source=max(agree_weight, key=agree_weight.get),
+        sources=sorted(agree_weight),
+        candidates=len(prices),
+        rejected=len(prices) - len(kept),
+    )
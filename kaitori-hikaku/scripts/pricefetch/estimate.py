@@ -0,0 +1,75 @@
+"""
+Retail price validation and the buyback-ratio estimate shared by the fetchers.
+
+Both fetchers used to carry their own copy of the category ratio table.  The
+scalar functions here serve the per-product fetch loop; batch.py applies the
+same rules to the whole catalog at once with NumPy.
+"""
+
+# Typical buyback / retail ratio by category (buyback is typically 30-70% of retail)
+CATEGORY_RATIOS = {
+    "PS5": 0.65,
+    "Nintendo Switch": 0.60,
+    "Xbox": 0.55,
+    "PC": 0.45,
+    "PC周辺機器": 0.40,
+    "オーディオ": 0.45,
+    "レコーダー/テレビ": 0.50,
+    "美容家電": 0.50,
+    "調理家電": 0.50,
+    "掃除機": 0.45,
+    "時計": 0.50,
+    "シェーバー": 0.50,
+    "季節・空調家電": 0.45,
+    "ゴルフ": 0.50,
+    "アウトドア": 0.45,
+    "電動歯ブラシ": 0.50,
+    "その他家電": 0.45,
+    "その他": 0.45,
+}
+DEFAULT_RATIO = 0.45
+
+MIN_RETURN_RATE = 0.10    # below: retail way too high
+MAX_RETURN_RATE = 0.95    # above: buyback almost equals retail
+MIN_UNANCHORED_PRICE = 1000  # without a buyback price, at least this much
+
+_calibration = None  # calibrate.Calibration installed by use_calibration()
+
+
+def validate_price(retail_price: int, buyback_price: int, category: str = "",
+                   min_rate: float = MIN_RETURN_RATE, max_rate: float = MAX_RETURN_RATE) -> bool:
+    """Validate that a retail price makes sense relative to buyback price."""
+    if not retail_price or retail_price <= 0:
+        return False
+    if not buyback_price or buyback_price <= 0:
+        return retail_price > MIN_UNANCHORED_PRICE  # At least reasonable
+
+    # Buyback should never exceed retail price
+    if buyback_price > retail_price:
+        return False
+
+    return_rate = buyback_price / retail_price
+    return min_rate <= return_rate <= max_rate
+
+
+def category_ratio(category: str) -> float:
+    return CATEGORY_RATIOS.get(category, DEFAULT_RATIO)
+
+
+def use_calibration(calibration):
+    """Estimate with a fitted calibrate.Calibration (None restores the static table)."""
+    global _calibration
+    _calibration = calibration
+
+
+def estimate_retail_from_buyback(buyback_price: int, category: str, brand: str = "") -> int | None:
+    """Estimate retail price from buyback price using typical ratios."""
+    if not buyback_price or buyback_price <= 0:
+        return None
+    if _calibration is not None:
+        ratio = _calibration.ratio(category, brand)
+    else:
+        ratio = category_ratio(category)
+    estimated = int(buyback_price / ratio)
+    # Round to nearest 100
+    return round(estimated / 100) * 100
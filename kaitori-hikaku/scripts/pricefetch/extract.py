@@ -0,0 +1,260 @@
+"""
+Single-pass price extraction for search result pages.
+
+The fetchers used to run each price regex over the whole page in turn and, for
+Amazon, slice ±200 characters around every match to look for used/junk words.
+Google pages are several hundred KB, so that meant five or more full scans.
+
+PriceExtractor instead locates *anchors* -- literals every pattern must
+contain, such as 円, ¥ or "a-price-whole" -- with str.find, which runs at C speed
+instead of stepping the regex engine through every character.  The full
+patterns only run in a small window around each anchor.  Marker words are
+matched with one compiled multi-keyword regex in a single pass over the merged
+candidate windows, and proximity is answered with a bisect over those offsets.
+"""
+
+import bisect
+import re
+import time
+from dataclasses import dataclass
+
+MIN_PRICE = 1000
+MAX_PRICE = 10000000
+
+# Marker words that mean a nearby price is for a used or broken item
+USED_MARKERS = ["中古", "部品", "パーツ", "ジャンク", "訳あり", "難あり"]
+
+
+@dataclass
+class PriceCandidate:
+    price: int
+    pattern: int       # index into the extractor's pattern list
+    start: int         # offsets of the whole pattern match
+    end: int
+    near_marker: bool  # a marker word lies within `window` chars of the match
+
+
+class PriceExtractor:
+    """Scan a document once and return every price candidate."""
+
+    def __init__(self, patterns: list[tuple[str, str | tuple[str, ...]]], markers: list[str] = (),
+                 window: int = 200, span: int = 48,
+                 min_price: int = MIN_PRICE, max_price: int = MAX_PRICE):
+        """
+        patterns: (regex, anchor) pairs in priority order.  The regex's first
+            group is the price; the anchor is a literal (or tuple of literals)
+            that occurs inside every match.
+        markers: words whose presence within `window` chars flags a candidate.
+        span: chars searched either side of an anchor for the full match.
+        """
+        self.patterns = [re.compile(regex) for regex, _ in patterns]
+        self.window = window
+        self.span = span
+        self.min_price = min_price
+        self.max_price = max_price
+
+        # anchor literal -> indices of the patterns that contain it
+        self._anchors: dict[str, list[int]] = {}
+        for i, (_, anchor) in enumerate(patterns):
+            for literal in ((anchor,) if isinstance(anchor, str) else anchor):
+                self._anchors.setdefault(literal, []).append(i)
+        self._markers = None
+        if markers:
+            self._markers = re.compile("|".join(re.escape(m) for m in sorted(markers, key=len, reverse=True)))
+
+    def scan(self, text: str) -> list[PriceCandidate]:
+        """All in-range candidates, ordered by offset."""
+        found = []
+        seen = set()
+        for literal, targets in self._anchors.items():
+            a_start = text.find(literal)
+            while a_start != -1:
+                a_end = a_start + len(literal)
+                for pattern_idx in targets:
+                    match = self._match_around(text, pattern_idx, a_start, a_end)
+                    if match is None or (pattern_idx, match.start()) in seen:
+                        continue
+                    seen.add((pattern_idx, match.start()))
+                    digits = match.group(1).replace(",", "")
+                    if digits and self.min_price < int(digits) < self.max_price:
+                        found.append((match.start(), pattern_idx, match.end(), int(digits)))
+                a_start = text.find(literal, a_end)
+        found.sort()
+
+        marker_starts, marker_ends = self._find_markers(text, found)
+        return [
+            PriceCandidate(price, pattern_idx, start, end,
+                           self._near_marker(marker_starts, marker_ends, start, end))
+            for start, pattern_idx, end, price in found
+        ]
+
+    def _find_markers(self, text: str, found: list) -> tuple[list[int], list[int]]:
+        """Marker offsets inside the union of all candidate windows.
+
+        Windows are merged first so every character is matched against all
+        marker words at most once, however densely the candidates cluster.
+        """
+        starts, ends = [], []
+        if self._markers is None or not found:
+            return starts, ends
+        lo = hi = None
+        for start, _, end, _ in found:
+            w_lo, w_hi = max(0, start - self.window), end + self.window
+            if hi is not None and w_lo <= hi:
+                hi = max(hi, w_hi)
+                continue
+            if hi is not None:
+                self._collect_markers(text, lo, hi, starts, ends)
+            lo, hi = w_lo, w_hi
+        self._collect_markers(text, lo, hi, starts, ends)
+        return starts, ends
+
+    def _collect_markers(self, text: str, lo: int, hi: int, starts: list, ends: list):
+        for m in self._markers.finditer(text, lo, hi):
+            starts.append(m.start())
+            ends.append(m.end())
+
+    def _match_around(self, text: str, pattern_idx: int, a_start: int, a_end: int):
+        """The leftmost match of a pattern that contains the anchor, if any."""
+        pattern = self.patterns[pattern_idx]
+        lo = a_start - self.span if a_start > self.span else 0
+        hi = a_end + self.span
+        match = pattern.search(text, lo, hi)
+        while match is not None and match.end() < a_end:
+            match = pattern.search(text, match.end(), hi)
+        if match is None or match.start() > a_start:
+            return None
+        if match.start() == lo and lo > 0:
+            # The window may have cut the match short; retry with more context
+            for full in pattern.finditer(text, max(0, lo - 8 * self.span), hi):
+                if full.start() <= a_start and full.end() >= a_end:
+                    return full
+            return None
+        return match
+
+    def _near_marker(self, starts: list[int], ends: list[int], start: int, end: int) -> bool:
+        lo = start - self.window
+        hi = end + self.window
+        i = bisect.bisect_left(starts, lo)
+        while i < len(starts) and starts[i] < hi:
+            if ends[i] <= hi:
+                return True
+            i += 1
+        return False
+
+    @staticmethod
+    def best(candidates: list[PriceCandidate]) -> int | None:
+        """Price from the highest-priority pattern, earliest in the document."""
+        if not candidates:
+            return None
+        return min(candidates, key=lambda c: (c.pattern, c.start)).price
+
+    def first(self, text: str) -> int | None:
+        return self.best(self.scan(text))
+
+
+class StreamScanner:
+    """Run a PriceExtractor over text that arrives in chunks.
+
+    Only a sliding tail of the document is kept.  A candidate is emitted once
+    the text after it covers the pattern window and the marker window, so the
+    results match PriceExtractor.scan() on the whole document.
+    """
+
+    def __init__(self, extractor: PriceExtractor):
+        self.extractor = extractor
+        self._lookahead = max(extractor.window, extractor.span) + extractor.span
+        self._history = max(extractor.window, 9 * extractor.span) + extractor.span
+        self._buf = ""
+        self._offset = 0   # document offset of _buf[0]
+        self._emitted = 0  # candidates ending at or before this offset were emitted
+
+    def feed(self, chunk: str) -> list[PriceCandidate]:
+        self._buf += chunk
+        limit = self._offset + len(self._buf) - self._lookahead
+        if limit <= self._emitted:
+            return []
+        ready = self._collect(limit)
+        keep_from = max(0, limit - self._offset - self._history)
+        self._buf = self._buf[keep_from:]
+        self._offset += keep_from
+        return ready
+
+    def finish(self) -> list[PriceCandidate]:
+        return self._collect(self._offset + len(self._buf))
+
+    def _collect(self, limit: int) -> list[PriceCandidate]:
+        ready = []
+        for c in self.extractor.scan(self._buf):
+            end = c.end + self._offset
+            if self._emitted < end <= limit:
+                c.start += self._offset
+                c.end = end
+                ready.append(c)
+        self._emitted = limit
+        return ready
+
+
+def scan_stream(extractor: PriceExtractor, chunks, stop=None, metrics=None, source: str = "") -> list[PriceCandidate]:
+    """Scan streamed text chunks, stopping early once `stop(candidates)` is true.
+
+    `chunks` is usually HTTPClient.stream(); it is closed when scanning ends,
+    which drops the connection if the body was not read to the end.  Time
+    spent scanning is reported to `metrics` as the "extract" stage.
+    """
+    scanner = StreamScanner(extractor)
+    found = []
+    spent = 0.0
+    try:
+        for chunk in chunks:
+            started = time.perf_counter()
+            found.extend(scanner.feed(chunk))
+            spent += time.perf_counter() - started
+            if stop is not None and found and stop(found):
+                return found
+        started = time.perf_counter()
+        found.extend(scanner.finish())
+        spent += time.perf_counter() - started
+        return found
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+        if metrics is not None:
+            metrics.observe("extract", spent, source)
+
+
+def has_top_priority(candidates: list[PriceCandidate]) -> bool:
+    """Stop condition for best(): nothing later can beat a pattern-0 match."""
+    return any(c.pattern == 0 for c in candidates)
+
+
+# 定価 / 希望小売価格 style list prices (Google snippets, kakaku.com)
+LIST_PRICE = PriceExtractor([
+    (r'(?:定価|希望小売価格|メーカー希望小売価格|参考価格|税込価格)[：:\s]*[¥￥]?\s*([\d,]+)\s*円', "円"),
+    (r'(?:定価|希望小売価格|メーカー希望小売価格|参考価格)[：:\s]*[¥￥]\s*([\d,]+)', ("¥", "￥")),
+    (r'[¥￥]\s*([\d,]+)\s*[\(（]税込[\)）]', ("¥", "￥")),
+    (r'([\d,]+)\s*円\s*[\(（]税込[\)）]', "円"),
+    (r'価格[：:\s]*[¥￥]?\s*([\d,]+)\s*円', "円"),
+])
+
+# Amazon search result prices, flagged when used/junk words are nearby
+AMAZON_PRICE = PriceExtractor([
+    (r'a-price-whole["\s>]*([\d,]+)', "a-price-whole"),
+    (r'a-offscreen["\s>]*[¥￥]([\d,]+)', "a-offscreen"),
+    (r'a-color-price["\s>]*[¥￥]\s*([\d,]+)', "a-color-price"),
+], markers=USED_MARKERS)
+
+# Every "12,800円" on a Yahoo! Shopping results page
+YEN_AMOUNT = PriceExtractor([(r'([\d,]+)\s*円', "円")])
+
+# kakaku.com lowest price fallbacks
+KAKAKU_LOWEST = PriceExtractor([
+    (r'最安価格[：:\s]*[¥￥]?\s*([\d,]+)', "最安価格"),
+    (r'priceMin["\s:]*(\d+)', "priceMin"),
+])
+
+
+def extract_price_from_text(text: str) -> int | None:
+    """Extract a list price (定価 etc.) from Japanese text."""
+    return LIST_PRICE.first(text)
@@ -0,0 +1,278 @@
+"""
+Columnar, time-indexed store for buyback price observations.
+
+history.json (written by export-json.ts for the web app) is one dict of
+product id -> [{shop_name, price, scraped_at}], so every question about it
+means parsing and scanning the whole file.  HistoryStore keeps the same
+observations as four typed columns on disk, in data/history_store/:
+
+    product.i32  shop.i32  price.i64  ts.i64     one value per observation
+    shops.txt                                    shop id -> name, one per line
+    meta.json                                    committed row count
+
+Appends write only the new rows to the end of each column file and then
+commit the new row count, so a crash mid-append leaves the store at the last
+commit; trailing bytes past it are ignored and overwritten later.  Queries
+use an in-memory index: row numbers sorted by (product, time) plus each
+product's slice of that order, rebuilt lazily after appends.
+"""
+
+import bisect
+import calendar
+import heapq
+import json
+import os
+import time
+from array import array
+from collections import deque
+from pathlib import Path
+
+from .journal import write_json_atomic
+
+DEFAULT_HISTORY_DIR = Path(__file__).parent.parent.parent / "data" / "history_store"
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"  # scraped_at in history.json
+DAY = 86400
+
+# column name -> array typecode
+_COLUMNS = {"product": "i", "shop": "i", "price": "q", "ts": "q"}
+
+
+def parse_time(text: str) -> int:
+    """scraped_at string -> seconds (the naive timestamp read as UTC)."""
+    return calendar.timegm(time.strptime(text, TIME_FORMAT))
+
+
+def format_time(ts: int) -> str:
+    return time.strftime(TIME_FORMAT, time.gmtime(ts))
+
+
+class _Rolling:
+    """Min, max and median of a sliding window of values."""
+
+    def __init__(self):
+        self._sorted = []
+        self._min = deque()  # (value, seq) increasing
+        self._max = deque()  # (value, seq) decreasing
+        self._seq = 0
+        self._first = 0       # seq of the oldest value still in the window
+
+    def push(self, value: int):
+        bisect.insort(self._sorted, value)
+        while self._min and self._min[-1][0] >= value:
+            self._min.pop()
+        self._min.append((value, self._seq))
+        while self._max and self._max[-1][0] <= value:
+            self._max.pop()
+        self._max.append((value, self._seq))
+        self._seq += 1
+
+    def pop_oldest(self, value: int):
+        del self._sorted[bisect.bisect_left(self._sorted, value)]
+        if self._min[0][1] == self._first:
+            self._min.popleft()
+        if self._max[0][1] == self._first:
+            self._max.popleft()
+        self._first += 1
+
+    def stats(self) -> tuple[int, int, float]:
+        values = self._sorted
+        mid = len(values) // 2
+        median = values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2
+        return self._min[0][0], self._max[0][0], median
+
+
+class HistoryStore:
+    """Append-only columnar buyback history with per-product time index."""
+
+    def __init__(self, directory: Path = DEFAULT_HISTORY_DIR):
+        self.dir = Path(directory)
+        self.columns = {name: array(code) for name, code in _COLUMNS.items()}
+        self.shops: list[str] = []
+        self._shop_ids: dict[str, int] = {}
+        self._order: array | None = None  # row numbers sorted by (product, ts)
+        self._slices: dict[int, tuple[int, int]] = {}  # product -> [start, end) in _order
+        self._keys: set | None = None       # (product, shop, ts, price) for de-duplication
+
+    # -- persistence ----------------------------------------------------
+
+    def _column_path(self, name: str) -> Path:
+        return self.dir / f"{name}.{'i32' if _COLUMNS[name] == 'i' else 'i64'}"
+
+    def load(self) -> "HistoryStore":
+        meta_path = self.dir / "meta.json"
+        if not meta_path.exists():
+            return self
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        rows = meta["rows"]
+        for name, column in self.columns.items():
+            with open(self._column_path(name), "rb") as f:
+                column.frombytes(f.read(rows * column.itemsize))
+        with open(self.dir / "shops.txt", "r", encoding="utf-8") as f:
+            self.shops = f.read().split("\n")[:meta["shops"]]
+        self._shop_ids = {name: i for i, name in enumerate(self.shops)}
+        self._invalidate()
+        return self
+
+    def __len__(self) -> int:
+        return len(self.columns["ts"])
+
+    def append(self, rows: list[tuple[int, str, int, int]]) -> int:
+        """Append (product_id, shop_name, price, ts) rows; returns how many were new.
+
+        Rows already in the store are skipped, so re-importing an export that
+        overlaps earlier ones only adds the new observations.
+        """
+        keys = self._existing_keys()
+        committed_rows = len(self)
+        new_shops = []
+        added = {name: array(code) for name, code in _COLUMNS.items()}
+        for product, shop_name, price, ts in rows:
+            shop = self._shop_ids.get(shop_name)
+            if shop is None:
+                shop = self._shop_ids[shop_name] = len(self.shops)
+                self.shops.append(shop_name)
+                new_shops.append(shop_name)
+            key = (product, shop, ts, price)
+            if key in keys:
+                continue
+            keys.add(key)
+            added["product"].append(product)
+            added["shop"].append(shop)
+            added["price"].append(price)
+            added["ts"].append(ts)
+        if not added["ts"]:
+            return 0
+
+        self.dir.mkdir(parents=True, exist_ok=True)
+        if new_shops:
+            # A handful of names: rewritten whole, atomically
+            tmp = self.dir / "shops.txt.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write("\n".join(self.shops))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.dir / "shops.txt")
+        for name, values in added.items():
+            path = self._column_path(name)
+            with open(path, "r+b" if path.exists() else "wb") as f:
+                # Bytes past the last commit are from an interrupted append
+                f.truncate(committed_rows * values.itemsize)
+                f.seek(0, os.SEEK_END)
+                values.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            self.columns[name].extend(values)
+        write_json_atomic(self.dir / "meta.json", {"rows": len(self), "shops": len(self.shops)})
+        self._invalidate(keep_keys=True)
+        return len(added["ts"])
+
+    def import_history_json(self, history: dict) -> int:
+        """Append every observation of a history.json dict not stored yet."""
+        rows = [
+            (int(pid), obs["shop_name"], obs["price"], parse_time(obs["scraped_at"]))
+            for pid, observations in history.items()
+            for obs in observations
+            if obs.get("price") is not None and obs.get("scraped_at")
+        ]
+        return self.append(rows)
+
+    # -- index ----------------------------------------------------------
+
+    def _invalidate(self, keep_keys: bool = False):
+        self._order = None
+        self._slices = {}
+        if not keep_keys:
+            self._keys = None
+
+    def _existing_keys(self) -> set:
+        if self._keys is None:
+            c = self.columns
+            self._keys = set(zip(c["product"], c["shop"], c["ts"], c["price"]))
+        return self._keys
+
+    def _index(self) -> array:
+        if self._order is None:
+            product, ts = self.columns["product"], self.columns["ts"]
+            self._order = array("q", sorted(range(len(ts)), key=lambda i: (product[i], ts[i])))
+            self._slices = {}
+            start = 0
+            order = self._order
+            for pos in range(1, len(order) + 1):
+                if pos == len(order) or product[order[pos]] != product[order[start]]:
+                    self._slices[product[order[start]]] = (start, pos)
+                    start = pos
+        return self._order
+
+    def products(self) -> list[int]:
+        self._index()
+        return sorted(self._slices)
+
+    def _rows(self, product_id: int, start_ts: int | None = None, end_ts: int | None = None) -> list[int]:
+        """Row numbers for a product in time order, optionally within [start_ts, end_ts)."""
+        order = self._index()
+        lo, hi = self._slices.get(product_id, (0, 0))
+        ts = self.columns["ts"]
+        if start_ts is not None:
+            lo = bisect.bisect_left(order, start_ts, lo, hi, key=lambda i: ts[i])
+        if end_ts is not None:
+            hi = bisect.bisect_left(order, end_ts, lo, hi, key=lambda i: ts[i])
+        return order[lo:hi].tolist()
+
+    # -- queries --------------------------------------------------------
+
+    def latest(self, product_id: int) -> dict[str, tuple[int, int]]:
+        """{shop name: (price, ts)} with each shop's most recent observation."""
+        c = self.columns
+        latest = {}
+        for i in reversed(self._rows(product_id)):
+            shop = self.shops[c["shop"][i]]
+            if shop not in latest:
+                latest[shop] = (c["price"][i], c["ts"][i])
+        return latest
+
+    def best_latest(self, product_id: int) -> tuple[str, int, int] | None:
+        """(shop, price, ts) of the highest latest-per-shop price."""
+        latest = self.latest(product_id)
+        if not latest:
+            return None
+        shop = max(latest, key=lambda name: latest[name][0])
+        return shop, *latest[shop]
+
+    def range(self, product_id: int, start_ts: int | None = None, end_ts: int | None = None,
+              shop: str | None = None) -> list[tuple[int, str, int]]:
+        """(ts, shop, price) observations in [start_ts, end_ts), oldest first."""
+        c = self.columns
+        shop_id = self._shop_ids.get(shop) if shop is not None else None
+        if shop is not None and shop_id is None:
+            return []
+        return [
+            (c["ts"][i], self.shops[c["shop"][i]], c["price"][i])
+            for i in self._rows(product_id, start_ts, end_ts)
+            if shop_id is None or c["shop"][i] == shop_id
+        ]
+
+    def rolling(self, product_id: int, window: int = 7 * DAY,
+                shop: str | None = None) -> list[tuple[int, int, int, float]]:
+        """(ts, min, max, median) over the trailing `window` seconds at each observation."""
+        points = self.range(product_id, shop=shop)
+        stats = _Rolling()
+        out = []
+        first = 0
+        for ts, _, price in points:
+            stats.push(price)
+            while points[first][0] <= ts - window:
+                stats.pop_oldest(points[first][2])
+                first += 1
+            out.append((ts, *stats.stats()))
+        return out
+
+    def top_products(self, n: int, product_ids=None) -> list[tuple[int, str, int]]:
+        """The n (product, shop, price) with the highest latest buyback price."""
+        best = []
+        for pid in (self.products() if product_ids is None else product_ids):
+            found = self.best_latest(pid)
+            if found:
+                best.append((found[1], pid, found[0]))
+        return [(pid, shop, price) for price, pid, shop in heapq.nlargest(n, best)]
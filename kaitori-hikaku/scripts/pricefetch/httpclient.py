@@ -0,0 +1,456 @@
+"""
+Pooled HTTP client shared by every price source.
+
+urllib.request.urlopen opens a new TCP + TLS connection per call and the old
+scripts also built a fresh SSL context every time.  HTTPClient keeps idle
+keep-alive connections per host, builds each SSL context once, decompresses
+gzip/deflate (and br when the `brotli` package is installed) and caps how many
+bytes a single response may read.  An optional ResponseCache (see cache.py)
+serves fresh pages from disk and revalidates stale ones, and an optional
+Metrics (see metrics.py) receives connect/ttfb/download/decode timings and
+byte, cache and retry counters per host.
+
+stream() yields the body as decoded text chunks while it downloads, so a parser
+can stop reading once it has what it needs (see extract.scan_stream).
+
+With an upstream URL (or PRICEFETCH_UPSTREAM in the environment) every request
+goes to that server instead, keeping the original Host header; the offline
+benchmark points it at a local replay server (see replay.py).
+"""
+
+import codecs
+import functools
+import gzip
+import http.client
+import os
+import ssl
+import threading
+import time
+import urllib.parse
+import zlib
+from dataclasses import dataclass, field
+
+from .cache import CacheMiss
+
+try:
+    import brotli  # optional
+except ImportError:
+    brotli = None
+
+MAX_RESPONSE_BYTES = 8 * 1024 * 1024
+MAX_IDLE_PER_HOST = 8
+MAX_REDIRECTS = 5
+CHUNK_SIZE = 16 * 1024
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli else "gzip, deflate"
+UPSTREAM_ENV = "PRICEFETCH_UPSTREAM"
+
+# Errors that mean a pooled keep-alive connection was closed by the server.
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                 BrokenPipeError, ConnectionResetError)
+
+
+class HTTPStatusError(Exception):
+    """Raised for 4xx/5xx responses, like urllib.error.HTTPError."""
+
+    def __init__(self, url: str, status: int, reason: str, headers: dict):
+        super().__init__(f"HTTP Error {status}: {reason}")
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+
+
+@dataclass
+class Response:
+    url: str
+    status: int
+    headers: dict = field(default_factory=dict)  # lower-cased names
+    body: bytes = b""
+    truncated: bool = False
+
+    def text(self, encoding: str = "utf-8") -> str:
+        return self.body.decode(encoding, errors="ignore")
+
+
+@functools.lru_cache(maxsize=None)
+def ssl_context(verify: bool = True) -> ssl.SSLContext:
+    """Build (once) the SSL context for verified or unverified connections."""
+    ctx = ssl.create_default_context()
+    if not verify:
+        # Some Windows setups lack the CA bundle the shops chain to
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+def decompress(body: bytes, encoding: str, limit: int = MAX_RESPONSE_BYTES) -> bytes:
+    """Decode a Content-Encoding body, never inflating past `limit` bytes."""
+    encoding = (encoding or "").strip().lower()
+    if encoding in ("", "identity"):
+        return body[:limit]
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        wbits = 16 + zlib.MAX_WBITS if encoding != "deflate" else zlib.MAX_WBITS
+        try:
+            return zlib.decompressobj(wbits).decompress(body, limit)
+        except zlib.error:
+            if encoding == "deflate":  # raw deflate without zlib header
+                return zlib.decompressobj(-zlib.MAX_WBITS).decompress(body, limit)
+            return gzip.decompress(body)[:limit]
+    if encoding == "br" and brotli:
+        return brotli.decompress(body)[:limit]
+    raise ValueError(f"unsupported Content-Encoding: {encoding}")
+
+
+class StreamDecompressor:
+    """Incremental counterpart of decompress() for streamed bodies."""
+
+    def __init__(self, encoding: str):
+        encoding = (encoding or "").strip().lower()
+        self.encoding = encoding
+        if encoding in ("", "identity"):
+            self._obj = None
+        elif encoding in ("gzip", "x-gzip"):
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            self._obj = zlib.decompressobj(zlib.MAX_WBITS)
+        elif encoding == "br" and brotli:
+            self._obj = brotli.Decompressor()
+        else:
+            raise ValueError(f"unsupported Content-Encoding: {encoding}")
+        self._started = False
+
+    def feed(self, data: bytes) -> bytes:
+        if self._obj is None:
+            return data
+        if self.encoding == "br":
+            return self._obj.process(data)
+        try:
+            out = self._obj.decompress(data)
+        except zlib.error:
+            if self.encoding != "deflate" or self._started:
+                raise
+            # raw deflate without zlib header
+            self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            out = self._obj.decompress(data)
+        self._started = True
+        return out
+
+    def flush(self) -> bytes:
+        if self._obj is None or self.encoding == "br":
+            return b""
+        return self._obj.flush()
+
+
+def _text_chunks(body: bytes, chunk_size: int = CHUNK_SIZE):
+    """Yield a cached body as text chunks, like a live stream would."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    for i in range(0, len(body), chunk_size):
+        yield decoder.decode(body[i:i + chunk_size])
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+class HTTPClient:
+    """Thread-safe GET client with per-host keep-alive connection pools."""
+
+    def __init__(self, timeout: float = 15, verify: bool = True,
+                 max_bytes: int = MAX_RESPONSE_BYTES, max_idle: int = MAX_IDLE_PER_HOST,
+                 cache=None, metrics=None, upstream: str | None = None):
+        self.timeout = timeout
+        self.cache = cache
+        self.metrics = metrics
+        self.verify = verify
+        self.max_bytes = max_bytes
+        self.max_idle = max_idle
+        self._idle: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        upstream = upstream or os.environ.get(UPSTREAM_ENV)
+        self.upstream = None  # (scheme, host, port) every request is sent to
+        if upstream:
+            parts = urllib.parse.urlsplit(upstream)
+            self.upstream = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+
+    # -- instrumentation ------------------------------------------------
+
+    def _observe(self, stage: str, host: str, started: float):
+        if self.metrics is not None:
+            self.metrics.observe(stage, time.perf_counter() - started, host)
+
+    def _count(self, name: str, host: str, value: float = 1):
+        if self.metrics is not None:
+            self.metrics.inc(name, value, host)
+
+    # -- connection pool ------------------------------------------------
+
+    def _checkout(self, key: tuple, timeout: float) -> tuple[http.client.HTTPConnection, bool]:
+        """Return (connection, reused)."""
+        with self._lock:
+            pool = self._idle.get(key)
+            if pool:
+                conn = pool.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        scheme, host, port = key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout,
+                                               context=ssl_context(self.verify))
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        return conn, False
+
+    def _checkin(self, key: tuple, conn: http.client.HTTPConnection):
+        with self._lock:
+            pool = self._idle.setdefault(key, [])
+            if len(pool) < self.max_idle:
+                pool.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            pools, self._idle = self._idle, {}
+        for pool in pools.values():
+            for conn in pool:
+                conn.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    # -- requests -------------------------------------------------------
+
+    def _request(self, url: str, headers: dict, timeout: float):
+        """Send one GET; returns (key, conn, http.client.HTTPResponse)."""
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        send_headers = {"Accept-Encoding": ACCEPT_ENCODING, "Connection": "keep-alive"}
+        send_headers.update(headers or {})
+        if self.upstream is not None:
+            send_headers["Host"] = parts.netloc
+            key = self.upstream
+
+        host = parts.hostname
+        while True:
+            conn, reused = self._checkout(key, timeout)
+            try:
+                if not reused:
+                    started = time.perf_counter()
+                    conn.connect()
+                    self._observe("connect", host, started)
+                started = time.perf_counter()
+                conn.request("GET", path, headers=send_headers)
+                resp = conn.getresponse()
+                self._observe("ttfb", host, started)
+                self._count("requests", host)
+                return key, conn, resp
+            except _STALE_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                # Server dropped an idle keep-alive connection; retry on a new one
+                self._count("retries", host)
+            except Exception:
+                conn.close()
+                raise
+
+    def open(self, url: str, headers: dict | None = None, timeout: float | None = None):
+        """Send a GET, following redirects; returns (key, conn, raw response).
+
+        The caller owns the connection and must hand it to `release()` once the
+        body has been consumed (or abandoned).
+        """
+        timeout = self.timeout if timeout is None else timeout
+        for _ in range(MAX_REDIRECTS + 1):
+            key, conn, resp = self._request(url, headers, timeout)
+            if resp.status in (301, 302, 303, 307, 308) and resp.getheader("Location"):
+                resp.read()
+                self.release(key, conn, resp)
+                url = urllib.parse.urljoin(url, resp.getheader("Location"))
+                continue
+            resp.url = url
+            return key, conn, resp
+        raise HTTPStatusError(url, resp.status, "too many redirects", {})
+
+    def release(self, key: tuple, conn: http.client.HTTPConnection, resp, complete: bool = True):
+        """Return a connection to the pool if its response was fully read."""
+        if complete and resp.isclosed() and not resp.will_close:
+            self._checkin(key, conn)
+        else:
+            conn.close()
+
+    def _cache_prelude(self, url: str, headers: dict | None):
+        """Returns (entry, fresh, headers) for a cache lookup of `url`."""
+        cache = self.cache
+        if cache is None:
+            return None, False, headers
+        entry = cache.lookup(url)
+        if entry is not None and cache.is_fresh(entry):
+            cache.hits += 1
+            self._count("cache_hits", urllib.parse.urlsplit(url).hostname)
+            return entry, True, headers
+        if cache.offline:
+            raise CacheMiss(url)
+        if entry is not None:
+            headers = {**(headers or {}), **entry.validators()}
+        return entry, False, headers
+
+    def get(self, url: str, headers: dict | None = None, timeout: float | None = None) -> Response:
+        """GET `url` and return the decompressed body (at most max_bytes)."""
+        cache = self.cache
+        entry, fresh, headers = self._cache_prelude(url, headers)
+        if fresh:
+            return Response(url, entry.status, entry.headers, entry.body)
+
+        response = self._fetch(url, headers, timeout)
+
+        if cache is not None:
+            host = urllib.parse.urlsplit(url).hostname
+            if response.status == 304 and entry is not None:
+                cache.revalidated += 1
+                self._count("cache_revalidated", host)
+                cache.refresh(url, response.headers)
+                return Response(url, entry.status, entry.headers, entry.body)
+            cache.misses += 1
+            self._count("cache_misses", host)
+            if response.status == 200 and not response.truncated:
+                cache.store(url, response.status, response.headers, response.body)
+        return response
+
+    def stream(self, url: str, headers: dict | None = None, timeout: float | None = None,
+               chunk_size: int = CHUNK_SIZE):
+        """GET `url` and yield the body as UTF-8 text chunks as they arrive.
+
+        Closing the generator early (e.g. `break` inside contextlib.closing)
+        stops reading and closes the connection; with a cache attached the
+        rest of a 200 body is read first (not decoded) so the page is still
+        cached.  Throwing an exception into the generator drops the response
+        uncached.  Only complete 200 responses are written to the cache.
+        """
+        cache = self.cache
+        entry, fresh, headers = self._cache_prelude(url, headers)
+        if fresh:
+            yield from _text_chunks(entry.body, chunk_size)
+            return
+
+        key, conn, resp = self.open(url, headers, timeout)
+        # key is the upstream when replaying; attribute metrics to the real host like _request() does
+        host = urllib.parse.urlsplit(resp.url).hostname
+        complete = False
+        try:
+            resp_headers = {k.lower(): v for k, v in resp.getheaders()}
+            if resp.status == 304 and entry is not None:
+                resp.read()
+                complete = True
+                cache.revalidated += 1
+                self._count("cache_revalidated", host)
+                cache.refresh(url, resp_headers)
+                yield from _text_chunks(entry.body, chunk_size)
+                return
+            if resp.status >= 400:
+                resp.read(self.max_bytes)
+                complete = True
+                self._count(f"http_{resp.status}", host)
+                raise HTTPStatusError(resp.url, resp.status, resp.reason, resp_headers)
+            if cache is not None:
+                cache.misses += 1
+                self._count("cache_misses", host)
+
+            decompressor = StreamDecompressor(resp_headers.get("content-encoding", ""))
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+            kept = [] if cache is not None and resp.status == 200 else None
+            received = 0
+            try:
+                while received < self.max_bytes:
+                    started = time.perf_counter()
+                    raw = resp.read1(min(chunk_size, self.max_bytes - received))
+                    self._observe("download", host, started)
+                    if not raw:
+                        # read1() leaves a Content-Length response open at EOF;
+                        # read() marks it closed so the connection is pooled
+                        resp.read()
+                        complete = True
+                        break
+                    received += len(raw)
+                    started = time.perf_counter()
+                    data = decompressor.feed(raw)
+                    if kept is not None:
+                        kept.append(data)
+                    text = decoder.decode(data) if data else ""
+                    self._observe("decode", host, started)
+                    if text:
+                        yield text
+            except GeneratorExit:
+                if kept is not None:
+                    # The consumer has its prices; keep the page for --offline and re-runs
+                    received, complete = self._drain(resp, decompressor, kept, received, chunk_size, host)
+                    if complete:
+                        cache.store(url, resp.status, resp_headers, b"".join(kept))
+                raise
+            finally:
+                self._count("bytes_downloaded", host, received)
+
+            if complete:
+                data = decompressor.flush()
+                if kept is not None:
+                    kept.append(data)
+                tail = decoder.decode(data, final=True)
+                if tail:
+                    yield tail
+                if kept is not None:
+                    cache.store(url, resp.status, resp_headers, b"".join(kept))
+        finally:
+            self.release(key, conn, resp, complete)
+
+    def _drain(self, resp, decompressor: StreamDecompressor, kept: list, received: int, chunk_size: int,
+               host: str) -> tuple[int, bool]:
+        """Read the rest of a streamed body into `kept` (decompressed, not decoded).
+
+        Best effort: the consumer already stopped, so a failure only means the
+        page is not cached.  Returns (bytes received, whether EOF was reached).
+        """
+        try:
+            while received < self.max_bytes:
+                started = time.perf_counter()
+                raw = resp.read1(min(chunk_size, self.max_bytes - received))
+                self._observe("download", host, started)
+                if not raw:
+                    resp.read()
+                    kept.append(decompressor.flush())
+                    return received, True
+                received += len(raw)
+                kept.append(decompressor.feed(raw))
+        except (OSError, http.client.HTTPException, ValueError, zlib.error):
+            pass
+        return received, False
+
+    def _fetch(self, url: str, headers: dict | None, timeout: float | None) -> Response:
+        key, conn, resp = self.open(url, headers, timeout)
+        # key is the upstream when replaying; attribute metrics to the real host like _request() does
+        host = urllib.parse.urlsplit(resp.url).hostname
+        try:
+            started = time.perf_counter()
+            raw = resp.read(self.max_bytes + 1)
+            self._observe("download", host, started)
+            truncated = len(raw) > self.max_bytes
+            raw = raw[:self.max_bytes]
+        except Exception:
+            conn.close()
+            raise
+        self.release(key, conn, resp, complete=not truncated)
+        self._count("bytes_downloaded", host, len(raw))
+
+        resp_headers = {k.lower(): v for k, v in resp.getheaders()}
+        if resp.status >= 400:
+            self._count(f"http_{resp.status}", host)
+            raise HTTPStatusError(resp.url, resp.status, resp.reason, resp_headers)
+        started = time.perf_counter()
+        body = decompress(raw, resp_headers.get("content-encoding", ""), self.max_bytes)
+        self._observe("decode", host, started)
+        return Response(resp.url, resp.status, resp_headers, body, truncated)
@@ -0,0 +1,165 @@
+"""
+Append-only journal for retail_prices_found.json.
+
+The fetchers used to rewrite the whole pretty-printed JSON every 20 products,
+so each checkpoint got slower as the file grew and a crash lost up to 20
+results.  PriceJournal instead appends one JSON line per result next to the
+snapshot (flushed immediately, fsync'd in batches) and folds the journal back
+into the snapshot with compact():
+
+    retail_prices_found.json            snapshot, same dict format as before
+    retail_prices_found.journal.jsonl   {"jan": ..., "retail_price": ..., ...}
+
+Loading replays the journal over the snapshot.  A torn last line from a crash
+is ignored, and compaction replaces the snapshot atomically before truncating
+the journal, so replaying twice is harmless.
+
+Worker processes in a sharded run each append to their own shard journal
+(retail_prices_found.shard3.journal.jsonl).  Shards are split by JAN, so no two
+journals hold the same key and merging them is a plain replay in any order.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+FSYNC_EVERY = 20        # records
+FSYNC_INTERVAL = 2.0    # seconds
+
+
+def journal_path_for(snapshot_path: Path) -> Path:
+    snapshot_path = Path(snapshot_path)
+    return snapshot_path.with_name(snapshot_path.stem + ".journal.jsonl")
+
+
+def shard_journal_path(snapshot_path: Path, shard: int) -> Path:
+    snapshot_path = Path(snapshot_path)
+    return snapshot_path.with_name(f"{snapshot_path.stem}.shard{shard}.journal.jsonl")
+
+
+def shard_journals(snapshot_path: Path) -> list[Path]:
+    snapshot_path = Path(snapshot_path)
+    return sorted(snapshot_path.parent.glob(f"{snapshot_path.stem}.shard*.journal.jsonl"))
+
+
+def write_json_atomic(path: Path, data):
+    """Write JSON to a temp file, fsync it and rename it over `path`."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def replay(path: Path, prices: dict) -> int:
+    """Apply journal records to `prices`; returns how many were applied."""
+    path = Path(path)
+    if not path.exists():
+        return 0
+    applied = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn write from a crash
+            jan = record.pop("jan", None)
+            if jan:
+                prices[jan] = record
+                applied += 1
+    return applied
+
+
+class PriceJournal:
+    """The found-prices dict plus its append-only journal."""
+
+    def __init__(self, snapshot_path: Path, journal_path: Path | None = None,
+                 fsync_every: int = FSYNC_EVERY, fsync_interval: float = FSYNC_INTERVAL):
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = Path(journal_path) if journal_path else journal_path_for(self.snapshot_path)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.prices: dict = {}
+        self.replayed = 0
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def load(self) -> dict:
+        """Read the snapshot and replay any journal left by an earlier run."""
+        self.prices = {}
+        if self.snapshot_path.exists():
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                self.prices = json.load(f)
+        self.replayed = replay(self.journal_path, self.prices)
+        self.merge_shards()
+        return self.prices
+
+    def merge_shards(self) -> dict:
+        """Replay the shard journals written by worker processes.
+
+        Returns the merged records.  The shard files stay on disk until the
+        next compact(), so a crash before then loses nothing.
+        """
+        merged = {}
+        for path in shard_journals(self.snapshot_path):
+            replay(path, merged)
+        self.prices.update(merged)
+        self.replayed += len(merged)
+        return merged
+
+    def __contains__(self, jan: str) -> bool:
+        return jan in self.prices
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def record(self, jan: str, entry: dict):
+        """Store one result and append it to the journal."""
+        self.prices[jan] = entry
+        if self._file is None:
+            self._open()
+        self._file.write(json.dumps({"jan": jan, **entry}, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def _open(self):
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        torn = False
+        if self.journal_path.exists() and self.journal_path.stat().st_size:
+            with open(self.journal_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        self._file = open(self.journal_path, "a", encoding="utf-8")
+        if torn:
+            self._file.write("\n")  # keep the next record off the torn line
+
+    def sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def compact(self):
+        """Write the snapshot in the usual dict format and empty the journal."""
+        self.sync()
+        write_json_atomic(self.snapshot_path, self.prices)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.journal_path.exists():
+            self.journal_path.unlink()
+        for path in shard_journals(self.snapshot_path):
+            path.unlink()
+        self.replayed = 0
+
+    def close(self):
+        self.sync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,141 @@
+"""
+Run instrumentation for the price fetchers.
+
+Metrics collects per-stage timings and counters, labelled by source (a price
+source such as "yahoo" or a host name for HTTP-level stages):
+
+  wait      host rate limiter sleeps          search    one source lookup
+  connect   TCP + TLS for a new connection    ttfb      request sent → headers
+  download  reading the body off the socket   decode    decompression + UTF-8
+  extract   price regex scanning              save      journal / store writes
+
+Counters cover requests, bytes downloaded, cache hits/revalidations/misses,
+retries and HTTP errors.  write_report() stores a JSON run report under the
+log directory and, optionally, the same numbers in Prometheus text format for
+node_exporter's textfile collector.  Worker processes send snapshot() back to
+the parent, which merge()s them before writing the report.
+"""
+
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Metrics:
+    """Thread-safe timing samples and counters for one run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.timings: dict[tuple[str, str], list[float]] = {}  # (stage, source) -> seconds
+        self.counters: dict[tuple[str, str], float] = {}       # (name, source) -> total
+
+    def observe(self, stage: str, seconds: float, source: str = ""):
+        with self._lock:
+            self.timings.setdefault((stage, source), []).append(seconds)
+
+    def inc(self, name: str, value: float = 1, source: str = ""):
+        with self._lock:
+            self.counters[(name, source)] = self.counters.get((name, source), 0) + value
+
+    @contextmanager
+    def timer(self, stage: str, source: str = ""):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, source)
+
+    # -- aggregation ----------------------------------------------------
+
+    def total(self, name: str) -> float:
+        """A counter summed over every source."""
+        with self._lock:
+            return sum(value for (n, _), value in self.counters.items() if n == name)
+
+    def snapshot(self) -> dict:
+        """Picklable copy of the raw samples, for merge() in another process."""
+        with self._lock:
+            return {"timings": {k: list(v) for k, v in self.timings.items()},
+                    "counters": dict(self.counters)}
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            for key, values in snapshot["timings"].items():
+                self.timings.setdefault(key, []).extend(values)
+            for key, value in snapshot["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def report(self, **extra) -> dict:
+        """Summary: count/sum/mean/max and p50/p95/p99 per (stage, source)."""
+        with self._lock:
+            timings = {k: sorted(v) for k, v in self.timings.items()}
+            counters = dict(self.counters)
+        stages = []
+        for (stage, source), values in sorted(timings.items()):
+            row = {"stage": stage, "source": source, "count": len(values),
+                   "sum": round(sum(values), 6), "mean": round(sum(values) / len(values), 6),
+                   "max": round(values[-1], 6)}
+            for q in QUANTILES:
+                row[f"p{round(q * 100)}"] = round(percentile(values, q), 6)
+            stages.append(row)
+        return {
+            "started_at": self.started,
+            "elapsed": round(time.time() - self.started, 3),
+            **extra,
+            "stages": stages,
+            "counters": [{"name": name, "source": source, "value": value}
+                         for (name, source), value in sorted(counters.items())],
+        }
+
+    # -- output ---------------------------------------------------------
+
+    def prometheus(self, prefix: str = "pricefetch") -> str:
+        """The report in Prometheus text exposition format."""
+        report = self.report()
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        for row in report["stages"]:
+            labels = f'stage="{row["stage"]}",source="{row["source"]}"'
+            for q in QUANTILES:
+                lines.append(f'{prefix}_stage_seconds{{{labels},quantile="{q}"}} {row[f"p{round(q * 100)}"]}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {row['sum']}")
+            lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {row['count']}")
+        names = sorted({row["name"] for row in report["counters"]})
+        for name in names:
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for row in report["counters"]:
+                if row["name"] == name:
+                    lines.append(f'{prefix}_{name}_total{{source="{row["source"]}"}} {row["value"]}')
+        lines.append(f"# TYPE {prefix}_run_elapsed_seconds gauge")
+        lines.append(f"{prefix}_run_elapsed_seconds {report['elapsed']}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, log_dir: Path, name: str, prometheus: bool = False, **extra) -> list[Path]:
+        """Write logs/<name>-<timestamp>.json (and logs/<name>.prom); returns the paths."""
+        log_dir = Path(log_dir)
+        log_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        path = log_dir / f"{name}-{stamp}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(**extra), f, ensure_ascii=False, indent=2)
+        paths = [path]
+        if prometheus:
+            prom = log_dir / f"{name}.prom"
+            tmp = prom.with_name(prom.name + ".tmp")
+            tmp.write_text(self.prometheus(), encoding="utf-8")
+            tmp.replace(prom)  # the textfile collector must never see a partial file
+            paths.append(prom)
+        return paths
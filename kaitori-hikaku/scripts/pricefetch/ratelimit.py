@@ -0,0 +1,45 @@
+"""
+Per-host rate limiting for the asyncio fetch engine.
+
+Each scraped host gets its own token bucket, so a slow or strict host only
+throttles requests to itself instead of every source sharing one global sleep.
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, up to `capacity` banked."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """Wait until `tokens` are available and take them.
+
+        The lock is held while sleeping so waiters are served in FIFO order.
+        """
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+def build_limiters(limits: dict[str, tuple[float, float]]) -> dict[str, TokenBucket]:
+    """Create one bucket per host from {host: (requests_per_second, burst)}."""
+    return {host: TokenBucket(rate, burst) for host, (rate, burst) in limits.items()}
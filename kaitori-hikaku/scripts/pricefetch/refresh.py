@@ -0,0 +1,138 @@
+"""
+Refresh planning for retail prices that may have gone stale.
+
+Both fetchers skip a JAN forever once it is in retail_prices_found.json, so a
+price found months ago is never checked again.  Entries now carry
+`fetched_at` (and `checked_at` after a refresh that found nothing better),
+and plan_refresh() picks which ones to fetch again tonight:
+
+    score = staleness × value × source factor
+
+  staleness      1 - exp(-age in days × volatility of the category), the
+                 chance that something moved since the price was fetched.
+                 Volatility is the mean daily relative move of buyback prices
+                 in history (see category_volatility()).
+  value          sqrt(buyback price / VALUE_UNIT): a wrong price on an
+                 expensive item misleads more, but cheap items still get a turn.
+  source factor  ESTIMATED_FACTOR for estimates (a real price replaces a
+                 guess); 1 - confidence / 2 for consensus prices.
+
+Candidates are taken by score per expected request until the nightly request
+budget is spent.  Entries younger than MIN_AGE_DAYS are never refreshed, and
+entries without a timestamp (written before it existed) count as
+UNKNOWN_AGE_DAYS old.
+"""
+
+import calendar
+import math
+import time
+from dataclasses import dataclass
+
+from .history import DAY, TIME_FORMAT, HistoryStore
+
+MIN_AGE_DAYS = 3
+UNKNOWN_AGE_DAYS = 90
+VALUE_UNIT = 10000          # 円; a 10,000円 buyback price has value 1
+ESTIMATED_FACTOR = 2.0
+MIN_VOLATILITY = 0.002      # per day; even a flat category drifts eventually
+DEFAULT_VOLATILITY = 0.01   # per day, for categories without history
+
+
+def timestamp(now: float | None = None) -> str:
+    """fetched_at / checked_at value (UTC, the scraped_at format)."""
+    return time.strftime(TIME_FORMAT, time.gmtime(time.time() if now is None else now))
+
+
+def entry_age_days(entry: dict, now: float) -> float:
+    """Days since the entry was last fetched or checked."""
+    stamps = [entry[key] for key in ("fetched_at", "checked_at") if entry.get(key)]
+    if not stamps:
+        return UNKNOWN_AGE_DAYS
+    newest = max(calendar.timegm(time.strptime(stamp, TIME_FORMAT)) for stamp in stamps)
+    return max(0.0, (now - newest) / DAY)
+
+
+def category_volatility(history: HistoryStore, categories: dict[int, str]) -> dict[str, float]:
+    """{category: mean daily relative buyback price move}.
+
+    Per product and shop, each pair of consecutive observations contributes
+    |log(p2 / p1)| / days between them (at least one day); a product's
+    volatility is the mean over its pairs and a category's the median over
+    its products.  `categories` maps product id -> category.
+    """
+    per_category: dict[str, list[float]] = {}
+    for pid in history.products():
+        last: dict[str, tuple[int, int]] = {}
+        moves = []
+        for ts, shop, price in history.range(pid):
+            if price <= 0:
+                continue
+            if shop in last:
+                prev_ts, prev_price = last[shop]
+                moves.append(abs(math.log(price / prev_price)) / max((ts - prev_ts) / DAY, 1.0))
+            last[shop] = (ts, price)
+        if moves:
+            per_category.setdefault(categories.get(pid, ""), []).append(sum(moves) / len(moves))
+
+    volatility = {}
+    for category, values in per_category.items():
+        values.sort()
+        volatility[category] = max(values[len(values) // 2], MIN_VOLATILITY)
+    return volatility
+
+
+@dataclass
+class RefreshCandidate:
+    product: dict
+    entry: dict
+    age_days: float
+    score: float
+    cost: float  # expected requests
+
+    @property
+    def jan(self) -> str:
+        return self.product["jan_code"]
+
+
+def refresh_score(product: dict, entry: dict, age_days: float, volatility: float) -> float:
+    staleness = 1 - math.exp(-age_days * volatility)
+    value = math.sqrt(max(product.get("buyback_price", 0) or 0, 0) / VALUE_UNIT)
+    if entry.get("source") == "estimated":
+        factor = ESTIMATED_FACTOR
+    else:
+        factor = 1 - (entry.get("confidence") or 0) / 2
+    return staleness * value * factor
+
+
+def plan_refresh(products: list[dict], found_prices: dict, volatility: dict[str, float], budget: float,
+                 cost=None, now: float | None = None,
+                 min_age_days: float = MIN_AGE_DAYS) -> list[RefreshCandidate]:
+    """Products whose saved price should be fetched again, best first.
+
+    products: products with a JAN; only those in found_prices are considered.
+    cost(product) -> expected requests for one fetch (default 1).  The plan
+    stops before its total expected requests exceed `budget`.
+    """
+    now = time.time() if now is None else now
+    candidates = []
+    for product in products:
+        entry = found_prices.get(product.get("jan_code") or "")
+        if entry is None:
+            continue
+        age = entry_age_days(entry, now)
+        if age < min_age_days:
+            continue
+        score = refresh_score(product, entry, age,
+                              volatility.get(product.get("category", ""), DEFAULT_VOLATILITY))
+        if score > 0:
+            candidates.append(RefreshCandidate(product, entry, age, score, cost(product) if cost else 1.0))
+
+    candidates.sort(key=lambda c: -c.score / max(c.cost, 0.1))
+    plan = []
+    spent = 0.0
+    for candidate in candidates:
+        if spent + candidate.cost > budget:
+            continue
+        spent += candidate.cost
+        plan.append(candidate)
+    return plan
@@ -0,0 +1,225 @@
+"""
+Local stand-in for the price sources, for offline benchmarks.
+
+ReplayServer answers the fetchers' Yahoo / Amazon / Google / kakaku.com
+searches from 127.0.0.1.  HTTPClient sends every request to it when
+PRICEFETCH_UPSTREAM is set (see httpclient.UPSTREAM_ENV); the original host
+travels in the Host header, so the fetchers, their rate limiters and their
+metrics still see the real source names.
+
+Pages are either captured ones (from the response cache or a directory of
+saved *.html files, chosen per JAN) or synthetic pages built around a known
+price for each JAN, padded to a realistic size.  ReplayConfig sets the
+latency, the share of 503s, 429s and robot-check pages, a per-host request
+rate above which the server answers 429 with Retry-After, and the share of
+JANs a source has no results for.  Decisions come from a seeded RNG, so two
+runs with the same configuration see the same failures.
+"""
+
+import gzip
+import random
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zlib
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+SOURCE_HOSTS = {
+    "shopping.yahoo.co.jp": "yahoo",
+    "www.amazon.co.jp": "amazon",
+    "www.google.com": "google",
+    "kakaku.com": "kakaku",
+}
+
+ROBOT_PAGE = b"<html><head><title>Robot Check</title></head><body>/errors/validateCaptcha</body></html>"
+
+
+@dataclass
+class ReplayConfig:
+    latency_ms: float = 50.0     # mean time before the response starts
+    jitter: float = 0.5          # latency varies uniformly by ±jitter × mean
+    error_rate: float = 0.0      # share of 503 responses
+    throttle_rate: float = 0.0   # share of 429 responses
+    captcha_rate: float = 0.0    # share of 200 robot-check pages
+    host_rps: float = 0.0        # per-host requests/second before 429s (0 = unlimited)
+    retry_after: int = 1         # Retry-After seconds on 429/503
+    miss_rate: float = 0.1       # share of JANs a source has no results for
+    page_kb: int = 200           # synthetic page size
+    gzip: bool = True            # compress when the client accepts it
+    seed: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def load_captured_pages(cache_path: Path | None = None, pages_dir: Path | None = None) -> dict[str, list[bytes]]:
+    """{source: [page bodies]} from saved *.html files or the response cache."""
+    pages: dict[str, list[bytes]] = {}
+    if pages_dir is not None:
+        for path in sorted(Path(pages_dir).glob("*.html")):
+            source = next((s for s in SOURCE_HOSTS.values() if s in path.name), None)
+            if source:
+                pages.setdefault(source, []).append(path.read_bytes())
+    elif cache_path is not None and Path(cache_path).exists():
+        db = sqlite3.connect(str(cache_path))
+        for url, body in db.execute("SELECT url, body FROM responses WHERE status = 200"):
+            source = SOURCE_HOSTS.get(urllib.parse.urlsplit(url).hostname or "")
+            if source:
+                pages.setdefault(source, []).append(zlib.decompress(body))
+        db.close()
+    return pages
+
+
+def request_jans(source: str, target: str) -> list[str]:
+    """The JANs a search URL asks for: one, several OR-ed, or none (a name query)."""
+    parts = urllib.parse.urlsplit(target)
+    query = urllib.parse.parse_qs(parts.query)
+    if source == "yahoo":
+        text = query.get("p", [""])[0]
+    elif source == "amazon":
+        text = query.get("k", [""])[0]
+    elif source == "google":
+        text = query.get("q", [""])[0]
+    else:
+        text = parts.path.rstrip("/").rsplit("/", 1)[-1]
+    return [word for word in text.split() if word.isdigit()]
+
+
+def synthetic_items(source: str, jan: str, price: int) -> list[str]:
+    """Result items for one product, each linking to its JAN."""
+    link = f'<a href="/item/{jan}">'
+    if source == "yahoo":
+        return [f'<li class="item">{link}商品</a><span class="price">{int(price * (1 + (k % 5 - 2) / 50)):,}円'
+                f'</span><span>送料無料</span></li>' for k in range(20)]
+    if source == "amazon":
+        items = [f'<div class="s-result-item">{link}</a><span class="a-price-whole">{price + k * 10:,}</span></div>'
+                 for k in range(8)]
+        items.append(f'<div class="s-result-item">{link}</a>中古品 <span class="a-price-whole">{price // 2:,}</span></div>')
+        return items
+    if source == "google":
+        return [f'<div class="g">{link}</a><span>メーカー希望小売価格：{price:,}円（税込）</span></div>']
+    return [f"<p>{link}</a>メーカー希望小売価格：{price:,}円</p><p>最安価格(税込)：¥{int(price * 0.85):,}</p>"]
+
+
+def synthetic_page(source: str, prices: dict[str, int | None], page_kb: int) -> bytes:
+    """A results page listing {jan: price} the way the real source would (None = no results)."""
+    items = [item for jan, price in prices.items() if price for item in synthetic_items(source, jan, price)]
+    if not items:
+        items.append("<p>該当する商品が見つかりませんでした</p>")
+    filler = max(page_kb * 1024 - 200, 0)
+    head = "<div class=\"nav\">" + "n" * (filler // 3) + "</div>"
+    tail = "<div class=\"footer\">" + "f" * (filler - filler // 3) + "</div>"
+    return f"<html><body>{head}{''.join(items)}{tail}</body></html>".encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real sites
+
+    def do_GET(self):
+        self.server.replay.respond(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer:
+    """Threaded stand-in server; use as a context manager or start()/close()."""
+
+    def __init__(self, prices: dict[str, int], config: ReplayConfig | None = None,
+                 captured: dict[str, list[bytes]] | None = None, host: str = "127.0.0.1", port: int = 0):
+        """prices: {jan: retail price} for synthetic pages."""
+        self.prices = prices
+        self.config = config or ReplayConfig()
+        self.captured = captured or {}
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._buckets: dict[str, tuple[float, float]] = {}  # source -> (tokens, last refill)
+        self.stats: dict[str, dict[int, int]] = {}           # source -> status -> responses
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.replay = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "ReplayServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -- behaviour ------------------------------------------------------
+
+    def _over_rate(self, source: str) -> bool:
+        rps = self.config.host_rps
+        if rps <= 0:
+            return False
+        now = time.monotonic()
+        tokens, last = self._buckets.get(source, (rps, now))
+        tokens = min(rps, tokens + (now - last) * rps)
+        if tokens < 1:
+            self._buckets[source] = (tokens, now)
+            return True
+        self._buckets[source] = (tokens - 1, now)
+        return False
+
+    def respond(self, handler: BaseHTTPRequestHandler):
+        config = self.config
+        source = SOURCE_HOSTS.get(handler.headers.get("Host", "").split(":")[0], "")
+        with self._lock:
+            latency = config.latency_ms / 1000 * self._rng.uniform(1 - config.jitter, 1 + config.jitter)
+            roll = self._rng.random()
+            throttled = self._over_rate(source)
+        time.sleep(max(latency, 0.0))
+
+        headers = {"Content-Type": "text/html; charset=utf-8"}
+        if throttled or config.error_rate <= roll < config.error_rate + config.throttle_rate:
+            status, body = 429, b"Too Many Requests"
+            headers["Retry-After"] = str(config.retry_after)
+        elif roll < config.error_rate:
+            status, body = 503, b"Service Unavailable"
+            headers["Retry-After"] = str(config.retry_after)
+        elif roll < config.error_rate + config.throttle_rate + config.captcha_rate:
+            status, body = 200, ROBOT_PAGE
+        else:
+            status, body = 200, self._page(source, handler.path)
+
+        if config.gzip and "gzip" in handler.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        headers["Content-Length"] = str(len(body))
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+        with self._lock:
+            counts = self.stats.setdefault(source or "other", {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def _page(self, source: str, target: str) -> bytes:
+        jans = request_jans(source, target)
+        pages = self.captured.get(source)
+        if pages:
+            return pages[zlib.crc32(" ".join(jans).encode()) % len(pages)]
+        # Per-(source, JAN) misses are deterministic, so retries and batches see the same answer
+        prices = {jan: None if self._misses(source, jan) else self.prices.get(jan) for jan in jans}
+        return synthetic_page(source, prices, self.config.page_kb)
+
+    def _misses(self, source: str, jan: str) -> bool:
+        return zlib.crc32(f"{source}:{jan}".encode()) % 10000 < self.config.miss_rate * 10000
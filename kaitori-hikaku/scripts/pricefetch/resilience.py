@@ -0,0 +1,254 @@
+"""
+Error classification, retry backoff and per-host circuit breaking.
+
+Every search function used to catch Exception, print it and return None, so
+a throttled host looked exactly like "no price" and the fetchers kept
+spending requests on it.  This module gives the sources a shared policy:
+
+  classify()        maps an exception to a kind: timeout, throttled (429),
+                    unavailable (502/503/504), captcha (robot page or 403),
+                    not_cached (offline replay of a page never fetched),
+                    parse, network or http
+  check_blocked()   raises Blocked when a page is a captcha / robot check
+                    instead of results; guard_blocked() does it on a stream
+  backoff_delay()   full-jitter exponential backoff, never shorter than the
+                    server's Retry-After
+  CircuitBreaker    per host: FAILURE_THRESHOLD transient failures in a row
+                    (or one captcha) open the circuit for a cooldown that
+                    doubles on every re-trip; while open the host is skipped
+                    so other sources take the work, then one probe request
+                    decides whether it closes again
+  call_with_retry() the blocking retry loop for the bulk fetcher; the async
+                    fetcher runs the same steps with asyncio.sleep
+"""
+
+import email.utils
+import http.client
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+
+from .cache import CacheMiss
+from .httpclient import HTTPStatusError
+
+# Error kinds
+TIMEOUT = "timeout"
+THROTTLED = "throttled"
+UNAVAILABLE = "unavailable"
+CAPTCHA = "captcha"
+PARSE = "parse"
+NETWORK = "network"
+HTTP_ERROR = "http"
+NOT_CACHED = "not_cached"      # offline mode: the page was never fetched, nothing to parse
+CIRCUIT_OPEN = "circuit_open"  # not an error of the request: it was never sent
+ERROR_KINDS = (TIMEOUT, THROTTLED, UNAVAILABLE, CAPTCHA, PARSE, NETWORK, HTTP_ERROR, NOT_CACHED)
+
+# Kinds worth retrying after a pause; the others fail the attempt at once
+RETRYABLE = {TIMEOUT, THROTTLED, UNAVAILABLE, NETWORK}
+# Kinds that count against the host's circuit (a parse error is our problem, not the host's)
+HOST_FAILURES = RETRYABLE | {CAPTCHA}
+# Kinds after which "no price" means "not asked": the JAN should be retried later, not estimated
+DEFERRING = HOST_FAILURES | {CIRCUIT_OPEN, NOT_CACHED}
+
+MAX_RETRIES = 2
+BACKOFF_BASE = 2.0       # seconds
+BACKOFF_CAP = 60.0       # seconds
+FAILURE_THRESHOLD = 5    # consecutive host failures that open the circuit
+COOLDOWN = 120.0         # seconds the circuit stays open after the first trip
+COOLDOWN_CAP = 1800.0
+
+# Lower-cased markers of robot-check pages, searched in the first BLOCK_SCAN_CHARS
+BLOCK_MARKERS = (
+    "/errors/validatecaptcha",             # Amazon
+    "<title>robot check</title>",          # Amazon (en)
+    "ロボットではありません",                # Amazon (ja)
+    "unusual traffic from your computer",  # Google /sorry/ page
+)
+BLOCK_SCAN_CHARS = 64 * 1024
+
+
+class Blocked(Exception):
+    """The host answered with a captcha / robot check page."""
+
+
+@dataclass
+class FetchError:
+    kind: str
+    message: str
+    retry_after: float | None = None  # seconds, from the Retry-After header
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind in RETRYABLE
+
+
+def retry_after_seconds(headers: dict) -> float | None:
+    """Retry-After (delta seconds or HTTP date) in seconds from now."""
+    value = (headers or {}).get("retry-after")
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def classify(exc: BaseException) -> FetchError:
+    if isinstance(exc, CacheMiss):
+        return FetchError(NOT_CACHED, str(exc))
+    if isinstance(exc, Blocked):
+        return FetchError(CAPTCHA, str(exc))
+    if isinstance(exc, HTTPStatusError):
+        retry_after = retry_after_seconds(exc.headers)
+        if exc.status == 429:
+            return FetchError(THROTTLED, str(exc), retry_after)
+        if exc.status in (502, 503, 504):
+            return FetchError(UNAVAILABLE, str(exc), retry_after)
+        if exc.status == 403:
+            return FetchError(CAPTCHA, str(exc), retry_after)  # bot walls answer 403
+        return FetchError(HTTP_ERROR, str(exc))
+    if isinstance(exc, (socket.timeout, TimeoutError)):
+        return FetchError(TIMEOUT, str(exc) or "timed out")
+    if isinstance(exc, (OSError, http.client.HTTPException)):
+        return FetchError(NETWORK, str(exc))
+    return FetchError(PARSE, f"{type(exc).__name__}: {exc}")
+
+
+def check_blocked(text: str, markers=BLOCK_MARKERS, scan_chars: int = BLOCK_SCAN_CHARS):
+    """Raise Blocked if the head of a page is a robot check."""
+    head = text[:scan_chars].lower()
+    for marker in markers:
+        if marker in head:
+            raise Blocked(f"robot check page ({marker})")
+
+
+def guard_blocked(chunks, markers=BLOCK_MARKERS, scan_chars: int = BLOCK_SCAN_CHARS):
+    """Pass streamed text chunks through check_blocked() until scan_chars were seen."""
+    head = ""
+    try:
+        for chunk in chunks:
+            if len(head) < scan_chars:
+                head += chunk
+                try:
+                    check_blocked(head, markers, scan_chars)
+                except Blocked as e:
+                    # Thrown rather than closed, so HTTPClient.stream() does not cache the robot page
+                    throw = getattr(chunks, "throw", None)
+                    if throw is not None:
+                        try:
+                            throw(e)
+                        except Blocked:
+                            pass
+                    raise
+            yield chunk
+    finally:
+        # Stops the download (and frees the connection) on early exit
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None,
+                  base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Seconds to wait before retry number `attempt` (0-based), with full jitter."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, COOLDOWN_CAP))
+    return delay
+
+
+class CircuitBreaker:
+    """Per-host closed → open → half-open circuit, safe to share between threads."""
+
+    def __init__(self, threshold: int = FAILURE_THRESHOLD, cooldown: float = COOLDOWN,
+                 cooldown_cap: float = COOLDOWN_CAP):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.cooldown_cap = cooldown_cap
+        self._failures: dict[str, int] = {}
+        self._trips: dict[str, int] = {}
+        self._open_until: dict[str, float] = {}
+        self._probing: set[str] = set()
+        self._lock = threading.Lock()
+
+    def allow(self, host: str) -> bool:
+        """May a request go to `host` now?  Half-open lets one probe through."""
+        with self._lock:
+            until = self._open_until.get(host)
+            if until is None:
+                return True
+            if time.monotonic() >= until and host not in self._probing:
+                self._probing.add(host)
+                return True
+            return False
+
+    def success(self, host: str):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._trips.pop(host, None)
+            self._open_until.pop(host, None)
+            self._probing.discard(host)
+
+    def failure(self, host: str, error: FetchError) -> bool:
+        """Record a failed request; returns True if the circuit (re)opened."""
+        if error.kind not in HOST_FAILURES:
+            with self._lock:
+                self._probing.discard(host)
+            return False
+        with self._lock:
+            failures = self._failures[host] = self._failures.get(host, 0) + 1
+            probing = host in self._probing
+            self._probing.discard(host)
+            if not (probing or error.kind == CAPTCHA or failures >= self.threshold):
+                return False
+            trips = self._trips[host] = self._trips.get(host, 0) + 1
+            cooldown = min(self.cooldown * 2 ** (trips - 1), self.cooldown_cap)
+            if error.retry_after is not None:
+                cooldown = max(cooldown, min(error.retry_after, self.cooldown_cap))
+            self._open_until[host] = time.monotonic() + cooldown
+            self._failures[host] = 0
+            return True
+
+    def open_hosts(self) -> dict[str, float]:
+        """{host: seconds until the next probe} for every open circuit."""
+        now = time.monotonic()
+        with self._lock:
+            return {host: max(0.0, until - now) for host, until in self._open_until.items()}
+
+
+class CircuitOpen(Exception):
+    """The host's circuit is open; the request was not sent."""
+
+
+def call_with_retry(fn, host: str, breaker: CircuitBreaker, *args, metrics=None,
+                    retries: int = MAX_RETRIES, sleep=time.sleep):
+    """Call fn(*args) with retries and circuit breaking (blocking version).
+
+    Raises CircuitOpen if the host is open, or the last exception once the
+    error is not retryable or the retries are used up.  Every failure is
+    counted in `metrics` as error_<kind> for the host.
+    """
+    for attempt in range(retries + 1):
+        if not breaker.allow(host):
+            if metrics is not None:
+                metrics.inc("circuit_skipped", 1, host)
+            raise CircuitOpen(host)
+        try:
+            result = fn(*args)
+        except Exception as e:
+            error = classify(e)
+            if metrics is not None:
+                metrics.inc(f"error_{error.kind}", 1, host)
+            opened = breaker.failure(host, error)
+            if opened or not error.retryable or attempt == retries:
+                raise
+            sleep(backoff_delay(attempt, error.retry_after))
+            continue
+        breaker.success(host)
+        return result
@@ -0,0 +1,577 @@
+"""
+Price source plugins and the runner both fetchers share.
+
+The bulk and v2 fetchers each carried their own Amazon and Google scrapers
+with different timeouts, headers and validation, so every improvement had to
+be made twice.  A source is now a PriceSource plugin that declares how it may
+be used:
+
+  rate / burst   requests per second its host tolerates (token bucket)
+  cost           expected requests per lookup, the scheduler's prior until
+                 real counts exist (Google tries a second, name-based query)
+  timeout        seconds before a request is abandoned
+  capabilities   what it can be asked and what it returns: JAN or product
+                 name queries, manufacturer list prices or shop prices
+
+and implements two steps: queries() (the URLs to try, in order, until one
+yields prices) and parse() (streamed page text -> validated candidate
+prices).  register() adds a plugin to REGISTRY under its name.
+
+Sources with the BATCH_QUERY capability also accept several JANs in one
+OR-query: batch_query() builds it for up to batch_size products and
+parse_batch() splits the results page back per JAN.  demultiplex() does the
+splitting for every such source: each price belongs to the nearest JAN or
+model-number mention before it, so one request answers the whole batch.
+
+SourceRunner does everything the sources have in common: browser headers,
+streaming, robot-page checks, retries with backoff, the per-host circuit
+breaker, rate limiting and timing.  lookup() is the asyncio version used by
+fetch-retail-prices-v2.py, lookup_blocking() the sequential one used by
+fetch-retail-prices-bulk.py, and run() feeds work items through a coroutine
+with bounded concurrency.  With batch > 1 the asyncio runner coalesces
+lookups of a batch-capable source: the first product opens a batch and waits
+for the host's rate-limit token, products arriving meanwhile join it, and one
+request is sent for all of them.  Batches fill during the sleeps the limiter
+imposes anyway, so the request count drops by up to the batch factor without
+adding latency.
+"""
+
+import asyncio
+import bisect
+import re
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+
+from .estimate import validate_price
+from .extract import AMAZON_PRICE, KAKAKU_LOWEST, LIST_PRICE, YEN_AMOUNT, has_top_priority, scan_stream
+from .resilience import (
+    CIRCUIT_OPEN, MAX_RETRIES, CircuitBreaker, CircuitOpen, FetchError, backoff_delay, call_with_retry, classify,
+    guard_blocked,
+)
+
+# Capabilities
+JAN_QUERY = "jan"             # can search by JAN code
+NAME_QUERY = "name"           # can search by product name
+LIST_PRICE_RESULT = "list"    # returns the manufacturer list price (定価)
+SHOP_PRICE_RESULT = "shop"    # returns shop prices (the median is used)
+BATCH_QUERY = "batch"         # answers several JANs in one OR-query
+
+DEFAULT_RATE = 1 / 1.5   # requests per second per host
+MEDIAN_SAMPLE = 15       # stop reading a results page after this many valid prices
+ANCHOR_DISTANCE = 3000   # chars after a JAN / model mention whose prices belong to it
+
+# Model numbers in product names (WH-1000XM5, SC-2000): letters and digits mixed
+MODEL_TOKEN = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-/.]{3,}")
+
+# User-Agent rotation
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0",
+]
+_agent_idx = 0
+_END = object()
+
+
+def browser_headers() -> dict:
+    """Request headers of a desktop browser, rotating the User-Agent."""
+    global _agent_idx
+    _agent_idx = (_agent_idx + 1) % len(USER_AGENTS)
+    return {
+        "User-Agent": USER_AGENTS[_agent_idx],
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "ja,en;q=0.9",
+    }
+
+
+def median_price(prices: list[int]) -> int | None:
+    """Median of validated prices (most representative, ignores outliers)."""
+    if not prices:
+        return None
+    prices = sorted(prices)
+    return prices[len(prices) // 2]
+
+
+def enough_for_median(candidates: list, buyback_price: int) -> bool:
+    """Stop reading a results page once MEDIAN_SAMPLE prices pass validation."""
+    valid = sum(1 for c in candidates if not c.near_marker and validate_price(c.price, buyback_price))
+    return valid >= MEDIAN_SAMPLE
+
+
+def model_tokens(name: str) -> list[str]:
+    """Model-number-like words of a product name (must mix letters and digits)."""
+    return [token for token in MODEL_TOKEN.findall(name)
+            if any(ch.isdigit() for ch in token) and any(ch.isalpha() for ch in token)]
+
+
+def demultiplex(text: str, products: list[dict], extractor, distance: int = ANCHOR_DISTANCE) -> dict[str, list]:
+    """Split one results page for several products into {jan: [PriceCandidate]}.
+
+    Anchors are the JAN codes and model numbers of the batch; a key shared by
+    two products of the batch is ambiguous and ignored.  Each price candidate
+    goes to the nearest anchor before it, if that is within `distance` chars;
+    prices before the first anchor (navigation, ads) belong to nobody.
+    """
+    owners = {}  # lower-cased key -> jan, None when ambiguous
+    for product in products:
+        jan = product.get("jan_code", "")
+        for key in (jan, *model_tokens(product.get("name", ""))):
+            key = key.lower()
+            if key:
+                owners[key] = jan if owners.get(key, jan) == jan else None
+    lowered = text.lower()
+    anchors = []
+    for key, jan in owners.items():
+        if jan is None:
+            continue
+        start = lowered.find(key)
+        while start != -1:
+            anchors.append((start, jan))
+            start = lowered.find(key, start + len(key))
+    anchors.sort()
+    offsets = [offset for offset, _ in anchors]
+
+    found = {product.get("jan_code", ""): [] for product in products}
+    for candidate in extractor.scan(text):
+        i = bisect.bisect_right(offsets, candidate.start) - 1
+        if i >= 0 and candidate.start - offsets[i] <= distance:
+            found[anchors[i][1]].append(candidate)
+    return found
+
+
+def batch_candidates(chunks, products: list[dict], extractor, metrics=None, source: str = "") -> dict[str, list]:
+    """Read a batch results page and demultiplex() it, timing the "extract" stage."""
+    text = "".join(chunks)
+    started = time.perf_counter()
+    found = demultiplex(text, products, extractor)
+    if metrics is not None:
+        metrics.observe("extract", time.perf_counter() - started, source)
+    return found
+
+
+# ============================================================
+# Plugin interface and registry
+# ============================================================
+
+class PriceSource:
+    """One price source.  Subclasses set the class attributes and both methods."""
+
+    name = ""
+    label = ""
+    rate = DEFAULT_RATE
+    burst = 1
+    cost = 1.0
+    timeout = 15.0
+    capabilities = frozenset()
+    batch_size = 1  # most JANs one batch_query() may carry (BATCH_QUERY sources)
+
+    def queries(self, product: dict) -> list[str]:
+        """URLs to request in order; the lookup stops at the first that yields prices.
+
+        The first one must be the JAN query: a batch request replaces it.
+        """
+        raise NotImplementedError
+
+    def parse(self, chunks, product: dict, metrics=None) -> list[int]:
+        """Validated candidate prices from a page streamed as text chunks."""
+        raise NotImplementedError
+
+    def batch_query(self, products: list[dict]) -> str:
+        """One URL asking for every product's JAN at once."""
+        raise NotImplementedError
+
+    def parse_batch(self, chunks, products: list[dict], metrics=None) -> dict[str, list[int]]:
+        """{jan: validated candidate prices} from a batch results page."""
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<PriceSource {self.name}>"
+
+
+REGISTRY: dict[str, PriceSource] = {}
+
+
+def register(cls):
+    """Class decorator: add one instance of a PriceSource to REGISTRY."""
+    source = cls()
+    REGISTRY[source.name] = source
+    return cls
+
+
+def get_sources(names) -> dict[str, PriceSource]:
+    """{name: source} for `names` in the given order (KeyError lists the known names)."""
+    unknown = [name for name in names if name not in REGISTRY]
+    if unknown:
+        raise KeyError(f"unknown price source {', '.join(unknown)} (known: {', '.join(REGISTRY)})")
+    return {name: REGISTRY[name] for name in names}
+
+
+def host_rate_limits(sources) -> dict[str, tuple[float, float]]:
+    """{name: (requests per second, burst)} for build_limiters() and the scheduler."""
+    return {source.name: (source.rate, source.burst) for source in sources}
+
+
+def request_costs(sources) -> dict[str, float]:
+    return {source.name: source.cost for source in sources}
+
+
+# ============================================================
+# Sources
+# ============================================================
+
+@register
+class YahooShopping(PriceSource):
+    """Yahoo! Shopping search by JAN code (no API key needed)."""
+
+    name = "yahoo"
+    label = "Yahoo"
+    capabilities = frozenset({JAN_QUERY, SHOP_PRICE_RESULT, BATCH_QUERY})
+    batch_size = 10
+
+    def queries(self, product):
+        return [f"https://shopping.yahoo.co.jp/search?p={product.get('jan_code', '')}"]
+
+    def batch_query(self, products):
+        jans = " OR ".join(product.get("jan_code", "") for product in products)
+        return f"https://shopping.yahoo.co.jp/search?p={urllib.parse.quote(jans)}"
+
+    def parse_batch(self, chunks, products, metrics=None):
+        found = batch_candidates(chunks, products, YEN_AMOUNT, metrics, self.name)
+        return {product["jan_code"]: [c.price for c in found[product["jan_code"]]
+                                      if validate_price(c.price, product.get("buyback_price", 0) or 0)]
+                for product in products}
+
+    def parse(self, chunks, product, metrics=None):
+        bp = product.get("buyback_price", 0) or 0
+        # Every price on the results page, stopping once the median is stable
+        candidates = scan_stream(YEN_AMOUNT, chunks, stop=lambda found: enough_for_median(found, bp),
+                                 metrics=metrics, source=self.name)
+        return [c.price for c in candidates if validate_price(c.price, bp)]
+
+
+@register
+class AmazonSearch(PriceSource):
+    """Amazon.co.jp search by JAN code, new items only."""
+
+    name = "amazon"
+    label = "Amazon"
+    capabilities = frozenset({JAN_QUERY, SHOP_PRICE_RESULT})
+
+    def queries(self, product):
+        return [f"https://www.amazon.co.jp/s?k={product.get('jan_code', '')}"]
+
+    def parse(self, chunks, product, metrics=None):
+        bp = product.get("buyback_price", 0) or 0
+        # Skip prices near used/parts indicators
+        candidates = scan_stream(AMAZON_PRICE, chunks, stop=lambda found: enough_for_median(found, bp),
+                                 metrics=metrics, source=self.name)
+        return [c.price for c in candidates if not c.near_marker and validate_price(c.price, bp)]
+
+
+@register
+class GoogleSearch(PriceSource):
+    """定価 snippets from a Google search: JAN code first, then the product name."""
+
+    name = "google"
+    label = "Google"
+    cost = 1.5
+    timeout = 20.0
+    capabilities = frozenset({JAN_QUERY, NAME_QUERY, LIST_PRICE_RESULT, BATCH_QUERY})
+    batch_size = 8  # Google ignores words past 32; each JAN plus its OR is two
+
+    def queries(self, product):
+        texts = [f"{product.get('jan_code', '')} 定価 メーカー希望小売価格"]
+        if product.get("name"):
+            texts.append(f"{product['name'][:40]} 定価")
+        return [f"https://www.google.com/search?q={urllib.parse.quote(text)}&hl=ja" for text in texts]
+
+    def parse(self, chunks, product, metrics=None):
+        price = LIST_PRICE.best(scan_stream(LIST_PRICE, chunks, stop=has_top_priority,
+                                            metrics=metrics, source=self.name))
+        return [price] if price and validate_price(price, product.get("buyback_price", 0) or 0) else []
+
+    def batch_query(self, products):
+        text = " OR ".join(product.get("jan_code", "") for product in products) + " 定価"
+        return f"https://www.google.com/search?q={urllib.parse.quote(text)}&hl=ja"
+
+    def parse_batch(self, chunks, products, metrics=None):
+        found = batch_candidates(chunks, products, LIST_PRICE, metrics, self.name)
+        prices = {}
+        for product in products:
+            price = LIST_PRICE.best(found[product["jan_code"]])
+            valid = price and validate_price(price, product.get("buyback_price", 0) or 0)
+            prices[product["jan_code"]] = [price] if valid else []
+        return prices
+
+
+@register
+class Kakaku(PriceSource):
+    """kakaku.com search results: the list price, else the lowest shop price."""
+
+    name = "kakaku"
+    label = "Kakaku"
+    capabilities = frozenset({JAN_QUERY, LIST_PRICE_RESULT, SHOP_PRICE_RESULT})
+
+    def queries(self, product):
+        return [f"https://kakaku.com/search_results/{product.get('jan_code', '')}/"]
+
+    def parse(self, chunks, product, metrics=None):
+        html = "".join(chunks)
+        started = time.perf_counter()
+        price = LIST_PRICE.first(html) or KAKAKU_LOWEST.first(html)
+        if metrics is not None:
+            metrics.observe("extract", time.perf_counter() - started, self.name)
+        return [price] if price and validate_price(price, product.get("buyback_price", 0) or 0) else []
+
+
+# ============================================================
+# Runner
+# ============================================================
+
+@dataclass
+class _Batch:
+    """Products waiting for one batch request to a source."""
+    products: list = field(default_factory=list)
+    waiters: list = field(default_factory=list)  # futures, one per product
+
+
+class SourceRunner:
+    """Runs lookups against PriceSource plugins with the shared request policy.
+
+    Every lookup returns (candidate prices, requests made, seconds spent,
+    FetchError or None).  Seconds cover the requests themselves, not limiter
+    waits or backoff sleeps, so the scheduler's latency statistics stay
+    comparable between runs with different rates.  A batched lookup counts
+    its share of the batch request (1/N).
+    """
+
+    def __init__(self, http, metrics=None, breaker: CircuitBreaker | None = None,
+                 headers=browser_headers, retries: int = MAX_RETRIES, batch: int = 1):
+        self.http = http
+        self.metrics = metrics
+        self.breaker = breaker or CircuitBreaker()
+        self.headers = headers
+        self.retries = retries
+        self.batch = batch
+        self._batches: dict[str, _Batch] = {}  # source -> batch still accepting products
+        self._sending = set()
+
+    def batch_size(self, source: PriceSource) -> int:
+        """Products one request to `source` may carry (1 = no batching)."""
+        if BATCH_QUERY not in source.capabilities:
+            return 1
+        return max(1, min(self.batch, source.batch_size))
+
+    def fetch(self, source: PriceSource, url: str, product: dict) -> list[int]:
+        """One request, parsed while it streams (errors propagate)."""
+        chunks = guard_blocked(self.http.stream(url, headers=self.headers(), timeout=source.timeout))
+        return source.parse(chunks, product, self.metrics)
+
+    def fetch_batch(self, source: PriceSource, products: list[dict]) -> dict[str, list[int]]:
+        """One batch request for `products`, split per JAN (errors propagate).
+
+        A batch that closed with a single product sends that product's plain
+        JAN query instead, parsed exactly as without batching.
+        """
+        if len(products) == 1:
+            product = products[0]
+            return {product.get("jan_code", ""): self.fetch(source, source.queries(product)[0], product)}
+        url = source.batch_query(products)
+        chunks = guard_blocked(self.http.stream(url, headers=self.headers(), timeout=source.timeout))
+        return source.parse_batch(chunks, products, self.metrics)
+
+    def _timed(self, name: str, fn, *args) -> tuple:
+        """(fn(*args), seconds), recorded as the "search" stage."""
+        started = time.perf_counter()
+        try:
+            return fn(*args), time.perf_counter() - started
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe("search", time.perf_counter() - started, name)
+
+    # -- asyncio --------------------------------------------------------
+
+    async def _request(self, name: str, limiters: dict, fn, *args, on_token=None) -> tuple:
+        """fn(*args) in a thread, behind the source's circuit breaker and limiter.
+
+        Transient errors (timeouts, 429, 503, network) are retried with
+        jittered exponential backoff that honours Retry-After; captcha pages
+        and repeated failures open the host's circuit, after which requests
+        are not sent until the cooldown ends.  on_token() runs once the first
+        rate-limit token is taken.  Returns (result or None, requests,
+        seconds, error).
+        """
+        requests = 0
+        total = 0.0
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow(name):
+                self._inc("circuit_skipped", name)
+                return None, requests, total, FetchError(CIRCUIT_OPEN, "circuit open")
+            await self._wait(limiters, name)
+            if on_token is not None and attempt == 0:
+                on_token()
+            requests += 1
+            started = time.perf_counter()
+            try:
+                result, seconds = await asyncio.to_thread(self._timed, name, fn, *args)
+            except Exception as e:
+                total += time.perf_counter() - started
+                error = classify(e)
+                self._inc(f"error_{error.kind}", name)
+                opened = self.breaker.failure(name, error)
+                if opened or not error.retryable or attempt == self.retries:
+                    return None, requests, total, error
+                await self._backoff(name, backoff_delay(attempt, error.retry_after))
+                continue
+            self.breaker.success(name)
+            return result, requests, total + seconds, None
+
+    async def request(self, source: PriceSource, url: str, product: dict, limiters: dict) -> tuple:
+        """One URL for one product; see _request()."""
+        prices, requests, seconds, error = await self._request(source.name, limiters, self.fetch,
+                                                               source, url, product)
+        return prices or [], requests, seconds, error
+
+    async def lookup(self, source: PriceSource, product: dict, limiters: dict) -> tuple:
+        """Try the source's queries in order until one yields prices or fails.
+
+        For a batching source the JAN query goes out as part of a batch first.
+        A batch page can miss a product (capped result list, listings without
+        the JAN, prices too far from their anchor), so a product the batch found
+        nothing for still gets its own JAN query before the remaining queries
+        (Google's product-name search).
+        """
+        queries = source.queries(product)
+        requests = 0
+        total = 0.0
+        if self.batch_size(source) > 1:
+            prices, requests, total, error, batched = await self._join_batch(source, product, limiters)
+            if prices or error:
+                return prices, requests, total, error
+            if batched == 1:
+                queries = queries[1:]  # the batch was this product's plain JAN query
+            else:
+                self._inc("batch_fallbacks", source.name)
+        for url in queries:
+            prices, used, seconds, error = await self.request(source, url, product, limiters)
+            requests += used
+            total += seconds
+            if prices or error:
+                return prices, requests, total, error
+        return [], requests, total, None
+
+    async def _join_batch(self, source: PriceSource, product: dict, limiters: dict) -> tuple:
+        """Add a product to the source's open batch (opening one if needed) and await its share."""
+        name = source.name
+        batch = self._batches.get(name)
+        if batch is None or len(batch.products) >= self.batch_size(source):
+            batch = self._batches[name] = _Batch()
+            task = asyncio.ensure_future(self._send_batch(source, batch, limiters))
+            self._sending.add(task)  # the loop only keeps weak references to tasks
+            task.add_done_callback(self._sending.discard)
+        waiter = asyncio.get_running_loop().create_future()
+        batch.products.append(product)
+        batch.waiters.append(waiter)
+        return await waiter
+
+    async def _send_batch(self, source: PriceSource, batch: _Batch, limiters: dict):
+        name = source.name
+
+        def close():
+            # Products arriving from now on open the next batch
+            if self._batches.get(name) is batch:
+                del self._batches[name]
+
+        try:
+            await asyncio.sleep(0)  # products started in the same tick join before the first token
+            found, requests, seconds, error = await self._request(name, limiters, self.fetch_batch,
+                                                                  source, batch.products, on_token=close)
+        except Exception as e:
+            close()
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        close()
+        count = len(batch.products)
+        if error is None and count > 1:
+            self._inc("batch_requests", name)
+            if self.metrics is not None:
+                self.metrics.inc("batched_lookups", count, name)
+        for product, waiter in zip(batch.products, batch.waiters):
+            if not waiter.done():
+                prices = (found or {}).get(product.get("jan_code", ""), [])
+                waiter.set_result((prices, requests / count, seconds, error, count))
+
+    async def run(self, items, fn, concurrency: int):
+        """Yield (item, await fn(item)) as they finish, at most `concurrency` at once.
+
+        Items are taken from the iterable only as slots free up, so a long
+        work list never turns into thousands of waiting tasks.
+        """
+        items = iter(items)
+        in_flight = set()
+        exhausted = False
+
+        async def tagged(item):
+            return item, await fn(item)
+
+        while True:
+            while not exhausted and len(in_flight) < max(1, concurrency):
+                item = next(items, _END)
+                if item is _END:
+                    exhausted = True
+                else:
+                    in_flight.add(asyncio.ensure_future(tagged(item)))
+            if not in_flight:
+                return
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+
+    async def _wait(self, limiters: dict, name: str):
+        """Take a token from the source's host limiter, timing the wait."""
+        started = time.perf_counter()
+        await limiters[name].acquire()
+        if self.metrics is not None:
+            self.metrics.observe("wait", time.perf_counter() - started, name)
+
+    async def _backoff(self, name: str, seconds: float):
+        started = time.perf_counter()
+        await asyncio.sleep(seconds)
+        if self.metrics is not None:
+            self.metrics.observe("backoff", time.perf_counter() - started, name)
+
+    # -- blocking -------------------------------------------------------
+
+    def lookup_blocking(self, source: PriceSource, product: dict, sleep=time.sleep) -> tuple:
+        """lookup() for sequential callers (never batched); `sleep` is used for retry backoff."""
+        requests = 0
+        total = 0.0
+
+        def attempt(url):
+            nonlocal requests, total
+            requests += 1
+            started = time.perf_counter()
+            try:
+                prices, _ = self._timed(source.name, self.fetch, source, url, product)
+                return prices
+            finally:
+                total += time.perf_counter() - started
+
+        for url in source.queries(product):
+            try:
+                prices = call_with_retry(attempt, source.name, self.breaker, url, metrics=self.metrics,
+                                         retries=self.retries, sleep=sleep)
+            except CircuitOpen:
+                return [], requests, total, FetchError(CIRCUIT_OPEN, "circuit open")
+            except Exception as e:
+                return [], requests, total, classify(e)
+            if prices:
+                return prices, requests, total, None
+        return [], requests, total, None
+
+    def _inc(self, name: str, source: str):
+        if self.metrics is not None:
+            self.metrics.inc(name, 1, source)
@@ -0,0 +1,180 @@
+"""
+SQLite-backed product and retail price store for the Python tools.
+
+products.json is ~2.4 MB and every fetcher run used to json.load it, filter
+`retail_price is None` and sort by buyback price in Python.  ProductStore keeps
+an indexed copy in data/price_store.sqlite:
+
+  products       one row per product; the original JSON object is kept in
+                 `data` so exports reproduce products.json exactly
+  retail_prices  found prices (same fields as retail_prices_found.json, plus
+                 the consensus confidence when --consensus chose the price)
+
+products.json is only re-imported when its size or mtime changes, so normal
+startup is a single indexed query.  Exports write the existing JSON shapes on
+demand, which makes the ad-hoc products.*.backup.json copies unnecessary.
+"""
+
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+DEFAULT_STORE_PATH = Path(__file__).parent.parent.parent / "data" / "price_store.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id            INTEGER PRIMARY KEY,
+    jan_code      TEXT,
+    name          TEXT NOT NULL DEFAULT '',
+    category      TEXT NOT NULL DEFAULT '',
+    retail_price  INTEGER,
+    buyback_price INTEGER NOT NULL DEFAULT 0,
+    position      INTEGER NOT NULL,
+    data          TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_products_jan ON products (jan_code);
+CREATE INDEX IF NOT EXISTS idx_products_category ON products (category);
+CREATE INDEX IF NOT EXISTS idx_products_buyback ON products (buyback_price);
+CREATE INDEX IF NOT EXISTS idx_products_null_retail
+    ON products (buyback_price DESC, position) WHERE retail_price IS NULL;
+
+CREATE TABLE IF NOT EXISTS retail_prices (
+    jan_code      TEXT PRIMARY KEY,
+    retail_price  INTEGER NOT NULL,
+    source        TEXT NOT NULL,
+    product_name  TEXT NOT NULL DEFAULT '',
+    confidence    REAL,
+    data          TEXT NOT NULL,
+    updated_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_retail_prices_source ON retail_prices (source);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class ProductStore:
+    def __init__(self, path: Path = DEFAULT_STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(_SCHEMA)
+        self._migrate()
+
+    def close(self):
+        self.db.close()
+
+    def _migrate(self):
+        """Add columns introduced after a store file was created."""
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(retail_prices)")}
+        if "confidence" not in columns:
+            with self.db:
+                self.db.execute("ALTER TABLE retail_prices ADD COLUMN confidence REAL")
+
+    # -- meta -----------------------------------------------------------
+
+    def _get_meta(self, key: str) -> str | None:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # -- products -------------------------------------------------------
+
+    def sync_products(self, products_json: Path) -> bool:
+        """Re-import products.json if it changed since the last import.
+
+        Returns True when the file was parsed.
+        """
+        products_json = Path(products_json)
+        st = products_json.stat()
+        stamp = f"{st.st_size}:{st.st_mtime_ns}"
+        if self._get_meta("products_json_stamp") == stamp:
+            return False
+        with open(products_json, "r", encoding="utf-8") as f:
+            products = json.load(f)
+        with self.db:
+            self.db.execute("DELETE FROM products")
+            self.db.executemany(
+                "INSERT INTO products (jan_code, name, category, retail_price, buyback_price, position, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (p.get("jan_code") or None, p.get("name", ""), p.get("category", ""),
+                     p.get("retail_price"), p.get("buyback_price", 0) or 0, i,
+                     json.dumps(p, ensure_ascii=False))
+                    for i, p in enumerate(products)
+                ),
+            )
+            self._set_meta("products_json_stamp", stamp)
+        return True
+
+    def count_null_retail(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM products WHERE retail_price IS NULL").fetchone()[0]
+
+    def null_retail_products(self, offset: int = 0, limit: int = -1) -> list[dict]:
+        """Products without a retail price, highest buyback price first."""
+        rows = self.db.execute(
+            "SELECT data FROM products WHERE retail_price IS NULL "
+            "ORDER BY buyback_price DESC, position LIMIT ? OFFSET ?",
+            (limit, offset))
+        return [json.loads(data) for (data,) in rows]
+
+    def products_in_category(self, category: str) -> list[dict]:
+        rows = self.db.execute("SELECT data FROM products WHERE category = ? ORDER BY position", (category,))
+        return [json.loads(data) for (data,) in rows]
+
+    def products_with_jan(self) -> list[dict]:
+        rows = self.db.execute("SELECT data FROM products WHERE jan_code IS NOT NULL AND jan_code != '' "
+                               "ORDER BY position")
+        return [json.loads(data) for (data,) in rows]
+
+    def product_by_jan(self, jan_code: str) -> dict | None:
+        row = self.db.execute("SELECT data FROM products WHERE jan_code = ?", (jan_code,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # -- retail prices --------------------------------------------------
+
+    def upsert_retail_prices(self, prices: dict):
+        """Insert or replace {jan: entry} found prices in one transaction."""
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO retail_prices (jan_code, retail_price, source, product_name, confidence, data, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (jan_code) DO UPDATE SET retail_price = excluded.retail_price, "
+                "source = excluded.source, product_name = excluded.product_name, "
+                "confidence = excluded.confidence, data = excluded.data, updated_at = excluded.updated_at",
+                (
+                    (jan, entry["retail_price"], entry.get("source", ""), entry.get("product_name", ""),
+                     entry.get("confidence"), json.dumps(entry, ensure_ascii=False), now)
+                    for jan, entry in prices.items()
+                ),
+            )
+
+    def retail_prices(self) -> dict:
+        rows = self.db.execute("SELECT jan_code, data FROM retail_prices ORDER BY rowid")
+        return {jan: json.loads(data) for jan, data in rows}
+
+    def source_counts(self) -> dict:
+        rows = self.db.execute("SELECT source, COUNT(*) FROM retail_prices GROUP BY source")
+        return dict(rows.fetchall())
+
+    # -- export ---------------------------------------------------------
+
+    def export_products_json(self, path: Path):
+        """Write products in the products.json list format."""
+        rows = self.db.execute("SELECT data FROM products ORDER BY position")
+        products = [json.loads(data) for (data,) in rows]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(products, f, ensure_ascii=False, indent=2)
+
+    def export_retail_prices_json(self, path: Path):
+        """Write found prices in the retail_prices_found.json dict format."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.retail_prices(), f, ensure_ascii=False, indent=2)
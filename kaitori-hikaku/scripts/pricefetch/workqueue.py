@@ -0,0 +1,166 @@
+"""
+Durable per-JAN work queue for the retail price fetchers.
+
+`--start N` used to be an offset into the null-retail list, which is
+re-sorted on every run, so after products.json changed the offset pointed at
+different products and overnight runs skipped or repeated work.  WorkQueue
+keeps one row per JAN in the work_queue table of data/price_store.sqlite:
+
+    pending    waiting to be fetched
+    in_flight  claimed by a run; reset to pending by recover() after a crash,
+               or by release() when the JAN was never asked (offline cache miss)
+    done       a price was fetched (an estimate leaves the JAN failed)
+    failed     no price; retried after next_retry with exponential backoff
+               (BACKOFF_BASE × 2^(attempts-1), at most BACKOFF_MAX)
+
+enqueue() adds new JANs and refreshes the priority of waiting ones without
+touching their state, so re-running resumes where the last run stopped and
+a JAN that keeps failing backs off instead of being retried every night.
+A done JAN that is enqueued again (its saved price was deleted or the store
+was rebuilt) goes back to pending with a fresh retry schedule.
+Every state change is committed immediately; workers of a sharded run open
+their own connection to the same file.
+"""
+
+import sqlite3
+import time
+from pathlib import Path
+
+from .store import DEFAULT_STORE_PATH
+
+BACKOFF_BASE = 6 * 3600        # seconds before the first retry
+BACKOFF_MAX = 14 * 24 * 3600   # retries are at least this often
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+STATES = (PENDING, IN_FLIGHT, DONE, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_queue (
+    queue       TEXT NOT NULL,
+    jan_code    TEXT NOT NULL,
+    priority    REAL NOT NULL,            -- lower runs first
+    state       TEXT NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    next_retry  REAL NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    updated_at  REAL NOT NULL,
+    PRIMARY KEY (queue, jan_code)
+);
+CREATE INDEX IF NOT EXISTS idx_work_queue_ready ON work_queue (queue, state, priority);
+"""
+
+
+class WorkQueue:
+    """Named queue of JANs with per-JAN state, retry count and next-retry time."""
+
+    def __init__(self, path: Path = DEFAULT_STORE_PATH, name: str = "missing"):
+        self.path = Path(path)
+        self.name = name
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def enqueue(self, jan_codes: list[str]) -> int:
+        """Add JANs in priority order (first = most urgent); returns how many
+        were new or re-queued.
+
+        JANs already queued keep their state and retry schedule; only the
+        priority of waiting ones follows the new order.  `jan_codes` are the
+        JANs still without a price, so done ones listed again are reset to
+        pending.  Waiting JANs missing from `jan_codes` (the product got a
+        price elsewhere or was removed) are dropped.
+        """
+        now = time.time()
+        existing = {jan for (jan,) in self.db.execute(
+            "SELECT jan_code FROM work_queue WHERE queue = ? AND state != ?", (self.name, DONE))}
+        waiting = {jan for (jan,) in self.db.execute(
+            "SELECT jan_code FROM work_queue WHERE queue = ? AND state IN (?, ?)", (self.name, PENDING, FAILED))}
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM work_queue WHERE queue = ? AND jan_code = ?",
+                ((self.name, jan) for jan in waiting - set(jan_codes)))
+            self.db.executemany(
+                "INSERT INTO work_queue (queue, jan_code, priority, state, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (queue, jan_code) DO UPDATE SET priority = excluded.priority, "
+                "state = CASE WHEN state = 'done' THEN excluded.state ELSE state END, "
+                "attempts = CASE WHEN state = 'done' THEN 0 ELSE attempts END, "
+                "next_retry = CASE WHEN state = 'done' THEN 0 ELSE next_retry END, "
+                "last_error = CASE WHEN state = 'done' THEN NULL ELSE last_error END, "
+                "updated_at = CASE WHEN state = 'done' THEN excluded.updated_at ELSE updated_at END "
+                "WHERE state IN ('pending', 'failed', 'done')",
+                ((self.name, jan, i, PENDING, now) for i, jan in enumerate(jan_codes)),
+            )
+        return len(set(jan_codes) - existing)
+
+    def recover(self) -> int:
+        """Return JANs left in flight by a crashed or killed run to pending."""
+        with self.db:
+            cursor = self.db.execute(
+                "UPDATE work_queue SET state = ?, updated_at = ? WHERE queue = ? AND state = ?",
+                (PENDING, time.time(), self.name, IN_FLIGHT))
+        return cursor.rowcount
+
+    def release(self, jan_code: str):
+        """Return a claimed JAN to pending without counting an attempt (it was never asked)."""
+        with self.db:
+            self.db.execute(
+                "UPDATE work_queue SET state = ?, updated_at = ? WHERE queue = ? AND jan_code = ? AND state = ?",
+                (PENDING, time.time(), self.name, jan_code, IN_FLIGHT))
+
+    def claim(self, limit: int = -1) -> list[str]:
+        """Mark up to `limit` ready JANs in flight and return them, most urgent first.
+
+        Ready means pending, or failed with next_retry in the past.
+        """
+        now = time.time()
+        with self.db:
+            jans = [jan for (jan,) in self.db.execute(
+                "SELECT jan_code FROM work_queue WHERE queue = ? "
+                "AND (state = ? OR (state = ? AND next_retry <= ?)) "
+                "ORDER BY priority LIMIT ?",
+                (self.name, PENDING, FAILED, now, limit))]
+            self.db.executemany(
+                "UPDATE work_queue SET state = ?, updated_at = ? WHERE queue = ? AND jan_code = ?",
+                ((IN_FLIGHT, now, self.name, jan) for jan in jans))
+        return jans
+
+    def done(self, jan_code: str):
+        with self.db:
+            self.db.execute(
+                "UPDATE work_queue SET state = ?, last_error = NULL, updated_at = ? WHERE queue = ? AND jan_code = ?",
+                (DONE, time.time(), self.name, jan_code))
+
+    def fail(self, jan_code: str, error: str = ""):
+        """Record a failed attempt and schedule the retry."""
+        now = time.time()
+        with self.db:
+            self.db.execute(
+                "UPDATE work_queue SET state = ?, attempts = attempts + 1, "
+                "next_retry = ? + MIN(? * (1 << attempts), ?), last_error = ?, updated_at = ? "
+                "WHERE queue = ? AND jan_code = ?",
+                (FAILED, now, BACKOFF_BASE, BACKOFF_MAX, error, now, self.name, jan_code))
+
+    def counts(self) -> dict[str, int]:
+        """{state: JANs}, with every state present."""
+        counts = dict.fromkeys(STATES, 0)
+        counts.update(self.db.execute(
+            "SELECT state, COUNT(*) FROM work_queue WHERE queue = ? GROUP BY state", (self.name,)))
+        return counts
+
+    def waiting_retry(self) -> int:
+        """Failed JANs whose next retry is still in the future."""
+        return self.db.execute(
+            "SELECT COUNT(*) FROM work_queue WHERE queue = ? AND state = ? AND next_retry > ?",
+            (self.name, FAILED, time.time())).fetchone()[0]
+
+    def reset(self):
+        """Forget every JAN of this queue (the next enqueue starts over)."""
+        with self.db:
+            self.db.execute("DELETE FROM work_queue WHERE queue = ?", (self.name,))
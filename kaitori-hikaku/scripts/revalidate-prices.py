@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Re-validate every saved retail price in one vectorised pass (requires numpy).
+
+Loads products.json and retail_prices_found.json, applies the fetchers'
+return-rate rules to the whole catalog and flags suspicious rows.  Use it to
+see what a threshold change would reject before re-running a fetcher.
+
+Usage:
+  python scripts/revalidate-prices.py                       # Summary with current thresholds
+  python scripts/revalidate-prices.py --min-rate 0.15       # Try a stricter lower bound
+  python scripts/revalidate-prices.py --show 30             # List the first 30 invalid rows
+  python scripts/revalidate-prices.py --json logs/flags.json  # Write every flagged row
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+from pricefetch.batch import INVALID, FLAG_NAMES, CatalogArrays, check_catalog, flag_names, np
+from pricefetch.calibrate import load_calibration
+from pricefetch.estimate import MAX_RETURN_RATE, MIN_RETURN_RATE
+
+# Fix Windows console encoding
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+
+PRODUCTS_JSON = Path(__file__).parent.parent / "data" / "json" / "products.json"
+RETAIL_PRICES_JSON = Path(__file__).parent.parent / "data" / "json" / "retail_prices_found.json"
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Re-validate saved retail prices")
+    parser.add_argument("--min-rate", type=float, default=MIN_RETURN_RATE, help="Lowest accepted buyback/retail rate")
+    parser.add_argument("--max-rate", type=float, default=MAX_RETURN_RATE, help="Highest accepted buyback/retail rate")
+    parser.add_argument("--spread", type=float, default=2.0, help="Flag prices beyond x/÷ this factor of the ratio estimate")
+    parser.add_argument("--show", type=int, default=0, help="Print the first N invalid rows")
+    parser.add_argument("--json", type=Path, help="Write flagged rows to this file")
+    args = parser.parse_args()
+
+    if np is None:
+        print("numpy がインストールされていません（pip install numpy）", file=sys.stderr)
+        sys.exit(1)
+
+    with open(PRODUCTS_JSON, "r", encoding="utf-8") as f:
+        products = json.load(f)
+    found_prices = {}
+    if RETAIL_PRICES_JSON.exists():
+        with open(RETAIL_PRICES_JSON, "r", encoding="utf-8") as f:
+            found_prices = json.load(f)
+
+    # Estimates use the fitted ratios when calibrate-ratios.py has run
+    calibration = load_calibration()
+    ratios = calibration.ratio_table() if calibration is not None else None
+
+    started = time.perf_counter()
+    catalog = CatalogArrays.load(products, found_prices, ratios=ratios)
+    loaded = time.perf_counter()
+    result = check_catalog(catalog, min_rate=args.min_rate, max_rate=args.max_rate, spread=args.spread)
+    checked = time.perf_counter()
+
+    print("========================================")
+    print("  定価の一括再検証")
+    print("========================================\n")
+    print(f"  商品数: {len(catalog)}  (読込 {(loaded - started) * 1000:.1f}ms / 検証 {(checked - loaded) * 1000:.1f}ms)")
+    print(f"  返却率の範囲: {args.min_rate:.2f} - {args.max_rate:.2f}")
+    print(f"  推定比率: {'較正済み v' + calibration.version if calibration else '固定テーブル'}")
+    print(f"  有効: {int(result.valid.sum())}件")
+    print(f"  無効: {int(np.count_nonzero(result.flags & INVALID))}件\n")
+    for bit, name in FLAG_NAMES.items():
+        print(f"    {name:<18} {result.count(bit)}件")
+
+    invalid_rows = result.rows(result.flags & INVALID)
+    if len(invalid_rows):
+        print(f"\n  ソース別（無効）:")
+        by_source = {}
+        for i in invalid_rows:
+            by_source[catalog.source[i]] = by_source.get(catalog.source[i], 0) + 1
+        for source, count in sorted(by_source.items(), key=lambda item: -item[1]):
+            print(f"    {source or '(なし)'}: {count}件")
+
+    for i in invalid_rows[:args.show]:
+        print(f"  {catalog.jan[i]}  {catalog.category[i]:<12} 買取 {catalog.buyback[i]:>8,}  "
+              f"定価 {catalog.retail[i]:>10,.0f}  推定 {result.estimate[i]:>10,.0f}  "
+              f"{','.join(flag_names(int(result.flags[i])))}")
+
+    if args.json:
+        flagged = [
+            {
+                "jan_code": catalog.jan[i],
+                "category": catalog.category[i],
+                "buyback_price": int(catalog.buyback[i]),
+                "retail_price": None if np.isnan(catalog.retail[i]) else int(catalog.retail[i]),
+                "source": catalog.source[i],
+                "estimate": None if np.isnan(result.estimate[i]) else int(result.estimate[i]),
+                "flags": flag_names(int(result.flags[i])),
+            }
+            for i in result.rows(result.flags != 0)
+        ]
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(flagged, f, ensure_ascii=False, indent=2)
+        print(f"\n  出力: {args.json} ({len(flagged)}件)")
+    print()
+
+
+if __name__ == "__main__":
+    main()
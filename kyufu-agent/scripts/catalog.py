@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+給付金カタログの地域インデックス
+
+全国の市区町村の給付金（数万件）を扱えるように、カタログを
+地方公共団体コードの階層（全国 → 都道府県 → 市区町村）とカテゴリで索引します。
+プロファイルは住所に当てはまる可能性のある給付金だけを評価します。
+
+  RegionTable    都道府県名・市区町村名 → コード（config/municipalities.json）
+  CatalogIndex   コード → 給付金, カテゴリ → 給付金
+  CatalogIndex.candidates(features) → 住所に当てはまりうる給付金（カタログ順）
+
+給付金の地域は次の順で決まります。
+  1. 給付金の "region_codes"（["13113"] など。[] は全国）
+  2. 要件の「渋谷区在住」「東京23区在住」など → 市区町村コード
+     （都道府県は同じ給付金の「東京都在住」かカタログの target_area から）
+  3. 要件の「東京都在住」など → 都道府県コード
+  4. どれもなければ全国
+コードに変換できない地名は全国に入れます。
+
+Rule は都道府県名・市区町村名だけで判定する（CityRule は都道府県を見ない）ので、
+プロファイル側は都道府県のコードに加えて、市区町村名が同じすべての
+市区町村コードを引きます（都道府県が空・不一致でも同じ）。これにより、索引を
+使っても使わなくても判定結果は同じになります（最終判定は従来どおり Rule で行う）。
+"""
+
+from collections import defaultdict
+
+from eligibility import CityRule, CompiledSubsidy, PrefectureRule, ProfileFeatures, compile_catalog, compile_subsidy
+
+NATIONWIDE = ""  # 全国共通の給付金のコード
+
+
+class RegionTable:
+    """地方公共団体コード表（都道府県2桁・市区町村5桁）"""
+
+    def __init__(self, prefectures: dict[str, str], municipalities: dict[str, dict[str, str]]):
+        self.prefectures = prefectures
+        self.municipalities = municipalities
+        self._by_city_name: dict[str, list[str]] = defaultdict(list)
+        for cities in municipalities.values():
+            for city, code in cities.items():
+                self._by_city_name[city].append(code)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RegionTable":
+        return cls(data.get("prefectures", {}), data.get("municipalities", {}))
+
+    def prefecture_code(self, prefecture: str) -> str:
+        return self.prefectures.get(prefecture, "")
+
+    def municipality_code(self, prefecture: str, city: str) -> str:
+        """市区町村名は都道府県ごとに引く（北区・府中市などは複数の都道府県にある）"""
+        return self.municipalities.get(self.prefecture_code(prefecture), {}).get(city, "")
+
+    def municipality_codes_named(self, city: str) -> list[str]:
+        """名前が city のすべての市区町村コード（都道府県を問わない）"""
+        return self._by_city_name.get(city, [])
+
+
+def subsidy_regions(compiled: CompiledSubsidy, table: RegionTable, default_prefecture: str = "") -> frozenset[str]:
+    """給付金が当てはまりうる地域のコード"""
+    explicit = compiled.subsidy.get("region_codes")
+    if explicit is not None:
+        return frozenset(explicit) or frozenset({NATIONWIDE})
+
+    prefectures = [rule.prefecture for rule in compiled.rules if isinstance(rule, PrefectureRule)]
+    city_rules = [rule for rule in compiled.rules if isinstance(rule, CityRule)]
+    prefecture = prefectures[0] if prefectures else default_prefecture
+    prefecture_code = table.prefecture_code(prefecture)
+
+    if city_rules:
+        # 要件はすべて満たす必要があるので、市区町村は共通部分だけ
+        cities = frozenset.intersection(*(rule.cities for rule in city_rules))
+        codes = {table.municipality_code(prefecture, city) for city in cities}
+        if codes and "" not in codes:
+            return frozenset(codes)
+    # 都道府県の枠に入れるのは「東京都在住」などの要件があるときだけ
+    # （市区町村の要件だけなら、別の都道府県の住所でも Rule は通る）
+    if prefecture_code and prefectures:
+        return frozenset({prefecture_code})
+    return frozenset({NATIONWIDE})
+
+
+class CatalogIndex:
+    """地域コードとカテゴリで引けるコンパイル済みカタログ"""
+
+    def __init__(self, catalog: list[CompiledSubsidy], table: RegionTable, default_prefecture: str = ""):
+        self.catalog = catalog
+        self.table = table
+        self._by_region: dict[str, list[int]] = defaultdict(list)
+        self._by_id: dict[str, int] = {}
+        self._by_category: dict[str, set[int]] = defaultdict(set)
+        for position, compiled in enumerate(catalog):
+            for code in subsidy_regions(compiled, table, default_prefecture):
+                self._by_region[code].append(position)
+            self._by_category[compiled.subsidy.get("category", "")].add(position)
+            self._by_id[compiled.id] = position
+
+    def __len__(self) -> int:
+        return len(self.catalog)
+
+    @property
+    def categories(self) -> list[str]:
+        return sorted(self._by_category)
+
+    def region_codes(self, f: ProfileFeatures) -> tuple[str, ...]:
+        """
+        住所のコード（全国, 都道府県, 同名の市区町村すべて）。不明な階層は省く
+        CityRule は市区町村名だけで判定するので、都道府県が空・不一致でも同名の市区町村を含める
+        """
+        codes = [NATIONWIDE]
+        prefecture_code = self.table.prefecture_code(f.prefecture)
+        if prefecture_code:
+            codes.append(prefecture_code)
+        codes.extend(self.table.municipality_codes_named(f.city))
+        return tuple(codes)
+
+    def candidates(self, f: ProfileFeatures, categories: list[str] | None = None,
+                   include_ids=()) -> list[CompiledSubsidy]:
+        """
+        住所（とカテゴリ）に当てはまりうる給付金をカタログ順に返す
+        include_ids の給付金（申請済みなど）は住所に関係なく含める
+        """
+        positions = set()
+        for code in self.region_codes(f):
+            positions.update(self._by_region.get(code, ()))
+        positions.update(self._by_id[i] for i in include_ids if i in self._by_id)
+        if categories:
+            allowed = set().union(*(self._by_category.get(c, ()) for c in categories))
+            positions &= allowed
+        return [self.catalog[p] for p in sorted(positions)]
+
+
+def build_index(subsidies_data: dict, regions_data: dict, previous: CatalogIndex | None = None) -> CatalogIndex:
+    """
+    subsidies.json と municipalities.json の内容から索引を作る
+    previous を渡すと、内容が変わっていない給付金はコンパイル済みのものを使い回す
+    """
+    subsidies = subsidies_data["subsidies"]
+    if previous is None:
+        catalog = compile_catalog(subsidies)
+    else:
+        compiled = {c.id: c for c in previous.catalog}
+        catalog = [compiled[s["id"]] if s["id"] in compiled and compiled[s["id"]].subsidy == s else compile_subsidy(s)
+                   for s in subsidies]
+    return CatalogIndex(catalog, RegionTable.from_dict(regions_data), subsidies_data.get("target_area", ""))
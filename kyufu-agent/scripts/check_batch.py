@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+給付金・補助金 一括資格チェックスクリプト
+多数のプロファイル（JSONL / CSV）を給付金カタログと照合し、結果を JSONL で出力します
+
+使い方:
+  python3 scripts/check_batch.py profiles.jsonl -o results.jsonl
+  python3 scripts/check_batch.py residents.csv -o results.jsonl --workers 8
+  python3 scripts/check_batch.py profiles.jsonl --upcoming 2 > notices.jsonl
+  cat profiles.jsonl | python3 scripts/check_batch.py - > results.jsonl
+
+入力:
+  JSONL  1行に1つ、user_profile.json と同じ形式のプロファイル
+  CSV    列名はドット区切りのパス（personal.birth_date, address.prefecture,
+         address.city など）。family.children.birth_date 列には子供の生年月日を
+         ";" 区切りで入れる。applied_subsidies.completed / in_progress も ";" 区切り
+  プロファイルの "id"（なければ入力の行番号）が結果の id になります。
+
+出力（1行に1プロファイル）:
+  {"id", "eligible": [給付金ID], "auto": [...], "manual": [...],
+   "total_amount", "auto_amount", "not_eligible": {給付金ID: [理由]}, "applied": [...]}
+  --upcoming N を付けると "upcoming": [{"date", "id", "eligible"}] に
+  今後 N 年間に資格が変わる日（対象になる / 対象外になる）が入ります（申請済みは除く）。
+  読めなかった行は {"id", "error"} になります。
+  --verify-index を付けると、地域インデックスを使わずにカタログ全体も判定し、
+  申請可能・申請済みの結果が食い違った行を {"id", "error"} にします（インデックスの検証用）。
+
+カタログは各ワーカープロセスで一度だけ読み込み・コンパイルし、地域インデックスで
+住所に当てはまりうる給付金だけを判定します（not_eligible もその範囲）。入力は
+ストリームとして読み、処理中の行数を WINDOW 件までに抑えるので、
+入力がどれだけ大きくてもメモリ使用量は一定です。
+"""
+
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+from catalog import build_index
+from check_subsidies import MUNICIPALITIES_FILE, SUBSIDIES_FILE, load_json, screen_profile
+from eligibility import profile_features
+from incremental import applied_status
+from timeline import eligibility_timeline
+
+CHUNK_SIZE = 64          # ワーカーへ一度に渡す行数
+WINDOW = CHUNK_SIZE * 64  # 読み込み済み・未出力の行数の上限（ワーカー数倍）
+LIST_SEPARATOR = ";"     # CSV の複数値セル
+
+# ワーカーごとの状態（initializer で設定）
+_index = None
+_today = None
+_categories = None
+_upcoming = None
+_verify_index = False
+
+
+def _init_worker(subsidies_file: str, today: date, categories: list[str] | None = None, upcoming: int | None = None,
+                 verify_index: bool = False):
+    global _index, _today, _categories, _upcoming, _verify_index
+    _index = build_index(load_json(Path(subsidies_file)), load_json(MUNICIPALITIES_FILE))
+    _today = today
+    _categories = categories
+    _upcoming = upcoming
+    _verify_index = verify_index
+
+
+def index_mismatches(candidates: list, profile: dict, features) -> list[str]:
+    """インデックスの候補とカタログ全体とで、申請可能・申請済みの判定が異なる給付金ID"""
+    catalog = [c for c in _index.catalog if not _categories or c.subsidy.get("category") in _categories]
+    indexed = screen_profile(candidates, profile, features)
+    full = screen_profile(catalog, profile, features)
+    mismatches = set()
+    for group in (0, 1, 3):  # 自動申請可能, 手動申請が必要, 申請済み
+        mismatches |= {s["id"] for s, _ in indexed[group]} ^ {s["id"] for s, _ in full[group]}
+    return sorted(mismatches)
+
+
+def csv_profile(row: dict) -> dict:
+    """ドット区切りの列名を持つ CSV の行をプロファイルの dict に戻す"""
+    profile = {}
+    for key, value in row.items():
+        if not key or value in (None, ""):
+            continue
+        if key == "family.children.birth_date":
+            births = [b.strip() for b in value.split(LIST_SEPARATOR) if b.strip()]
+            profile.setdefault("family", {})["children"] = [{"birth_date": b} for b in births]
+            continue
+        if key.startswith("applied_subsidies."):
+            value = [v.strip() for v in value.split(LIST_SEPARATOR) if v.strip()]
+        elif key == "employment.annual_income":
+            value = int(value)
+        node = profile
+        *parents, leaf = key.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = value
+    return profile
+
+
+def evaluate(item: tuple[int, str, object]) -> tuple[str, bool]:
+    """(行番号, 形式, 行) → (結果の JSON 文字列, 成功したか)（ワーカーで実行）"""
+    line_no, fmt, raw = item
+    profile_id = line_no
+    try:
+        profile = json.loads(raw) if fmt == "jsonl" else csv_profile(raw)
+        profile_id = profile.get("id", line_no)
+        features = profile_features(profile, _today)
+        applied_ids = applied_status(profile)
+        candidates = _index.candidates(features, _categories, applied_ids)
+        auto, manual, not_eligible, applied = screen_profile(candidates, profile, features)
+        mismatches = index_mismatches(candidates, profile, features) if _verify_index else []
+    except (ValueError, TypeError, AttributeError, KeyError) as e:
+        return json.dumps({"id": profile_id, "error": f"{type(e).__name__}: {e}"}, ensure_ascii=False), False
+    if mismatches:
+        return json.dumps({"id": profile_id, "error": f"IndexMismatch: {', '.join(mismatches)}"},
+                          ensure_ascii=False), False
+    auto_amount = sum(s.get("amount", 0) for s, _ in auto)
+    result = {
+        "id": profile_id,
+        "eligible": [s["id"] for s, _ in auto + manual],
+        "auto": [s["id"] for s, _ in auto],
+        "manual": [s["id"] for s, _ in manual],
+        "total_amount": auto_amount + sum(s.get("amount", 0) for s, _ in manual),
+        "auto_amount": auto_amount,
+        "not_eligible": {s["id"]: reasons for s, reasons in not_eligible},
+        "applied": [s["id"] for s, _ in applied],
+    }
+    if _upcoming:
+        timeline = eligibility_timeline([c for c in candidates if c.id not in applied_ids], features, _upcoming)
+        result["upcoming"] = [{"date": flip.date.isoformat(), "id": flip.subsidy["id"], "eligible": flip.eligible}
+                              for flip in timeline.flips]
+    return json.dumps(result, ensure_ascii=False), True
+
+
+def read_items(stream, fmt: str):
+    """入力を (行番号, 形式, 行) として1件ずつ返す（空行は飛ばす）"""
+    if fmt == "csv":
+        for line_no, row in enumerate(csv.DictReader(stream), 1):
+            yield line_no, fmt, row
+        return
+    for line_no, line in enumerate(stream, 1):
+        if line.strip():
+            yield line_no, fmt, line
+
+
+def bounded(items, slots: threading.Semaphore):
+    """slots が空くまで次の行を読まない（Pool の先読みでメモリが増えないように）"""
+    for item in items:
+        slots.acquire()
+        yield item
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="給付金 一括資格チェック")
+    parser.add_argument("input", help="プロファイルの JSONL / CSV（- で標準入力）")
+    parser.add_argument("-o", "--output", help="結果の JSONL（省略時は標準出力）")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="入力形式（省略時は拡張子で判定）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="ワーカープロセス数")
+    parser.add_argument("--subsidies", default=str(SUBSIDIES_FILE), help="給付金カタログ")
+    parser.add_argument("--date", type=date.fromisoformat, default=date.today(), help="判定日 (YYYY-MM-DD)")
+    parser.add_argument("--category", action="append", help="判定するカテゴリ（複数指定可、省略時はすべて）")
+    parser.add_argument("--upcoming", type=int, metavar="YEARS", help="今後 YEARS 年間に資格が変わる日も出力する")
+    parser.add_argument("--verify-index", action="store_true", help="地域インデックスとカタログ全体の判定結果を照合する")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    if args.input == "-":
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="" if fmt == "csv" else None)
+    else:
+        stream = open(args.input, "r", encoding="utf-8", newline="" if fmt == "csv" else None)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+
+    started = time.perf_counter()
+    count = 0
+    errors = 0
+    slots = threading.Semaphore(WINDOW)
+    items = bounded(read_items(stream, fmt), slots)
+
+    def write(results):
+        nonlocal count, errors
+        for line, ok in results:
+            out.write(line + "\n")
+            slots.release()
+            count += 1
+            errors += not ok
+
+    try:
+        if args.workers > 1:
+            with multiprocessing.Pool(args.workers, initializer=_init_worker,
+                                      initargs=(args.subsidies, args.date, args.category, args.upcoming,
+                                                args.verify_index)) as pool:
+                write(pool.imap(evaluate, items, chunksize=CHUNK_SIZE))
+        else:
+            _init_worker(args.subsidies, args.date, args.category, args.upcoming, args.verify_index)
+            write(map(evaluate, items))
+    except BrokenPipeError:
+        # head などで出力先が先に閉じられた
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    finally:
+        stream.close()
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ {count}件を判定しました（エラー {errors}件, {elapsed:.1f}秒, {count / elapsed if elapsed else 0:,.0f}件/秒, "
+          f"ワーカー {args.workers}）", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
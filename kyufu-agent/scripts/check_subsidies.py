@@ -6,14 +6,24 @@
 
 import json
 import os
-from datetime import datetime, date
+from datetime import date
 from pathlib import Path
 
+from catalog import build_index
+from eligibility import (
+    CompiledSubsidy, ProfileFeatures, age_on, compile_subsidy, parse_date, profile_features,
+)
+from incremental import (
+    EligibilityState, ResultCache, applied_status, cache_key, catalog_version, classify, group_results,
+)
+
 # パス設定
 BASE_DIR = Path(__file__).parent.parent
 CONFIG_DIR = BASE_DIR / "config"
 SUBSIDIES_FILE = CONFIG_DIR / "subsidies.json"
 USER_PROFILE_FILE = CONFIG_DIR / "user_profile.json"
+MUNICIPALITIES_FILE = CONFIG_DIR / "municipalities.json"
+CACHE_FILE = BASE_DIR / ".cache" / "eligibility.json"
 
 
 def load_json(filepath: Path) -> dict:
@@ -22,98 +32,29 @@ def load_json(filepath: Path) -> dict:
         return json.load(f)
 
 
-def calculate_age(birth_date_str: str) -> int:
+def calculate_age(birth_date_str: str, today: date | None = None) -> int:
     """生年月日から年齢を計算"""
-    birth_date = datetime.strptime(birth_date_str, "%Y-%m-%d").date()
-    today = date.today()
-    age = today.year - birth_date.year
-    if (today.month, today.day) < (birth_date.month, birth_date.day):
-        age -= 1
-    return age
+    return age_on(parse_date(birth_date_str), today or date.today())
 
 
-def check_eligibility(subsidy: dict, profile: dict) -> tuple[bool, list[str]]:
+def check_eligibility(subsidy: dict, profile: dict, features: ProfileFeatures | None = None) -> tuple[bool, list[str]]:
     """
     給付金の申請資格を確認する
+    要件は eligibility.compile_requirement() でコンパイル済みのものを使う
+    （複数の給付金を判定する場合は features を一度だけ作って渡す）
     Returns: (eligible: bool, reasons: list[str])
     """
-    eligible = True
-    reasons = []
-    requirements = subsidy.get("requirements", [])
-    
-    for req in requirements:
-        if "東京都在住" in req:
-            if profile.get("address", {}).get("prefecture") != "東京都":
-                eligible = False
-                reasons.append("東京都在住が条件です")
-        
-        elif "渋谷区在住" in req:
-            if profile.get("address", {}).get("city") != "渋谷区":
-                eligible = False
-                reasons.append("渋谷区在住が条件です（他の区市町村でも類似制度がある場合があります）")
-        
-        elif "0〜18歳の子供がいる" in req:
-            children = profile.get("family", {}).get("children", [])
-            has_eligible_child = False
-            for child in children:
-                age = calculate_age(child.get("birth_date", "2000-01-01"))
-                if 0 <= age <= 18:
-                    has_eligible_child = True
-                    break
-            if not has_eligible_child:
-                eligible = False
-                reasons.append("0〜18歳の子供がいることが条件です")
-        
-        elif "妊娠届または出生届を提出済み" in req:
-            children = profile.get("family", {}).get("children", [])
-            if not children:
-                eligible = False
-                reasons.append("妊娠中または出産後の方が対象です")
-        
-        elif "65歳以上" in req:
-            age = calculate_age(profile.get("personal", {}).get("birth_date", "2000-01-01"))
-            if age < 65:
-                eligible = False
-                reasons.append("65歳以上が条件です")
-        
-        elif "東京23区在住または通勤" in req:
-            city = profile.get("address", {}).get("city", "")
-            # 23区の判定（簡易版）
-            tokyo_23_wards = [
-                "千代田区", "中央区", "港区", "新宿区", "文京区", "台東区",
-                "墨田区", "江東区", "品川区", "目黒区", "大田区", "世田谷区",
-                "渋谷区", "中野区", "杉並区", "豊島区", "北区", "荒川区",
-                "板橋区", "練馬区", "足立区", "葛飾区", "江戸川区"
-            ]
-            if city not in tokyo_23_wards:
-                eligible = False
-                reasons.append("東京23区在住または通勤が条件です（地方移住支援金）")
-        
-        elif "高校生がいる" in req:
-            children = profile.get("family", {}).get("children", [])
-            has_high_schooler = False
-            for child in children:
-                age = calculate_age(child.get("birth_date", "2000-01-01"))
-                if 15 <= age <= 18:
-                    has_high_schooler = True
-                    break
-            if not has_high_schooler:
-                eligible = False
-                reasons.append("高校生（15〜18歳）の子供がいることが条件です")
-        
-        elif "中学校修了前の子供がいる" in req:
-            children = profile.get("family", {}).get("children", [])
-            has_eligible_child = False
-            for child in children:
-                age = calculate_age(child.get("birth_date", "2000-01-01"))
-                if age <= 15:
-                    has_eligible_child = True
-                    break
-            if not has_eligible_child:
-                eligible = False
-                reasons.append("中学校修了前（15歳以下）の子供がいることが条件です")
-    
-    return eligible, reasons
+    return compile_subsidy(subsidy).evaluate(features or profile_features(profile))
+
+
+def screen_profile(catalog: list[CompiledSubsidy], profile: dict, features: ProfileFeatures) -> tuple[list, list, list, list]:
+    """
+    コンパイル済みの給付金（通常は CatalogIndex.candidates() の結果）についてプロファイルの資格を判定する
+    Returns: (自動申請可能, 手動申請が必要, 対象外, 申請済み) それぞれ (subsidy, reasons) のリスト
+    """
+    applied = applied_status(profile)
+    results = {compiled.id: classify(compiled, features, applied) for compiled in catalog}
+    return group_results([compiled.subsidy for compiled in catalog], results)
 
 
 def format_amount(subsidy: dict) -> str:
@@ -173,39 +114,20 @@ def main():
     
     # データ読み込み
     subsidies_data = load_json(SUBSIDIES_FILE)
+    regions_data = load_json(MUNICIPALITIES_FILE)
     profile = load_json(USER_PROFILE_FILE)
     
-    # 申請済みリスト
-    applied = profile.get("applied_subsidies", {}).get("completed", [])
-    in_progress = profile.get("applied_subsidies", {}).get("in_progress", [])
-    
-    # 資格チェック
-    eligible_auto = []      # 自動申請可能
-    eligible_manual = []    # 手動申請が必要
-    not_eligible = []       # 対象外
-    already_applied = []    # 申請済み
-    
-    for subsidy in subsidies_data["subsidies"]:
-        subsidy_id = subsidy["id"]
-        
-        # 申請済みチェック
-        if subsidy_id in applied:
-            already_applied.append((subsidy, ["申請済み"]))
-            continue
-        if subsidy_id in in_progress:
-            already_applied.append((subsidy, ["申請中"]))
-            continue
-        
-        # 資格チェック
-        eligible, reasons = check_eligibility(subsidy, profile)
-        
-        if eligible:
-            if subsidy.get("auto_apply_possible"):
-                eligible_auto.append((subsidy, []))
-            else:
-                eligible_manual.append((subsidy, [subsidy.get("reason_not_auto", "手動申請が必要")]))
-        else:
-            not_eligible.append((subsidy, reasons))
+    # 資格チェック（同じプロファイル・カタログ・日付の結果はキャッシュから。
+    # なければ要件をコンパイルし、住所に当てはまる給付金だけを判定する）
+    cache = ResultCache(CACHE_FILE)
+    key = cache_key(profile, catalog_version(subsidies_data, regions_data), date.today())
+    results = cache.get(key)
+    if results is None:
+        results = EligibilityState(build_index(subsidies_data, regions_data), profile).results
+        cache.put(key, results)
+    eligible_auto, eligible_manual, not_eligible, already_applied = group_results(
+        subsidies_data["subsidies"], results)
+    skipped = len(subsidies_data["subsidies"]) - len(results)
     
     # 結果表示
     name = profile.get("personal", {}).get("last_name", "") + profile.get("personal", {}).get("first_name", "")
@@ -230,6 +152,9 @@ def main():
         for subsidy, reasons in not_eligible:
             print(f"  • {subsidy['name']}: {', '.join(reasons)}")
     
+    if skipped:
+        print(f"\n  （お住まいの地域以外の給付金 {skipped}件は省略しました）")
+    
     if already_applied:
         print(f"\n{'='*60}")
         print(f"  📋 申請済み・申請中の給付金 ({len(already_applied)}件)")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+給付金・補助金 資格カレンダー
+ユーザープロファイルの誕生日（本人・子供）と給付金の締切から、
+今後 N 年間に申請資格が変わる日を表示します
+
+使い方:
+  python3 scripts/check_timeline.py
+  python3 scripts/check_timeline.py --years 10
+"""
+
+import sys
+from datetime import date, timedelta
+
+from catalog import build_index
+from check_subsidies import (
+    MUNICIPALITIES_FILE, SUBSIDIES_FILE, USER_PROFILE_FILE, format_amount, load_json,
+)
+from eligibility import profile_features
+from incremental import applied_status
+from timeline import eligibility_timeline
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="給付金 資格カレンダー")
+    parser.add_argument("--years", type=int, default=5, help="何年先まで表示するか")
+    parser.add_argument("--date", type=date.fromisoformat, default=date.today(), help="開始日 (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    if not USER_PROFILE_FILE.exists():
+        print(f"❌ エラー: {USER_PROFILE_FILE} が見つかりません")
+        sys.exit(1)
+
+    index = build_index(load_json(SUBSIDIES_FILE), load_json(MUNICIPALITIES_FILE))
+    profile = load_json(USER_PROFILE_FILE)
+    features = profile_features(profile, args.date)
+    applied = applied_status(profile)
+    candidates = [c for c in index.candidates(features) if c.id not in applied]
+    timeline = eligibility_timeline(candidates, features, args.years)
+
+    print(f"\n📅 給付金 資格カレンダー（{timeline.start} 〜 {timeline.end}）")
+    print(f"\n{'='*60}")
+    print(f"  現在申請可能 ({len(timeline.initially_eligible)}件)")
+    print(f"{'='*60}")
+    for subsidy in timeline.initially_eligible:
+        print(f"  • {subsidy['name']} ({format_amount(subsidy)})")
+
+    print(f"\n{'='*60}")
+    print(f"  今後の変化 ({len(timeline.flips)}件)")
+    print(f"{'='*60}")
+    if not timeline.flips:
+        print("  期間中に資格が変わる給付金はありません")
+    for flip in timeline.flips:
+        mark = "🆕 対象になる" if flip.eligible else "❌ 対象外になる"
+        print(f"  {flip.date}  {mark}: {flip.subsidy['name']}")
+
+    periods = timeline.periods()
+    if periods:
+        print(f"\n{'='*60}")
+        print("  給付金ごとの対象期間")
+        print(f"{'='*60}")
+        for compiled in candidates:
+            for start, end in periods.get(compiled.id, []):
+                until = "" if end == timeline.end else str(end - timedelta(days=1))
+                print(f"  • {compiled.subsidy['name']}: {start} 〜 {until}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
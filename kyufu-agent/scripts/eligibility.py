@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+給付金の申請資格ルールエンジン
+
+subsidies.json の requirements（「東京都在住」「65歳以上」など）を、
+部分文字列の if/elif で毎回判定する代わりに、型付きの述語（Rule）へ
+一度だけコンパイルします。
+
+  compile_requirement()  要件文字列 → Rule（同じ文字列は一度だけ解析）
+  compile_subsidy()      給付金 → CompiledSubsidy（Rule のタプル）
+  profile_features()     プロファイル → ProfileFeatures（年齢・住所などを一度だけ計算）
+  CompiledSubsidy.evaluate(features) → (eligible, reasons)
+
+新しい要件の種類は REQUIREMENT_PATTERNS に (正規表現, 生成関数) を
+追加するだけで対応できます。どのパターンにも一致しない要件
+（「事業協力店での購入」など）は自動判定できないため常に満たすものとして扱います。
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import lru_cache
+
+DEFAULT_BIRTH_DATE = "2000-01-01"  # 生年月日が未入力の場合の仮の値
+
+# 東京23区
+TOKYO_23_WARDS = frozenset({
+    "千代田区", "中央区", "港区", "新宿区", "文京区", "台東区",
+    "墨田区", "江東区", "品川区", "目黒区", "大田区", "世田谷区",
+    "渋谷区", "中野区", "杉並区", "豊島区", "北区", "荒川区",
+    "板橋区", "練馬区", "足立区", "葛飾区", "江戸川区",
+})
+
+
+def parse_date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def age_on(birth: date, today: date) -> int:
+    """today 時点の満年齢"""
+    age = today.year - birth.year
+    if (today.month, today.day) < (birth.month, birth.day):
+        age -= 1
+    return age
+
+
+# ============================================================
+# プロファイルの特徴量
+# ============================================================
+
+@dataclass(frozen=True)
+class ProfileFeatures:
+    """判定に使うプロファイルの値（1回の実行で一度だけ計算）"""
+    today: date
+    prefecture: str
+    city: str
+    birth_date: date
+    age: int
+    child_birth_dates: tuple[date, ...]
+    child_ages: tuple[int, ...]
+    annual_income: int | None
+
+
+def profile_features(profile: dict, today: date | None = None) -> ProfileFeatures:
+    """プロファイルから ProfileFeatures を作る"""
+    today = today or date.today()
+    address = profile.get("address", {})
+    birth = parse_date(profile.get("personal", {}).get("birth_date") or DEFAULT_BIRTH_DATE)
+    children = profile.get("family", {}).get("children", [])
+    child_births = tuple(parse_date(child.get("birth_date", DEFAULT_BIRTH_DATE)) for child in children)
+    return ProfileFeatures(
+        today=today,
+        prefecture=address.get("prefecture", ""),
+        city=address.get("city", ""),
+        birth_date=birth,
+        age=age_on(birth, today),
+        child_birth_dates=child_births,
+        child_ages=tuple(age_on(b, today) for b in child_births),
+        annual_income=profile.get("employment", {}).get("annual_income"),
+    )
+
+
+# ============================================================
+# 述語（Rule）
+# ============================================================
+
+@dataclass(frozen=True)
+class Rule:
+    """1つの要件。check() が False なら reason が対象外の理由になる"""
+    reason: str
+
+    # check() が参照する ProfileFeatures の項目（差分再判定で使う）
+    depends_on = ()
+
+    def check(self, f: ProfileFeatures) -> bool:
+        raise NotImplementedError
+
+
+@dataclass(frozen=True)
+class PrefectureRule(Rule):
+    prefecture: str
+    depends_on = ("prefecture",)
+
+    def check(self, f):
+        return f.prefecture == self.prefecture
+
+
+@dataclass(frozen=True)
+class CityRule(Rule):
+    cities: frozenset
+    depends_on = ("city",)
+
+    def check(self, f):
+        return f.city in self.cities
+
+
+@dataclass(frozen=True)
+class ApplicantAgeRule(Rule):
+    min_age: int | None = None
+    max_age: int | None = None
+    depends_on = ("age",)
+
+    def check(self, f):
+        return (self.min_age is None or f.age >= self.min_age) and (self.max_age is None or f.age <= self.max_age)
+
+
+@dataclass(frozen=True)
+class ChildAgeRule(Rule):
+    """min_age〜max_age 歳の子供が1人以上いる"""
+    min_age: int | None = None
+    max_age: int | None = None
+    depends_on = ("child_ages",)
+
+    def check(self, f):
+        return any((self.min_age is None or age >= self.min_age) and (self.max_age is None or age <= self.max_age)
+                   for age in f.child_ages)
+
+
+@dataclass(frozen=True)
+class HasChildrenRule(Rule):
+    depends_on = ("child_birth_dates",)
+
+    def check(self, f):
+        return bool(f.child_birth_dates)
+
+
+@dataclass(frozen=True)
+class ManualRule(Rule):
+    """自動判定できない要件（申請時に本人が確認する）"""
+
+    def check(self, f):
+        return True
+
+
+# ============================================================
+# 要件文字列のコンパイル
+# ============================================================
+
+def _prefecture(m):
+    return PrefectureRule(f"{m[1]}在住が条件です", m[1])
+
+
+def _city(m):
+    return CityRule(f"{m[1]}在住が条件です（他の区市町村でも類似制度がある場合があります）", frozenset({m[1]}))
+
+
+def _tokyo_23(m):
+    return CityRule("東京23区在住または通勤が条件です（地方移住支援金）", TOKYO_23_WARDS)
+
+
+def _children_between(m):
+    low, high = int(m[1]), int(m[2])
+    return ChildAgeRule(f"{low}〜{high}歳の子供がいることが条件です", low, high)
+
+
+def _high_schooler(m):
+    return ChildAgeRule("高校生（15〜18歳）の子供がいることが条件です", 15, 18)
+
+
+def _before_junior_high_end(m):
+    return ChildAgeRule("中学校修了前（15歳以下）の子供がいることが条件です", None, 15)
+
+
+def _pregnancy_or_birth(m):
+    return HasChildrenRule("妊娠中または出産後の方が対象です")
+
+
+def _applicant_min_age(m):
+    return ApplicantAgeRule(f"{m[1]}歳以上が条件です", int(m[1]))
+
+
+# (正規表現, 生成関数) を上から順に試す。search() で最初に一致したものを使う
+REQUIREMENT_PATTERNS = [
+    (re.compile(r"^(\S+?[都道府県])在住"), _prefecture),
+    (re.compile(r"^東京23区在住"), _tokyo_23),
+    (re.compile(r"^(\S+?[区市町村])在住"), _city),
+    (re.compile(r"(\d+)〜(\d+)歳の子供がいる"), _children_between),
+    (re.compile(r"妊娠届または出生届を提出済み"), _pregnancy_or_birth),
+    (re.compile(r"(\d+)歳以上"), _applicant_min_age),
+    (re.compile(r"高校生がいる"), _high_schooler),
+    (re.compile(r"中学校修了前の子供がいる"), _before_junior_high_end),
+]
+
+
+@lru_cache(maxsize=None)
+def compile_requirement(text: str) -> Rule:
+    """要件文字列を Rule に変換する（同じ文字列は一度だけ解析）"""
+    for pattern, build in REQUIREMENT_PATTERNS:
+        m = pattern.search(text)
+        if m:
+            return build(m)
+    return ManualRule(text)
+
+
+@dataclass(frozen=True)
+class CompiledSubsidy:
+    subsidy: dict
+    rules: tuple[Rule, ...]
+
+    @property
+    def id(self) -> str:
+        return self.subsidy["id"]
+
+    @property
+    def depends_on(self) -> frozenset[str]:
+        """判定結果が依存する ProfileFeatures の項目"""
+        return frozenset(name for rule in self.rules for name in rule.depends_on)
+
+    def evaluate(self, f: ProfileFeatures) -> tuple[bool, list[str]]:
+        """(eligible, 対象外の理由)"""
+        reasons = [rule.reason for rule in self.rules if not rule.check(f)]
+        return not reasons, reasons
+
+
+def compile_subsidy(subsidy: dict) -> CompiledSubsidy:
+    rules = tuple(compile_requirement(req) for req in subsidy.get("requirements", []))
+    # 自動判定できない要件は評価しない
+    return CompiledSubsidy(subsidy, tuple(rule for rule in rules if not isinstance(rule, ManualRule)))
+
+
+def compile_catalog(subsidies: list[dict]) -> list[CompiledSubsidy]:
+    return [compile_subsidy(subsidy) for subsidy in subsidies]
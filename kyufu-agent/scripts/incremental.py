@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+給付金の差分再判定と判定結果キャッシュ
+
+  classify()         給付金1件の判定 → (状態, 理由)
+  EligibilityState   コンパイル済みカタログと判定結果をメモリに保持し、
+                     プロファイルやカタログが変わったら影響のある給付金だけ再判定する
+  ResultCache        判定結果をファイルに保存（プロファイルのハッシュ・カタログの版・日付がキー）
+
+どの給付金を再判定するかは次で決まります。
+  - 変わった ProfileFeatures の項目に依存する Rule を持つ給付金（CompiledSubsidy.depends_on）
+  - 申請済み・申請中になった／外れた給付金
+  - 住所や申請状況の変更で地域インデックスの候補に入った／外れた給付金
+  - subsidies.json で追加・変更・削除された給付金
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field, fields
+from datetime import date
+from pathlib import Path
+
+from catalog import CatalogIndex
+from eligibility import CompiledSubsidy, ProfileFeatures, profile_features
+
+# 判定結果の状態
+AUTO = "auto"                  # 自動申請可能
+MANUAL = "manual"              # 手動申請が必要
+NOT_ELIGIBLE = "not_eligible"  # 対象外
+APPLIED = "applied"            # 申請済み・申請中
+ELIGIBLE = (AUTO, MANUAL)
+
+CACHE_MAX_ENTRIES = 32  # キャッシュに残す判定結果の数
+
+
+def applied_status(profile: dict) -> dict[str, str]:
+    """申請済み・申請中の給付金ID → "申請済み" / "申請中" """
+    applied = profile.get("applied_subsidies", {})
+    status = {subsidy_id: "申請中" for subsidy_id in applied.get("in_progress", [])}
+    status.update((subsidy_id, "申請済み") for subsidy_id in applied.get("completed", []))
+    return status
+
+
+def classify(compiled: CompiledSubsidy, features: ProfileFeatures, applied: dict[str, str]) -> tuple[str, list[str]]:
+    """給付金1件を判定する → (AUTO / MANUAL / NOT_ELIGIBLE / APPLIED, 理由)"""
+    subsidy = compiled.subsidy
+    if compiled.id in applied:
+        return APPLIED, [applied[compiled.id]]
+    eligible, reasons = compiled.evaluate(features)
+    if not eligible:
+        return NOT_ELIGIBLE, reasons
+    if subsidy.get("auto_apply_possible"):
+        return AUTO, []
+    return MANUAL, [subsidy.get("reason_not_auto", "手動申請が必要")]
+
+
+def group_results(subsidies: list[dict], results: dict) -> tuple[list, list, list, list]:
+    """
+    {給付金ID: (状態, 理由)} をカタログ順に状態別に分ける
+    Returns: (自動申請可能, 手動申請が必要, 対象外, 申請済み) それぞれ (subsidy, reasons) のリスト
+    """
+    groups = {AUTO: [], MANUAL: [], NOT_ELIGIBLE: [], APPLIED: []}
+    for subsidy in subsidies:
+        result = results.get(subsidy["id"])
+        if result is not None:
+            status, reasons = result
+            groups[status].append((subsidy, list(reasons)))
+    return groups[AUTO], groups[MANUAL], groups[NOT_ELIGIBLE], groups[APPLIED]
+
+
+def changed_fields(old: ProfileFeatures, new: ProfileFeatures) -> set[str]:
+    """値が変わった ProfileFeatures の項目名"""
+    return {f.name for f in fields(ProfileFeatures) if getattr(old, f.name) != getattr(new, f.name)}
+
+
+# ============================================================
+# 差分再判定
+# ============================================================
+
+@dataclass
+class Delta:
+    """再判定で変わった給付金（それぞれ (subsidy, reasons) のリスト）"""
+    evaluated: int = 0
+    newly_eligible: list = field(default_factory=list)
+    no_longer_eligible: list = field(default_factory=list)
+    applied: list = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.newly_eligible or self.no_longer_eligible or self.applied)
+
+    def record(self, subsidy: dict, old: tuple | None, new: tuple):
+        old_status = old[0] if old else None
+        new_status, reasons = new
+        if new_status in ELIGIBLE and old_status not in ELIGIBLE:
+            self.newly_eligible.append((subsidy, reasons))
+        elif new_status == APPLIED and old_status != APPLIED:
+            self.applied.append((subsidy, reasons))
+        elif old_status in ELIGIBLE and new_status not in ELIGIBLE:
+            self.no_longer_eligible.append((subsidy, reasons))
+
+
+class EligibilityState:
+    """1人分のプロファイルについて、カタログ全体の判定結果を保持する"""
+
+    def __init__(self, index: CatalogIndex, profile: dict, today: date | None = None, results: dict | None = None):
+        self.index = index
+        self.profile = profile
+        self.features = profile_features(profile, today)
+        self.applied = applied_status(profile)
+        self._compiled = {c.id: c for c in index.catalog}
+        self._order = {c.id: position for position, c in enumerate(index.catalog)}
+        self.candidates = self._candidates()
+        if results is None:
+            results = {subsidy_id: classify(c, self.features, self.applied) for subsidy_id, c in self.candidates.items()}
+        # {給付金ID: (状態, 理由)}。地域インデックスの候補外の給付金は含まない
+        self.results = results
+
+    def _candidates(self) -> dict[str, CompiledSubsidy]:
+        return {c.id: c for c in self.index.candidates(self.features, include_ids=self.applied)}
+
+    def update_profile(self, profile: dict, today: date | None = None) -> Delta:
+        """プロファイル（または判定日）の変更を反映する"""
+        features = profile_features(profile, today)
+        applied = applied_status(profile)
+        changed = changed_fields(self.features, features)
+        applied_changed = {subsidy_id for subsidy_id in self.applied.keys() | applied.keys()
+                           if self.applied.get(subsidy_id) != applied.get(subsidy_id)}
+        affected = {subsidy_id for subsidy_id, c in self.candidates.items() if c.depends_on & changed}
+        affected |= applied_changed
+
+        self.profile, self.features, self.applied = profile, features, applied
+        if changed & {"prefecture", "city"} or applied_changed:
+            candidates = self._candidates()
+            affected |= self.candidates.keys() ^ candidates.keys()
+            self.candidates = candidates
+        return self._reevaluate(affected, self._compiled)
+
+    def update_catalog(self, index: CatalogIndex) -> Delta:
+        """
+        カタログの変更を反映する
+        index は build_index(..., previous=self.index) で作ると、変わっていない給付金が
+        同じ CompiledSubsidy になり、変わったものだけが再判定される
+        """
+        previous = self._compiled
+        self.index = index
+        self._compiled = {c.id: c for c in index.catalog}
+        self._order = {c.id: position for position, c in enumerate(index.catalog)}
+        affected = {subsidy_id for subsidy_id in previous.keys() | self._compiled.keys()
+                    if previous.get(subsidy_id) is not self._compiled.get(subsidy_id)}
+        candidates = self._candidates()
+        affected |= self.candidates.keys() ^ candidates.keys()
+        self.candidates = candidates
+        return self._reevaluate(affected, previous)
+
+    def _reevaluate(self, subsidy_ids: set[str], previous: dict[str, CompiledSubsidy]) -> Delta:
+        delta = Delta(evaluated=len(subsidy_ids))
+        for subsidy_id in sorted(subsidy_ids, key=lambda i: self._order.get(i, len(self._order))):
+            compiled = self.candidates.get(subsidy_id)
+            old = self.results.pop(subsidy_id, None)
+            new = classify(compiled, self.features, self.applied) if compiled else None
+            if new is not None:
+                self.results[subsidy_id] = new
+                delta.record(compiled.subsidy, old, new)
+            elif subsidy_id in self._compiled:
+                delta.record(self._compiled[subsidy_id].subsidy, old, (None, ["お住まいの地域は対象外です"]))
+            elif subsidy_id in previous:
+                delta.record(previous[subsidy_id].subsidy, old, (None, ["カタログから削除されました"]))
+        return delta
+
+    def grouped(self) -> tuple[list, list, list, list]:
+        return group_results([c.subsidy for c in self.index.catalog], self.results)
+
+
+# ============================================================
+# 判定結果キャッシュ
+# ============================================================
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def catalog_version(subsidies_data: dict, regions_data: dict) -> str:
+    """カタログの版（version の書き換え忘れに備えて内容のハッシュも付ける）"""
+    return f"{subsidies_data.get('version', '')}+{_digest([subsidies_data, regions_data])[:12]}"
+
+
+def cache_key(profile: dict, version: str, today: date) -> str:
+    """プロファイルのハッシュ・カタログの版・判定日（年齢は日付で変わる）"""
+    return f"{_digest(profile)[:16]}:{version}:{today.isoformat()}"
+
+
+class ResultCache:
+    """判定結果のファイルキャッシュ（新しいものから CACHE_MAX_ENTRIES 件）"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, key: str) -> dict | None:
+        return self.entries.get(key)
+
+    def put(self, key: str, results: dict):
+        self.entries.pop(key, None)
+        self.entries[key] = dict(results)
+        while len(self.entries) > CACHE_MAX_ENTRIES:
+            del self.entries[next(iter(self.entries))]
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # キャッシュに書けなくても判定には影響しない
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+給付金の資格タイムライン
+
+年齢の要件（「65歳以上」「0〜18歳の子供」「高校生」「中学校修了前」）と
+給付金の deadline（"YYYY-MM-DD" 形式のもの）から、資格が変わる日を正確に求めます。
+1日ずつ判定し直すのではなく、誕生日と締切日を「イベント点」として並べ、
+一度だけ走査して今後 N 年分の資格カレンダーを作ります。
+
+  eligibility_timeline(catalog, features, years) → Timeline
+  Timeline.flips       資格が変わる日（Flip）の一覧（日付順）
+  Timeline.periods()   給付金ごとの対象期間 [開始, 終了)
+
+年齢の要件（ApplicantAgeRule / ChildAgeRule）は年齢の範囲から期間を計算します。
+それ以外の要件（住所・子供の有無など）は期間中変わらないので、開始日に一度だけ判定します。
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from eligibility import ApplicantAgeRule, ChildAgeRule, CompiledSubsidy, ProfileFeatures
+
+DEADLINE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def birthday(birth: date, age: int) -> date:
+    """満 age 歳になる日（2月29日生まれは平年では3月1日。age_on() と同じ）"""
+    try:
+        return birth.replace(year=birth.year + age)
+    except ValueError:
+        return date(birth.year + age, 3, 1)
+
+
+def age_window(birth: date, min_age: int | None, max_age: int | None) -> tuple[date | None, date | None]:
+    """min_age 歳以上 max_age 歳以下である期間 [開始, 終了)（None は制限なし）"""
+    start = birthday(birth, min_age) if min_age is not None else None
+    end = birthday(birth, max_age + 1) if max_age is not None else None
+    return start, end
+
+
+def deadline_date(subsidy: dict) -> date | None:
+    """deadline が日付なら申請できる最終日（「継続受付中」などは None）"""
+    deadline = subsidy.get("deadline") or ""
+    if not DEADLINE_PATTERN.fullmatch(deadline):
+        return None
+    return date.fromisoformat(deadline)
+
+
+def subsidy_windows(compiled: CompiledSubsidy, f: ProfileFeatures) -> list[list[tuple]] | None:
+    """
+    給付金の時間で変わる条件ごとの期間 [開始, 終了) のリスト
+    条件はすべて満たす必要があり、1つの条件の中の期間はどれか1つでよい（子供が複数いる場合）。
+    時間で変わらない要件を満たさない場合は None
+    """
+    windows = []
+    for rule in compiled.rules:
+        if isinstance(rule, ApplicantAgeRule):
+            windows.append([age_window(f.birth_date, rule.min_age, rule.max_age)])
+        elif isinstance(rule, ChildAgeRule):
+            windows.append([age_window(birth, rule.min_age, rule.max_age) for birth in f.child_birth_dates])
+        elif not rule.check(f):
+            # 住所・子供の有無などは期間中変わらない
+            return None
+    deadline = deadline_date(compiled.subsidy)
+    if deadline is not None:
+        windows.append([(None, deadline + timedelta(days=1))])
+    return windows
+
+
+# ============================================================
+# タイムライン
+# ============================================================
+
+@dataclass(frozen=True)
+class Flip:
+    """資格が変わる日"""
+    date: date
+    subsidy: dict
+    eligible: bool  # True: この日から対象 / False: この日から対象外
+
+
+@dataclass
+class Timeline:
+    start: date
+    end: date                                      # この日の前日まで
+    initially_eligible: list[dict] = field(default_factory=list)
+    flips: list[Flip] = field(default_factory=list)
+
+    def periods(self) -> dict[str, list[tuple[date, date]]]:
+        """給付金ID → 対象期間 [開始, 終了) のリスト（期間の外は start / end で切る）"""
+        opened = {subsidy["id"]: self.start for subsidy in self.initially_eligible}
+        periods = {subsidy_id: [] for subsidy_id in opened}
+        for flip in self.flips:
+            subsidy_id = flip.subsidy["id"]
+            if flip.eligible:
+                opened[subsidy_id] = flip.date
+            else:
+                periods.setdefault(subsidy_id, []).append((opened.pop(subsidy_id), flip.date))
+        for subsidy_id, start in opened.items():
+            periods.setdefault(subsidy_id, []).append((start, self.end))
+        return periods
+
+
+def eligibility_timeline(catalog: list[CompiledSubsidy], f: ProfileFeatures, years: int = 5,
+                         start: date | None = None) -> Timeline:
+    """
+    start（省略時は f.today）から years 年分の資格カレンダー
+    すべての給付金の期間の端点をまとめて日付順に一度だけ走査する
+    """
+    start = start or f.today
+    end = birthday(start, years)
+    timeline = Timeline(start, end)
+
+    subsidies = []     # 走査する給付金
+    counts = []        # counts[i][j]: 給付金 i の条件 j を満たしている期間の数
+    unmet = []         # unmet[i]: 給付金 i の満たしていない条件の数
+    events = []        # (日付, 給付金, 条件, +1/-1)
+    for compiled in catalog:
+        windows = subsidy_windows(compiled, f)
+        if windows is None:
+            continue
+        i = len(subsidies)
+        subsidies.append(compiled.subsidy)
+        counts.append([0] * len(windows))
+        for j, spans in enumerate(windows):
+            for low, high in spans:
+                if (high is not None and high <= start) or (low is not None and low >= end):
+                    continue
+                if low is None or low <= start:
+                    counts[i][j] += 1
+                else:
+                    events.append((low, i, j, 1))
+                if high is not None and high < end:
+                    events.append((high, i, j, -1))
+        unmet.append(sum(1 for count in counts[i] if count == 0))
+        if unmet[i] == 0:
+            timeline.initially_eligible.append(compiled.subsidy)
+
+    events.sort()
+    position = 0
+    while position < len(events):
+        day = events[position][0]
+        touched = {}  # 給付金 → この日の処理前に対象だったか
+        while position < len(events) and events[position][0] == day:
+            _, i, j, step = events[position]
+            touched.setdefault(i, unmet[i] == 0)
+            counts[i][j] += step
+            position += 1
+        # 同じ日に始まって終わる期間などで、前後の状態が同じものは変化なし
+        for i in sorted(touched):
+            unmet[i] = sum(1 for count in counts[i] if count == 0)
+            eligible = unmet[i] == 0
+            if eligible != touched[i]:
+                timeline.flips.append(Flip(day, subsidies[i], eligible))
+    return timeline
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+給付金・補助金 資格チェック（監視モード）
+user_profile.json / subsidies.json / municipalities.json を監視し、変更があるたびに
+影響のある給付金だけを再判定して、変化（新たに申請可能・対象外になった）を表示します
+
+使い方:
+  python3 scripts/watch_subsidies.py
+  python3 scripts/watch_subsidies.py --interval 5
+
+コンパイル済みのカタログと判定結果はメモリに保持します（incremental.EligibilityState）。
+起動時は判定結果キャッシュ（.cache/eligibility.json）を使うので、同じ日に同じ
+プロファイル・カタログで起動し直した場合は再判定しません。
+日付が変わったときも年齢に依存する給付金だけを再判定します。
+"""
+
+import sys
+import time
+from datetime import date, datetime
+
+from catalog import build_index
+from check_subsidies import (
+    CACHE_FILE, MUNICIPALITIES_FILE, SUBSIDIES_FILE, USER_PROFILE_FILE, format_amount, load_json,
+)
+from incremental import Delta, EligibilityState, ResultCache, cache_key, catalog_version
+
+
+def mtime(path) -> float | None:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return None
+
+
+def print_summary(state: EligibilityState):
+    eligible_auto, eligible_manual, not_eligible, already_applied = state.grouped()
+    total = sum(s.get("amount", 0) for s, _ in eligible_auto + eligible_manual)
+    print(f"   自動申請可能: {len(eligible_auto)}件 / 手動申請必要: {len(eligible_manual)}件 / "
+          f"対象外: {len(not_eligible)}件 / 申請済み・申請中: {len(already_applied)}件 (合計最大 {total:,}円)")
+
+
+def print_delta(delta: Delta, reason: str, total: int):
+    stamp = datetime.now().strftime("%H:%M:%S")
+    print(f"\n[{stamp}] {reason}（再判定 {delta.evaluated}件 / 全 {total}件）")
+    if not delta:
+        print("   変化はありません")
+        return
+    for subsidy, reasons in delta.newly_eligible:
+        auto = "✅ 自動申請可" if subsidy.get("auto_apply_possible") else "⚠️  要手続き"
+        print(f"   🆕 新たに申請可能: {subsidy['name']} ({format_amount(subsidy)}) {auto} | ID: {subsidy['id']}")
+    for subsidy, reasons in delta.no_longer_eligible:
+        print(f"   ❌ 対象外になった: {subsidy['name']}: {', '.join(reasons)}")
+    for subsidy, reasons in delta.applied:
+        print(f"   📋 {reasons[0]}: {subsidy['name']}")
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="給付金 資格チェック（監視モード）")
+    parser.add_argument("--interval", type=float, default=1.0, help="ファイルを確認する間隔（秒）")
+    args = parser.parse_args()
+
+    if not USER_PROFILE_FILE.exists():
+        print(f"❌ エラー: {USER_PROFILE_FILE} が見つかりません")
+        sys.exit(1)
+
+    # 起動（同じプロファイル・カタログ・日付の判定結果はキャッシュから）
+    cache = ResultCache(CACHE_FILE)
+    subsidies_data = load_json(SUBSIDIES_FILE)
+    regions_data = load_json(MUNICIPALITIES_FILE)
+    profile = load_json(USER_PROFILE_FILE)
+    today = date.today()
+    version = catalog_version(subsidies_data, regions_data)
+    key = cache_key(profile, version, today)
+    state = EligibilityState(build_index(subsidies_data, regions_data), profile, today, results=cache.get(key))
+    cache.put(key, state.results)
+
+    print("\n🏛️  給付金・補助金 資格チェック（監視モード）")
+    print(f"   {USER_PROFILE_FILE.name} / {SUBSIDIES_FILE.name} の変更を監視しています（Ctrl+C で終了）")
+    print_summary(state)
+
+    watched = {path: mtime(path) for path in (USER_PROFILE_FILE, SUBSIDIES_FILE, MUNICIPALITIES_FILE)}
+    try:
+        while True:
+            time.sleep(args.interval)
+            changed = [path for path in watched if mtime(path) != watched[path]]
+            delta = None
+            try:
+                if SUBSIDIES_FILE in changed or MUNICIPALITIES_FILE in changed:
+                    subsidies_data = load_json(SUBSIDIES_FILE)
+                    regions_data = load_json(MUNICIPALITIES_FILE)
+                    version = catalog_version(subsidies_data, regions_data)
+                    delta = state.update_catalog(build_index(subsidies_data, regions_data, previous=state.index))
+                    print_delta(delta, "給付金カタログが変更されました", len(state.index))
+                if USER_PROFILE_FILE in changed or date.today() != today:
+                    reason = "プロファイルが変更されました" if USER_PROFILE_FILE in changed else "日付が変わりました"
+                    profile = load_json(USER_PROFILE_FILE)
+                    today = date.today()
+                    delta = state.update_profile(profile, today)
+                    print_delta(delta, reason, len(state.index))
+            except (OSError, ValueError, KeyError) as e:
+                # 保存途中のファイルなど。次に変更されたときに読み直す
+                print(f"\n⚠️  読み込みに失敗しました（前回の結果を保持します）: {e}")
+            for path in changed:
+                watched[path] = mtime(path)
+            if delta is not None:
+                print_summary(state)
+                cache.put(cache_key(profile, version, today), state.results)
+    except KeyboardInterrupt:
+        print("\n監視を終了しました")
+
+
+if __name__ == "__main__":
+    main()